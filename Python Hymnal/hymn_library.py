@@ -0,0 +1,1059 @@
+import bisect
+import ctypes
+import ctypes.util
+import hashlib
+import heapq
+import io
+import json
+import os
+import re
+import select
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zipfile
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+HYMN_EXTENSIONS = (".pps", ".ppsx", ".ppt", ".pptx")
+# python-pptx only reads the Open XML formats; .pps/.ppt hymns are searchable by title only
+LYRIC_EXTENSIONS = (".pptx", ".ppsx")
+INDEX_VERSION = 2
+
+# key is the lowercased file name searches match against; number is the
+# leading hymn number of the title, or None
+Hymn = namedtuple("Hymn", "title key number path size mtime")
+SlidePreview = namedtuple("SlidePreview", "path text image error")  # image: JPEG bytes or None
+
+_NUMBER = re.compile(r"\s*0*(\d+)")
+_TOKEN = re.compile(r"[a-z0-9]+")
+# "100", "#100", "hymn 100", "no. 100": jump straight to the hymn number
+_NUMBER_QUERY = re.compile(r"^\s*(?:(?:hymn|no|num|number)\.?\s*|#\s*)?0*(\d+)\s*$")
+
+# Directory mtimes this close to the scan may still change within the same
+# timestamp tick, so they are not trusted on the next start (FAT has 2 s ticks)
+RACY_WINDOW_NS = 2 * 10 ** 9
+
+
+def parse_title(file_name):
+    """Title (file name without extension) and leading hymn number"""
+    title = os.path.splitext(file_name)[0]
+    match = _NUMBER.match(title)
+    return title, int(match.group(1)) if match else None
+
+
+def make_hymn(path, size=0, mtime=0):
+    file_name = os.path.basename(path)
+    title, number = parse_title(file_name)
+    return Hymn(title, file_name.lower(), number, path, size, mtime)
+
+
+def default_cache_file(root, name="hymn_index", extension=".json"):
+    """Per-user cache location, outside the library so saving it never looks like a library change"""
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    digest = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(base, "SDA Hymnal", f"{name}_{digest}{extension}")
+
+
+def default_lyrics_file(root):
+    return default_cache_file(root, "hymn_lyrics", ".sqlite3")
+
+
+def default_previews_file(root):
+    return default_cache_file(root, "slide_previews", ".sqlite3")
+
+
+def _trigrams(word):
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 as soon as it is known to exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class HymnSearchIndex:
+    """Ranked title search: hymn numbers first, then whole words, prefixes and near-misses
+
+    Matching is done per word against the title vocabulary, so a typo is
+    resolved once against a few thousand distinct words rather than against
+    every title, and the postings of the matched words are then scored.
+    """
+    NUMBER = 2.0
+    NUMBER_PREFIX = 1.5  # a number still being typed: "10" lists 100-109, 1000...
+    EXACT = 1.0
+    PREFIX = 0.75   # plus up to 0.2 for how much of the word was typed
+    FUZZY = 0.7     # minus 0.15 per edit
+    MIN_SCORE = 0.3
+    STARTS_WITH_BONUS = 0.35
+    PHRASE_BONUS = 0.2
+
+    def __init__(self, hymns):
+        self.hymns = list(hymns)
+        self.by_number = {}
+        self.postings = {}
+        self.phrases = []
+        self.tiebreak = []
+        for index, hymn in enumerate(self.hymns):
+            words = _TOKEN.findall(hymn.title.lower().replace("'", "").replace("\u2019", ""))
+            if hymn.number is not None:
+                self.by_number.setdefault(hymn.number, []).append(hymn)
+                if words and words[0].isdigit() and int(words[0]) == hymn.number:
+                    words = words[1:]
+            for word in set(words):
+                self.postings.setdefault(word, []).append(index)
+            self.phrases.append(" ".join(words))
+            self.tiebreak.append((len(words), hymn.number if hymn.number is not None else float("inf"),
+                                  hymn.title.lower(), hymn.path))
+        self.vocabulary = sorted(self.postings)
+        self.numbers = sorted(str(number) for number in self.by_number)
+        self.grams = {}
+        for word in self.vocabulary:
+            for gram in _trigrams(word):
+                self.grams.setdefault(gram, []).append(word)
+        self._expansions = {}
+
+    def _expand(self, token):
+        """Vocabulary words a query word may stand for, with their match weight"""
+        found = self._expansions.get(token)
+        if found is not None:
+            return found
+
+        found = {}
+        if token in self.postings:
+            found[token] = self.EXACT
+        start = bisect.bisect_left(self.vocabulary, token)
+        for word in self.vocabulary[start:]:
+            if not word.startswith(token):
+                break
+            if word != token:
+                found[word] = self.PREFIX + 0.2 * len(token) / len(word)
+
+        if len(token) >= 3 and not token.isdigit():
+            limit = 1 if len(token) <= 5 else 2
+            grams = _trigrams(token)
+            shared = {}
+            for gram in grams:
+                for word in self.grams.get(gram, ()):
+                    shared[word] = shared.get(word, 0) + 1
+            # Each edit destroys at most three trigrams
+            needed = max(1, len(grams) - 3 * limit)
+            for word, count in shared.items():
+                if count < needed or word in found:
+                    continue
+                distance = _edit_distance(token, word, limit)
+                if distance > limit and len(word) > len(token):
+                    # A typo in a word that is still being typed
+                    distance = _edit_distance(token, word[:len(token)], 1) + 1
+                if distance <= limit:
+                    found[word] = self.FUZZY - 0.15 * distance
+
+        if len(self._expansions) > 4096:
+            self._expansions.clear()
+        self._expansions[token] = found
+        return found
+
+    def rank(self, query, limit=None):
+        """[(score, hymn)] best first; an empty query lists everything in library order"""
+        query = query.lower().replace("'", "").replace("\u2019", "")
+        if not query.strip():
+            return [(0.0, hymn) for hymn in self.hymns[:limit]]
+
+        match = _NUMBER_QUERY.match(query)
+        if match:
+            digits = match.group(1)
+            ranked = [(self.NUMBER, hymn) for hymn in self.by_number.get(int(digits), ())]
+            if limit is None or len(ranked) < limit:
+                # Longer numbers after the exact one, in numeric order
+                longer = []
+                for number in self.numbers[bisect.bisect_right(self.numbers, digits):]:
+                    if not number.startswith(digits):
+                        break
+                    longer.append(int(number))
+                longer.sort()
+                ranked += [(self.NUMBER_PREFIX, hymn) for number in longer for hymn in self.by_number[number]]
+            if ranked:
+                return ranked[:limit]
+
+        tokens = _TOKEN.findall(query)
+        if not tokens:
+            return []
+        totals = {}
+        get = totals.get
+        for token in tokens:
+            # Best weight per hymn for this word; weakest first so stronger matches overwrite
+            best = {}
+            for word, weight in sorted(self._expand(token).items(), key=lambda item: item[1]):
+                best.update(dict.fromkeys(self.postings[word], weight))
+            if len(tokens) == 1:
+                totals = best
+                break
+            for index, weight in best.items():
+                totals[index] = get(index, 0.0) + weight
+
+        phrase = " ".join(tokens)
+        phrases = self.phrases
+        cutoff = self.MIN_SCORE * len(tokens)
+        scores = {}
+        for index, total in totals.items():
+            if total < cutoff:
+                continue
+            score = total / len(tokens)
+            title = phrases[index]
+            if title.startswith(phrase):
+                score += self.STARTS_WITH_BONUS
+            elif phrase in title:
+                score += self.PHRASE_BONUS
+            scores[index] = score
+
+        # Find the k-th best score on bare floats, then order only what survives
+        if limit and len(scores) > limit:
+            floor = heapq.nlargest(limit, scores.values())[-1]
+            scores = {index: score for index, score in scores.items() if score >= floor}
+        tiebreak = self.tiebreak
+        top = sorted(scores, key=lambda index: (-scores[index], tiebreak[index]))[:limit]
+        return [(round(scores[index], 3), self.hymns[index]) for index in top]
+
+
+class HymnLibrary:
+    """Every hymn file under a folder, searched in memory and cached on disk between runs"""
+
+    def __init__(self, root, extensions=HYMN_EXTENSIONS, cache_file=None):
+        self.root = root
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.cache_file = cache_file
+        self.hymns = []
+        self.rescanned = 0
+        self._paths = {}
+        self._dirs = {}
+        self._titles = Counter()
+        self._folder_titles = Counter()
+        self._search_index = None
+        # Watcher threads update the index while the UI searches it; readers
+        # only ever see a complete list because updates swap in a new one
+        self._lock = threading.Lock()
+
+    def _load_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if (data.get("version") != INDEX_VERSION or data.get("root") != self.root
+                or tuple(data.get("extensions", ())) != self.extensions):
+            return {}
+        return data.get("dirs", {})
+
+    def _save_cache(self):
+        if not self.cache_file:
+            return
+        data = {
+            "version": INDEX_VERSION,
+            "root": self.root,
+            "extensions": self.extensions,
+            "dirs": self._dirs
+        }
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                # dumps() runs the C encoder in one go; dump() streams through the pure-Python one
+                f.write(json.dumps(data, separators=(",", ":")))
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            print("Could not save hymn index:", e)
+
+    def _scan(self, folder, cached, dirs, hymns, started_ns):
+        """Reuse a folder's cached listing while its mtime is unchanged; always descend into subfolders"""
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except OSError:
+            return
+        record = cached.get(folder)
+        if record is None or record[0] != mtime:
+            files, subdirs = [], []
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        elif entry.name.lower().endswith(self.extensions):
+                            stat = entry.stat()
+                            files.append([entry.name, stat.st_size, stat.st_mtime_ns, *parse_title(entry.name)])
+            except OSError:
+                return
+            record = [mtime if started_ns - mtime > RACY_WINDOW_NS else -1, files, subdirs]
+            self.rescanned += 1
+        dirs[folder] = record
+
+        # Titles and numbers come from the cache; only the path is rebuilt
+        prefix = os.path.join(folder, "")
+        for name, size, file_mtime, title, number in record[1]:
+            hymns.append(Hymn(title, name.lower(), number, prefix + name, size, file_mtime))
+        for name in record[2]:
+            self._scan(os.path.join(folder, name), cached, dirs, hymns, started_ns)
+
+    def build(self):
+        """Load the index, rescanning only folders whose mtime changed since it was saved"""
+        with self._lock:
+            cached = self._load_cache()
+            dirs, hymns = {}, []
+            self.rescanned = 0
+            self._scan(self.root, cached, dirs, hymns, time.time_ns())
+            self.hymns = hymns
+            self._paths = {hymn.path: hymn for hymn in hymns}
+            self._dirs = dirs
+            self._count_titles()
+            if self.rescanned or dirs.keys() != cached.keys():
+                self._save_cache()
+        return self
+
+    def refresh(self):
+        return self.build()
+
+    def folders(self):
+        return list(self._dirs)
+
+    def changed_folders(self):
+        """Indexed folders whose mtime no longer matches; one stat per folder"""
+        changed = []
+        for folder, record in list(self._dirs.items()):
+            try:
+                if os.stat(folder).st_mtime_ns != record[0]:
+                    changed.append(folder)
+            except OSError:
+                changed.append(folder)
+        return changed
+
+    def apply_changes(self, folders=None):
+        """Rescan the given folders (default: those whose mtime changed); returns (added, removed) hymns"""
+        with self._lock:
+            cached = dict(self._dirs)
+            for folder in self.changed_folders() if folders is None else folders:
+                # A folder the index has not seen yet comes in through its nearest known parent
+                while folder not in self._dirs and os.path.dirname(folder) != folder:
+                    folder = os.path.dirname(folder)
+                cached.pop(folder, None)
+            if len(cached) == len(self._dirs):
+                return [], []
+
+            dirs, hymns = {}, []
+            self.rescanned = 0
+            self._scan(self.root, cached, dirs, hymns, time.time_ns())
+            paths = {hymn.path: hymn for hymn in hymns}
+            # A file rewritten in place comes back as removed and added again
+            added = [hymn for hymn in hymns if self._paths.get(hymn.path) != hymn]
+            removed = [hymn for hymn in self.hymns if paths.get(hymn.path) != hymn]
+
+            # Runs on the watcher thread, so rebuild the ranked index here rather
+            # than on the next keystroke
+            search_index = HymnSearchIndex(hymns) if self._search_index is not None else None
+            self.hymns = hymns
+            self._paths = paths
+            self._dirs = dirs
+            self._count_titles(search_index)
+            if added or removed or dirs.keys() != cached.keys():
+                self._save_cache()
+            return added, removed
+
+    def add_files(self, paths):
+        """Index files just copied into the library without walking it again"""
+        with self._lock:
+            new = []
+            for path in paths:
+                if path.lower().endswith(self.extensions) and path not in self._paths:
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    hymn = make_hymn(path, stat.st_size, stat.st_mtime_ns)
+                    new.append(hymn)
+                    self._paths[path] = hymn
+            self.hymns = self.hymns + new
+            self._count_titles()
+            return new
+
+    def _count_titles(self, search_index=None):
+        # Without a prebuilt one, the ranked search index is rebuilt on the next query
+        self._search_index = search_index
+        self._titles = Counter(hymn.title.lower() for hymn in self.hymns)
+        self._folder_titles = Counter((os.path.dirname(hymn.path), hymn.title.lower()) for hymn in self.hymns)
+
+    def label(self, hymn):
+        """List text for a hymn; titles shared by several files get their folder (and extension) appended"""
+        title = hymn.title.lower()
+        if self._titles[title] < 2:
+            return hymn.title
+        folder = os.path.dirname(hymn.path)
+        where = os.path.basename(folder)
+        if self._folder_titles[(folder, title)] > 1:
+            where += ", " + os.path.splitext(hymn.path)[1].lstrip(".")
+        return f"{hymn.title} ({where})"
+
+    def rank(self, term, limit=None):
+        """[(score, hymn)] ranked by number, title words, prefixes and typos"""
+        index = self._search_index
+        if index is None:
+            index = self._search_index = HymnSearchIndex(self.hymns)
+        return index.rank(term, limit)
+
+    def search(self, term, limit=None):
+        return [hymn for _, hymn in self.rank(term, limit)]
+
+    def get(self, path):
+        return self._paths.get(path)
+
+    def __len__(self):
+        return len(self.hymns)
+
+
+class SearchWorker:
+    """Runs the newest search on a background thread so typing never waits for it
+
+    submit() only records the query. Once `delay` seconds pass without a newer
+    one, the worker runs search(query) and calls on_results(generation, query,
+    results) on the worker thread. Superseded queries never run and results
+    that went stale while running are dropped; a search may also give up early
+    by checking superseded() and returning None. UIs should still compare the
+    generation with current() when results reach their own thread.
+    """
+
+    def __init__(self, search, on_results, delay=0.12):
+        self.search = search
+        self.on_results = on_results
+        self.delay = delay
+        self._condition = threading.Condition()
+        self._generation = 0
+        self._running = 0
+        self._pending = None
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, query, delay=None):
+        with self._condition:
+            self._generation += 1
+            due = time.monotonic() + (self.delay if delay is None else delay)
+            self._pending = (self._generation, query, due)
+            self._condition.notify()
+            return self._generation
+
+    def current(self):
+        return self._generation
+
+    def superseded(self):
+        """True once a newer query arrived than the one being searched"""
+        return self._running != self._generation
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    if self._pending is None:
+                        self._condition.wait()
+                        continue
+                    remaining = self._pending[2] - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._stopped:
+                    return
+                generation, query, _ = self._pending
+                self._pending = None
+                self._running = generation
+            try:
+                results = self.search(query)
+            except Exception as e:
+                print("Error searching hymns:", e)
+                continue
+            if results is not None and generation == self._generation:
+                self.on_results(generation, query, results)
+
+
+class BackgroundImage:
+    """A window background decoded once, resized copies kept for the last few window sizes
+
+    convert turns each resized PIL image into what the UI draws (ImageTk.PhotoImage
+    for tkinter) and the converted images are what gets cached, so going back to a
+    size seen before costs neither a LANCZOS resize nor a new photo image.
+    `resizes` counts the resizes actually done.
+    """
+
+    def __init__(self, path, convert=None, maxsize=4):
+        self.path = path
+        self.convert = convert
+        self.maxsize = maxsize
+        self.resizes = 0
+        self._source = None
+        self._sized = OrderedDict()
+
+    def get(self, size):
+        size = (max(1, int(size[0])), max(1, int(size[1])))
+        image = self._sized.get(size)
+        if image is not None:
+            self._sized.move_to_end(size)
+            return image
+
+        from PIL import Image
+
+        if self._source is None:
+            with Image.open(self.path) as source:
+                self._source = source.copy()
+        image = self._source.resize(size, Image.LANCZOS)
+        self.resizes += 1
+        if self.convert is not None:
+            image = self.convert(image)
+        self._sized[size] = image
+        while len(self._sized) > self.maxsize:
+            self._sized.popitem(last=False)
+        return image
+
+
+def open_presentation(path):
+    from pptx import Presentation
+
+    if not path.lower().endswith(".ppsx"):
+        return Presentation(path)
+    # A .ppsx differs from a .pptx only in its main content type, which python-pptx refuses
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(buffer, "w") as target:
+        for item in source.infolist():
+            data = source.read(item)
+            if item.filename == "[Content_Types].xml":
+                data = data.replace(b"slideshow.main+xml", b"presentation.main+xml")
+            target.writestr(item, data)
+    buffer.seek(0)
+    return Presentation(buffer)
+
+
+def _shape_text(shapes, lines):
+    for shape in shapes:
+        if getattr(shape, "shapes", None) is not None:  # grouped shapes
+            _shape_text(shape.shapes, lines)
+        elif shape.has_text_frame:
+            for paragraph in shape.text_frame.paragraphs:
+                text = "".join(run.text for run in paragraph.runs).strip()
+                if text:
+                    lines.append(text)
+
+
+def extract_slide_text(path):
+    """(path, text, error) for one presentation, slides separated by blank lines
+
+    Module level so it can run in LyricIndex's worker processes.
+    """
+    try:
+        slides = []
+        for slide in open_presentation(path).slides:
+            lines = []
+            _shape_text(slide.shapes, lines)
+            if lines:
+                slides.append("\n".join(lines))
+        return path, "\n\n".join(slides), None
+    except Exception as e:
+        return path, "", f"{type(e).__name__}: {e}"
+
+
+def _solid_color(fill):
+    try:
+        if fill.type == 1:  # MSO_FILL.SOLID
+            return tuple(fill.fore_color.rgb)
+    except Exception:
+        pass  # theme colours have no RGB without resolving the theme
+    return None
+
+
+def _draw_slide(presentation, slide, size):
+    """A rough picture of the slide: background colour, pictures, filled shapes and text"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    scale = size[0] / presentation.slide_width
+    canvas_size = (size[0], max(1, round(presentation.slide_height * scale)))
+    background = (_solid_color(slide.background.fill)
+                  or _solid_color(slide.slide_layout.slide_master.background.fill) or (255, 255, 255))
+    image = Image.new("RGB", canvas_size, background)
+    draw = ImageDraw.Draw(image)
+    ink = (0, 0, 0) if sum(background) > 382 else (255, 255, 255)
+
+    for shape in slide.shapes:
+        if shape.left is None or shape.width is None:
+            continue
+        box = (round(shape.left * scale), round(shape.top * scale),
+               round((shape.left + shape.width) * scale), round((shape.top + shape.height) * scale))
+        if shape.shape_type == 13:  # MSO_SHAPE_TYPE.PICTURE
+            with Image.open(io.BytesIO(shape.image.blob)) as picture:
+                image.paste(picture.convert("RGB").resize((max(1, box[2] - box[0]), max(1, box[3] - box[1]))), box[:2])
+            continue
+        fill = _solid_color(shape.fill) if hasattr(shape, "fill") else None
+        if fill:
+            draw.rectangle(box, fill=fill)
+        if not shape.has_text_frame:
+            continue
+        y = box[1]
+        for paragraph in shape.text_frame.paragraphs:
+            text = "".join(run.text for run in paragraph.runs).strip()
+            font_size = next((run.font.size for run in paragraph.runs if run.font.size), 228600)  # 18 pt
+            font = ImageFont.load_default(size=max(6, font_size * scale))
+            color = ink
+            for run in paragraph.runs:
+                try:
+                    color = tuple(run.font.color.rgb)
+                    break
+                except Exception:
+                    continue
+            width = draw.textlength(text, font=font)
+            x = {2: (box[0] + box[2] - width) / 2, 3: box[2] - width}.get(paragraph.alignment, box[0])  # PP_ALIGN
+            draw.text((x, y), text, fill=color, font=font)
+            y += font_size * scale * 1.2
+    return image
+
+
+def render_slide_preview(path, size=(240, 135)):
+    """SlidePreview of the first slide: its text and a JPEG thumbnail drawn with PIL
+
+    Decks carry a docProps thumbnail, but python-pptx (and so every script that
+    rewrites hymns in bulk) saves them unchanged, so the slide is drawn instead.
+    """
+    if not path.lower().endswith(LYRIC_EXTENSIONS):
+        return SlidePreview(path, "", None, "No preview for this file type")
+    try:
+        presentation = open_presentation(path)
+        if not len(presentation.slides):
+            return SlidePreview(path, "", None, "The presentation has no slides")
+        slide = presentation.slides[0]
+        lines = []
+        _shape_text(slide.shapes, lines)
+    except Exception as e:
+        return SlidePreview(path, "", None, f"{type(e).__name__}: {e}")
+    try:
+        buffer = io.BytesIO()
+        _draw_slide(presentation, slide, size).save(buffer, "JPEG", quality=85)
+        return SlidePreview(path, "\n".join(lines), buffer.getvalue(), None)
+    except Exception as e:
+        # The text is still worth showing without a picture
+        return SlidePreview(path, "\n".join(lines), None, f"{type(e).__name__}: {e}")
+
+
+class LyricIndex:
+    """Slide text of every .pptx/.ppsx hymn in an SQLite FTS5 table, re-extracted only when a file changes
+
+    Extraction runs in a process pool for large batches; writes happen on the
+    thread calling update() and searches use their own per-thread connection.
+    """
+    POOL_THRESHOLD = 16  # below this, starting worker processes costs more than it saves
+    BATCH = 50
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY,
+            path TEXT UNIQUE NOT NULL,
+            mtime INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            error TEXT
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS lyrics USING fts5(title, text, tokenize = 'unicode61 remove_diacritics 2');
+    """
+
+    def __init__(self, db_path, workers=None):
+        self.db_path = db_path
+        self.workers = workers if workers is not None else max(1, (os.cpu_count() or 2) - 1)
+        self.extracted = 0
+        self.failed = 0
+        self._local = threading.local()
+        self._update_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._thread = None
+        self._again = False
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=10)
+            # Readers keep searching while the indexer writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _extract(self, paths):
+        if len(paths) < self.POOL_THRESHOLD or self.workers < 2:
+            yield from map(extract_slide_text, paths)
+            return
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            yield from pool.map(extract_slide_text, paths, chunksize=4)
+
+    def update(self, hymns):
+        """Extract new or changed hymns and forget deleted ones; returns how many were extracted"""
+        with self._update_lock:
+            connection = self._connection()
+            known = {path: (mtime, size) for path, mtime, size in connection.execute("SELECT path, mtime, size FROM files")}
+            wanted = {hymn.path: hymn for hymn in hymns if hymn.path.lower().endswith(LYRIC_EXTENSIONS)}
+            gone = [(path,) for path in known if path not in wanted]
+            todo = [path for path, hymn in wanted.items() if known.get(path) != (hymn.mtime, hymn.size)]
+
+            if gone:
+                with connection:
+                    connection.executemany("DELETE FROM lyrics WHERE rowid = (SELECT id FROM files WHERE path = ?)", gone)
+                    connection.executemany("DELETE FROM files WHERE path = ?", gone)
+
+            self.extracted = self.failed = 0
+            batch = []
+            for result in self._extract(todo):
+                batch.append(result)
+                if len(batch) >= self.BATCH:
+                    self._store(connection, wanted, batch)
+                    batch = []
+            self._store(connection, wanted, batch)
+            if todo or gone:
+                # Fold the WAL back in so it does not keep the whole first index around
+                connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return len(todo)
+
+    def _store(self, connection, hymns, results):
+        with connection:
+            for path, text, error in results:
+                hymn = hymns[path]
+                row = connection.execute("SELECT id FROM files WHERE path = ?", (path,)).fetchone()
+                if row:
+                    file_id = row[0]
+                    connection.execute("DELETE FROM lyrics WHERE rowid = ?", (file_id,))
+                    connection.execute("UPDATE files SET mtime = ?, size = ?, error = ? WHERE id = ?",
+                                       (hymn.mtime, hymn.size, error, file_id))
+                else:
+                    file_id = connection.execute("INSERT INTO files (path, mtime, size, error) VALUES (?, ?, ?, ?)",
+                                                 (path, hymn.mtime, hymn.size, error)).lastrowid
+                # Failed files keep their row so they are retried only once they change
+                connection.execute("INSERT INTO lyrics (rowid, title, text) VALUES (?, ?, ?)", (file_id, hymn.title, text))
+                self.extracted += 1
+                self.failed += error is not None
+
+    def refresh_in_background(self, get_hymns, on_done=None):
+        """update() on a worker thread; requests made while it runs fold into one more pass"""
+        with self._state_lock:
+            self._again = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refresh_loop, args=(get_hymns, on_done), daemon=True)
+                self._thread.start()
+
+    def _refresh_loop(self, get_hymns, on_done):
+        while True:
+            with self._state_lock:
+                if not self._again:
+                    self._thread = None
+                    return
+                self._again = False
+            try:
+                count = self.update(get_hymns())
+            except Exception as e:
+                print("Error indexing hymn lyrics:", e)
+                continue
+            if count and on_done:
+                on_done(count)
+
+    def search(self, query, limit=20):
+        """[(path, snippet, score)] for hymns whose slides contain the words typed, best first
+
+        Slides containing the words as one phrase rank above slides that merely
+        contain them all; the last word matches as a prefix while it is being typed.
+        """
+        words = re.findall(r"\w+", query.lower())
+        if not words:
+            return []
+        phrase = '"' + " ".join(words) + '" *'
+        every_word = " ".join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}" *'
+        sql = """
+            SELECT files.path, snippet(lyrics, 1, '[', ']', '\u2026', 10), bm25(lyrics, 2.0, 1.0)
+            FROM lyrics JOIN files ON files.id = lyrics.rowid
+            WHERE lyrics MATCH ? ORDER BY bm25(lyrics, 2.0, 1.0) LIMIT ?
+        """
+        results, seen = [], set()
+        connection = self._connection()
+        for bonus, match in ((10.0, phrase), (0.0, every_word)):
+            try:
+                rows = connection.execute(sql, (match, limit)).fetchall()
+            except sqlite3.Error:
+                return results
+            for path, snippet, score in rows:
+                if path not in seen and len(results) < limit:
+                    seen.add(path)
+                    results.append((path, " ".join(snippet.split()), round(bonus - score, 3)))
+            if len(words) == 1:
+                break
+        return results
+
+
+class SlidePreviewCache:
+    """First-slide previews in SQLite keyed by path and mtime; the least recently shown go past max_entries
+
+    get() renders on a miss, so call it off the GUI thread. peek() only looks at
+    the last few previews held in memory and never touches the disk, so the GUI
+    can show those the moment a row is highlighted.
+    """
+    MEMORY = 64
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS previews (
+            path TEXT PRIMARY KEY,
+            mtime INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            image BLOB,
+            error TEXT,
+            used INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS previews_used ON previews (used);
+    """
+
+    def __init__(self, db_path, max_entries=500, size=(240, 135)):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.size = size
+        self.rendered = 0
+        self._local = threading.local()
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def peek(self, path):
+        with self._memory_lock:
+            preview = self._memory.get(path)
+            if preview is not None:
+                self._memory.move_to_end(path)
+            return preview
+
+    def forget(self, paths):
+        """Drop changed files from memory; their disk rows no longer match the new mtime anyway"""
+        with self._memory_lock:
+            for path in paths:
+                self._memory.pop(path, None)
+
+    def get(self, path):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError as e:
+            return SlidePreview(path, "", None, f"{type(e).__name__}: {e}")
+        connection = self._connection()
+        used = time.time_ns()
+        row = connection.execute("SELECT text, image, error FROM previews WHERE path = ? AND mtime = ?",
+                                 (path, mtime)).fetchone()
+        if row:
+            with connection:
+                connection.execute("UPDATE previews SET used = ? WHERE path = ?", (used, path))
+            preview = SlidePreview(path, *row)
+        else:
+            preview = render_slide_preview(path, self.size)
+            self.rendered += 1
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO previews (path, mtime, text, image, error, used) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)", (path, mtime, preview.text, preview.image,
+                                                                 preview.error, used))
+                connection.execute("DELETE FROM previews WHERE path IN "
+                                   "(SELECT path FROM previews ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                                   (self.max_entries,))
+        with self._memory_lock:
+            self._memory[path] = preview
+            self._memory.move_to_end(path)
+            while len(self._memory) > self.MEMORY:
+                self._memory.popitem(last=False)
+        return preview
+
+
+class HymnWatcher:
+    """Keeps a HymnLibrary current as files are added, removed or renamed on disk
+
+    The backend only reports which folders changed; the library rescans just
+    those folders and on_change(added, removed) is called from the watcher
+    thread, so UIs must hand the result over to their own thread.
+    """
+    # inotify(7) event bits
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ONLYDIR = 0x01000000
+    WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                  | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, library, on_change, poll_interval=2.0, debounce=0.3, backend=None):
+        self.library = library
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.backend = backend
+        self._stop = threading.Event()
+        self._thread = None
+        self._handle = None
+
+    def start(self):
+        if self.backend is None:
+            self.backend = self._pick_backend()
+        target = {"inotify": self._run_inotify, "win32": self._run_win32, "poll": self._run_poll}[self.backend]
+        self._thread = threading.Thread(target=target, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._handle is not None and self.backend == "win32":
+            try:
+                import win32file
+                win32file.CloseHandle(self._handle)
+            except Exception:
+                pass
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    @staticmethod
+    def _pick_backend():
+        if sys.platform.startswith("linux") and ctypes.util.find_library("c"):
+            return "inotify"
+        if sys.platform == "win32":
+            try:
+                import win32file  # noqa: F401
+                return "win32"
+            except ImportError:
+                pass
+        return "poll"
+
+    def _apply(self, folders=None):
+        try:
+            added, removed = self.library.apply_changes(folders)
+        except Exception as e:
+            print("Error updating hymn index:", e)
+            return
+        if added or removed:
+            self.on_change(added, removed)
+
+    def _run_poll(self):
+        while not self._stop.wait(self.poll_interval):
+            self._apply()
+
+    def _run_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            self.backend = "poll"
+            return self._run_poll()
+
+        watches = {}
+
+        def sync_watches():
+            watched = set(watches.values())
+            for folder in self.library.folders():
+                if folder not in watched:
+                    wd = libc.inotify_add_watch(fd, folder.encode(sys.getfilesystemencoding()), self.WATCH_MASK)
+                    if wd < 0:
+                        # Usually the per-user watch limit; polling still catches everything
+                        raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder}")
+                    watches[wd] = folder
+
+        try:
+            # Catch anything that changed between the index build and the first watch
+            sync_watches()
+            self._apply()
+            sync_watches()
+            dirty, overflow, flush_at = set(), False, None
+            while not self._stop.is_set():
+                # Batch a burst of events, but flush within `debounce` of the first one
+                # so steady churn cannot hold updates back indefinitely
+                timeout = 0.5 if flush_at is None else max(0.0, flush_at - time.monotonic())
+                readable, _, _ = select.select([fd], [], [], timeout)
+                if flush_at is not None and time.monotonic() >= flush_at:
+                    self._apply(None if overflow else dirty)
+                    dirty, overflow, flush_at = set(), False, None
+                    sync_watches()
+                if not readable:
+                    continue
+                try:
+                    data = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                offset = 0
+                while offset + self.EVENT.size <= len(data):
+                    wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+                    offset += self.EVENT.size + length
+                    if mask & self.IN_Q_OVERFLOW:
+                        overflow = True
+                    elif wd in watches:
+                        dirty.add(watches[wd])
+                        if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                            watches.pop(wd, None)
+                    else:
+                        continue
+                    if flush_at is None:
+                        flush_at = time.monotonic() + self.debounce
+        except OSError as e:
+            print("Hymn watcher falling back to polling:", e)
+            self.backend = "poll"
+            self._run_poll()
+        finally:
+            os.close(fd)
+
+    def _run_win32(self):
+        import win32con
+        import win32file
+
+        try:
+            self._handle = win32file.CreateFile(
+                self.library.root, 0x0001,  # FILE_LIST_DIRECTORY
+                win32con.FILE_SHARE_READ | win32con.FILE_SHARE_WRITE | win32con.FILE_SHARE_DELETE,
+                None, win32con.OPEN_EXISTING, win32con.FILE_FLAG_BACKUP_SEMANTICS, None
+            )
+        except Exception as e:
+            print("Hymn watcher falling back to polling:", e)
+            self.backend = "poll"
+            return self._run_poll()
+
+        flags = (win32con.FILE_NOTIFY_CHANGE_FILE_NAME | win32con.FILE_NOTIFY_CHANGE_DIR_NAME
+                 | win32con.FILE_NOTIFY_CHANGE_LAST_WRITE)
+        self._apply()
+        while not self._stop.is_set():
+            try:
+                changes = win32file.ReadDirectoryChangesW(self._handle, 64 * 1024, True, flags, None, None)
+            except Exception:
+                if self._stop.is_set():
+                    break
+                # Buffer overflow or a transient error; revalidate everything
+                self._apply()
+                continue
+            if not changes:
+                self._apply()
+                continue
+            dirty = {os.path.dirname(os.path.join(self.library.root, name)) for _, name in changes}
+            # Let a burst of copies settle into one rescan
+            self._stop.wait(self.debounce)
+            self._apply(dirty)
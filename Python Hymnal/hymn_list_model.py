@@ -0,0 +1,96 @@
+from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt
+
+
+class HymnListModel(QAbstractListModel):
+    """Search results for a QListView, handed to the view a batch at a time as it scrolls
+
+    Each search replaces the rows in one model reset, so filtering costs a
+    list assignment rather than building and destroying a widget per hymn.
+    """
+    PathRole = Qt.UserRole
+    BATCH = 256
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []  # [(hymn, label)] in ranked order
+        self._loaded = 0
+        self._empty_text = None
+        self._fetching = False
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        if not self._rows:
+            return 1 if self._empty_text else 0
+        return self._loaded
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self.rowCount():
+            return None
+        if not self._rows:
+            return self._empty_text if role == Qt.DisplayRole else None
+        hymn, label = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return label
+        if role == self.PathRole:
+            return hymn.path
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._fetching and self._loaded < len(self._rows)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        count = min(self.BATCH, len(self._rows) - self._loaded)
+        # Slots connected to the insert signals may ask for more rows before this batch is in
+        self._fetching = True
+        try:
+            self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+            self._loaded += count
+            self.endInsertRows()
+        finally:
+            self._fetching = False
+
+    def set_rows(self, rows, empty_text=None):
+        self._fetching = True
+        try:
+            self.beginResetModel()
+            self._rows = list(rows)
+            self._loaded = min(self.BATCH, len(self._rows))
+            self._empty_text = empty_text
+            self.endResetModel()
+        finally:
+            self._fetching = False
+
+    def remove_paths(self, paths):
+        if not paths:
+            return
+        remaining = [row for row in self._rows if row[0].path not in paths]
+        if not remaining:
+            self.set_rows(remaining, self._empty_text)
+            return
+        for position in range(len(self._rows) - 1, -1, -1):
+            if self._rows[position][0].path not in paths:
+                continue
+            if position < self._loaded:
+                self.beginRemoveRows(QModelIndex(), position, position)
+                del self._rows[position]
+                self._loaded -= 1
+                self.endRemoveRows()
+            else:
+                del self._rows[position]
+
+    def insert_row(self, position, hymn, label):
+        if not self._rows:
+            self.set_rows([(hymn, label)], self._empty_text)
+            return
+        position = min(position, len(self._rows))
+        # Rows past what the view has fetched stay unannounced until it scrolls there
+        if position <= self._loaded:
+            self.beginInsertRows(QModelIndex(), position, position)
+            self._rows.insert(position, (hymn, label))
+            self._loaded += 1
+            self.endInsertRows()
+        else:
+            self._rows.insert(position, (hymn, label))
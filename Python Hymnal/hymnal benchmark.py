@@ -0,0 +1,886 @@
+"""Benchmarks for the Hymnal library index.
+
+startup: builds a synthetic hymn library in a scratch folder and compares a
+plain os.walk (what every keystroke used to cost) with a cold index build, a
+warm start from the on-disk index and a start after one folder changed.
+
+search: times ranked search on an in-memory index of synthetic titles for
+number, word, prefix, typo and multi-word queries, checks that typo queries
+still put the intended hymn first, and compares with the old substring scan.
+
+lyrics: writes real .pptx/.ppsx hymns with python-pptx and times the first
+lyric index with and without the process pool, a no-change update, an
+update after a few files changed and phrase searches with snippets.
+
+qt: replays typing into the v5 result list on Qt's offscreen platform and
+times each update including layout and paint: the old QListWidget refill,
+a QSortFilterProxyModel over the whole index, and HymnListModel.
+
+preview: renders first-slide previews of real decks into a SlidePreviewCache
+smaller than the library and times a render, a disk hit from a fresh cache,
+and the in-memory peek the GUI does on every arrow key; checks that the
+least recently shown previews were evicted and that a rewritten deck is
+rendered again.
+
+background: counts background resizes while a tkinter window like sdahymns
+v4 starts up and is then maximized and restored a few times, for the old
+update_background (open bg.png and resize on every <Configure>) and for
+BackgroundImage behind the root-size check. Without a display the
+<Configure> events of the same layout are replayed instead of shown.
+
+watch: starts a HymnWatcher on a synthetic library and adds, removes and
+renames hymns (some in newly created folders) while another thread keeps
+searching; reports how long each change took to reach the index, search
+latency during the churn and whether the index matched the disk once things
+settled. Exits with status 1 when a change was missed or the index and the
+disk disagree.
+
+Every run appends one JSON line to a results file in the per-user cache
+folder (--output to change it) so runs from different versions can be
+compared.
+
+    python "hymnal benchmark.py" startup --files 10000 --folders 100
+    python "hymnal benchmark.py" search --files 10000
+    python "hymnal benchmark.py" lyrics --files 400
+    python "hymnal benchmark.py" qt --files 10000
+    python "hymnal benchmark.py" preview --files 200 --max-entries 100
+    python "hymnal benchmark.py" background --toggles 3
+    python "hymnal benchmark.py" watch --ops 200 --backend poll
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+import hymn_library  # noqa: E402
+
+# Next to the library caches, so runs never leave untracked files in the source tree
+RESULTS_FILE = os.path.join(os.path.dirname(hymn_library.default_cache_file(BASE_DIR)), "bench_results.jsonl")
+
+WORDS = ["amazing", "grace", "holy", "lord", "praise", "blessed", "assurance", "rock", "ages", "jesus",
+         "love", "savior", "king", "glory", "morning", "evening", "shepherd", "cross", "faith", "wonderful",
+         "peace", "river", "heaven", "home", "light", "power", "redeemer", "sweet", "hour", "prayer"]
+
+
+def percentiles(samples):
+    """Summarize latencies (seconds) in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(pct):
+        return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(pick(50), 3),
+        'p90_ms': round(pick(90), 3),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def hymn_titles(count, seed=3):
+    rng = random.Random(seed)
+    return [f"{number:03d} - {' '.join(rng.sample(WORDS, rng.randint(2, 5))).title()}"
+            for number in range(1, count + 1)]
+
+
+def build_library(root, files, folders, seed=3):
+    """Empty hymn files spread over nested folders, plus some non-hymn clutter"""
+    titles = hymn_titles(files, seed)
+    per_folder = max(1, files // folders)
+    for index, title in enumerate(titles):
+        group = index // per_folder
+        folder = os.path.join(root, "_internal", "Data", f"Volume {group // 10}", f"Section {group}")
+        os.makedirs(folder, exist_ok=True)
+        extension = [".pps", ".ppsx", ".ppt", ".pptx"][index % 4]
+        open(os.path.join(folder, title + extension), "w").close()
+        if index % 10 == 0:
+            open(os.path.join(folder, f"notes {index}.txt"), "w").close()
+    backdate(root)
+    return titles
+
+
+def backdate(root, seconds=3600):
+    """Age every folder so the index trusts its mtimes, as with a library installed earlier"""
+    moment = time.time() - seconds
+    for folder, _, _ in os.walk(root):
+        os.utime(folder, (moment, moment))
+
+
+def walk_library(root):
+    """The pre-index search: one full walk with the extension test per file"""
+    allowed_extensions = [".pps", ".ppsx", ".ppt", ".pptx"]
+    found = []
+    for folder, dirs, files in os.walk(root, topdown=True):
+        for file in files:
+            if any(file.lower().endswith(ext) for ext in allowed_extensions):
+                found.append(file)
+    return found
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_startup_benchmark(args):
+    work_dir = tempfile.mkdtemp(prefix="hymnal_bench_")
+    try:
+        root = os.path.join(work_dir, "library")
+        cache_file = os.path.join(work_dir, "cache", "hymn_index.json")
+        build_library(root, args.files, args.folders)
+
+        walk = [timed(walk_library, root)[0] for _ in range(args.repeat)]
+
+        cold = []
+        for _ in range(args.repeat):
+            if os.path.exists(cache_file):
+                os.remove(cache_file)
+            elapsed, library = timed(hymn_library.HymnLibrary(root, cache_file=cache_file).build)
+            cold.append(elapsed)
+        indexed = len(library)
+
+        warm = []
+        for _ in range(args.repeat):
+            elapsed, library = timed(hymn_library.HymnLibrary(root, cache_file=cache_file).build)
+            warm.append(elapsed)
+        warm_rescanned = library.rescanned
+
+        changed, changed_rescanned = [], []
+        folders = sorted({os.path.dirname(hymn.path) for hymn in library.hymns})
+        for attempt in range(args.repeat):
+            folder = folders[attempt % len(folders)]
+            open(os.path.join(folder, f"999{attempt} - Added Hymn.ppsx"), "w").close()
+            backdate(folder)
+            elapsed, library = timed(hymn_library.HymnLibrary(root, cache_file=cache_file).build)
+            changed.append(elapsed)
+            changed_rescanned.append(library.rescanned)
+
+        return {
+            'benchmark': 'startup',
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'params': {'files': args.files, 'folders': args.folders, 'repeat': args.repeat},
+            'hymns_indexed': indexed,
+            'cache_bytes': os.path.getsize(cache_file),
+            'os_walk': percentiles(walk),
+            'cold_build': percentiles(cold),
+            'warm_start': percentiles(warm),
+            'warm_folders_rescanned': warm_rescanned,
+            'one_folder_changed': percentiles(changed),
+            'changed_folders_rescanned': max(changed_rescanned)
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def misspell(word, rng):
+    """One dropped, doubled or swapped letter"""
+    position = rng.randrange(1, len(word) - 1)
+    edit = rng.choice(["drop", "double", "swap"])
+    if edit == "drop":
+        return word[:position] + word[position + 1:]
+    if edit == "double":
+        return word[:position] + word[position] + word[position:]
+    return word[:position - 1] + word[position] + word[position - 1] + word[position + 1:]
+
+
+def search_queries(titles, count, rng):
+    """(kind, query, expected title or None) covering the ways people actually type"""
+    queries = []
+    for _ in range(count):
+        title = rng.choice(titles)
+        number, words = title.split(" - ", 1)
+        words = words.lower().split()
+        kind = rng.choice(["number", "word", "prefix", "typo", "phrase"])
+        if kind == "number":
+            query = rng.choice(["{}", "#{}", "hymn {}"]).format(int(number))
+        elif kind == "word":
+            query = rng.choice(words)
+        elif kind == "prefix":
+            query = rng.choice(words)[:rng.randint(1, 4)]
+        elif kind == "typo":
+            query = " ".join(misspell(word, rng) if len(word) > 3 else word for word in words)
+        else:
+            query = " ".join(words[:rng.randint(2, len(words))])
+        queries.append((kind, query, title if kind in ("number", "typo") else None))
+    return queries
+
+
+def run_search_benchmark(args):
+    rng = random.Random(5)
+    titles = hymn_titles(args.files)
+    hymns = [hymn_library.make_hymn(os.path.join("library", f"Section {index // 100}", title + ".pptx"))
+             for index, title in enumerate(titles)]
+
+    build_time, index = timed(hymn_library.HymnSearchIndex, hymns)
+    queries = search_queries(titles, args.queries, rng)
+
+    by_kind, overall, substring = {}, [], []
+    top_hits, checked = 0, 0
+    for kind, query, expected in queries:
+        elapsed, ranked = timed(index.rank, query, args.top)
+        # The first run fills the per-word expansion cache; report both
+        for _ in range(args.repeat - 1):
+            elapsed = min(elapsed, timed(index.rank, query, args.top)[0])
+        by_kind.setdefault(kind, []).append(elapsed)
+        overall.append(elapsed)
+        term = query.lower()
+        substring.append(timed(lambda: [hymn for hymn in hymns if term in hymn.key])[0])
+        if expected is not None:
+            checked += 1
+            best = ranked[0][0] if ranked else None
+            # Titles are random word combinations, so several may tie for first
+            top_hits += any(hymn.title == expected for score, hymn in ranked if score == best)
+
+    cold = []
+    for kind, query, _ in queries[:50]:
+        index._expansions.clear()
+        cold.append(timed(index.rank, query, args.top)[0])
+
+    return {
+        'benchmark': 'search',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'params': {'files': args.files, 'queries': args.queries, 'top': args.top, 'repeat': args.repeat},
+        'vocabulary': len(index.vocabulary),
+        'index_build_ms': round(build_time * 1000, 3),
+        'ranked': percentiles(overall),
+        'ranked_by_kind': {kind: percentiles(samples) for kind, samples in sorted(by_kind.items())},
+        'ranked_cold_cache': percentiles(cold),
+        'substring_scan': percentiles(substring),
+        'expected_hymn_first': f"{top_hits}/{checked}"
+    }
+
+
+def lyric_lines(rng, count):
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 8))).capitalize() for _ in range(count)]
+
+
+def write_presentation(path, slides):
+    """A hymn deck with one text box per slide; .ppsx gets the slideshow content type PowerPoint gives it"""
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    presentation = Presentation()
+    for lines in slides:
+        slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+        frame = slide.shapes.add_textbox(Inches(0.5), Inches(0.5), Inches(9), Inches(6)).text_frame
+        frame.text = lines[0]
+        for line in lines[1:]:
+            frame.add_paragraph().text = line
+    if not path.endswith(".ppsx"):
+        presentation.save(path)
+        return
+    buffer = io.BytesIO()
+    presentation.save(buffer)
+    with zipfile.ZipFile(buffer) as source, zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            data = source.read(item)
+            if item.filename == "[Content_Types].xml":
+                data = data.replace(b"presentation.main+xml", b"slideshow.main+xml")
+            target.writestr(item, data)
+
+
+def run_lyrics_benchmark(args):
+    work_dir = tempfile.mkdtemp(prefix="hymnal_bench_")
+    try:
+        rng = random.Random(13)
+        root = os.path.join(work_dir, "library")
+        verses = {}
+        for index, title in enumerate(hymn_titles(args.files)):
+            folder = os.path.join(root, f"Section {index // 100}")
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, title + (".ppsx" if index % 2 else ".pptx"))
+            slides = [lyric_lines(rng, 4) for _ in range(args.slides)]
+            write_presentation(path, slides)
+            verses[path] = slides
+        backdate(root)
+        library = hymn_library.HymnLibrary(root, cache_file=None).build()
+
+        single_db = os.path.join(work_dir, "single.sqlite3")
+        single_time, _ = timed(hymn_library.LyricIndex(single_db, workers=1).update, library.hymns)
+        pooled_db = os.path.join(work_dir, "pooled.sqlite3")
+        lyrics = hymn_library.LyricIndex(pooled_db, workers=args.workers)
+        pooled_time, extracted = timed(lyrics.update, library.hymns)
+        failed = lyrics.failed
+        noop = [timed(lyrics.update, library.hymns)[0] for _ in range(args.repeat)]
+
+        changed = rng.sample(sorted(verses), max(1, args.files // 100))
+        for path in changed:
+            verses[path] = [lyric_lines(rng, 4) for _ in range(args.slides)]
+            write_presentation(path, verses[path])
+        # Rewriting a file in place leaves its folder's mtime alone; name the folders like the watcher does
+        library.apply_changes({os.path.dirname(path) for path in changed})
+        changed_time, reextracted = timed(lyrics.update, library.hymns)
+
+        searches, found = [], 0
+        samples = rng.sample(sorted(verses), min(args.queries, len(verses)))
+        for path in samples:
+            line = rng.choice(rng.choice(verses[path])).lower().split()
+            start = rng.randrange(0, max(1, len(line) - 3))
+            query = " ".join(line[start:start + 3])
+            elapsed, results = timed(lyrics.search, query)
+            searches.append(elapsed)
+            found += any(result[0] == path for result in results)
+
+        return {
+            'benchmark': 'lyrics',
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'params': {'files': args.files, 'slides': args.slides, 'workers': lyrics.workers,
+                       'queries': len(samples), 'repeat': args.repeat},
+            'extracted': extracted,
+            'failed': failed,
+            'first_index_single_s': round(single_time, 3),
+            'first_index_pool_s': round(pooled_time, 3),
+            'no_change_update': percentiles(noop),
+            'files_changed': len(changed),
+            'reextracted': reextracted,
+            'changed_update_ms': round(changed_time * 1000, 3),
+            'search': percentiles(searches),
+            'source_hymn_found': f"{found}/{len(samples)}",
+            'db_bytes': os.path.getsize(pooled_db)
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def typing_script(words):
+    """Queries as the search bar sees them: each word typed out, then cleared"""
+    queries = [""]
+    for word in words:
+        queries.extend(word[:length] for length in range(1, len(word) + 1))
+        queries.append("")
+    return queries
+
+
+def run_qt_benchmark(args):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtCore import QModelIndex, QSortFilterProxyModel, Qt, QAbstractListModel
+    from PySide6.QtWidgets import QApplication, QListView, QListWidget, QListWidgetItem
+    from hymn_list_model import HymnListModel
+
+    app = QApplication.instance() or QApplication([])
+    titles = hymn_titles(args.files)
+    library_hymns = [hymn_library.make_hymn(os.path.join("library", f"Section {index // 100}", title + ".pptx"))
+                     for index, title in enumerate(titles)]
+    index = hymn_library.HymnSearchIndex(library_hymns)
+    queries = typing_script(random.Random(17).sample(WORDS, args.words))
+    results = [[(hymn, hymn.title) for _, hymn in index.rank(query)] for query in queries]
+
+    def widget_refill(view, rows):
+        # sdahymns v5 before this change: one QListWidgetItem per result
+        view.setUpdatesEnabled(False)
+        view.clear()
+        for hymn, label in rows:
+            item = QListWidgetItem(label)
+            item.setData(Qt.UserRole, hymn.path)
+            view.addItem(item)
+        view.setUpdatesEnabled(True)
+
+    class AllHymns(QAbstractListModel):
+        def rowCount(self, parent=QModelIndex()):
+            return 0 if parent.isValid() else len(library_hymns)
+
+        def data(self, model_index, role=Qt.DisplayRole):
+            if role == Qt.DisplayRole:
+                return library_hymns[model_index.row()].title
+            return None
+
+    class RankedFilter(QSortFilterProxyModel):
+        allowed = frozenset()
+
+        def filterAcceptsRow(self, source_row, source_parent):
+            return source_row in self.allowed
+
+    positions = {hymn.path: position for position, hymn in enumerate(library_hymns)}
+
+    def proxy_filter(proxy, rows):
+        # Filters in place but cannot keep the ranked order without a Python lessThan per comparison
+        proxy.allowed = frozenset(positions[hymn.path] for hymn, _ in rows)
+        proxy.invalidateFilter()
+
+    def model_reset(model, rows):
+        model.set_rows(rows, "No hymn found. Try another!")
+
+    strategies = []
+    widget = QListWidget()
+    strategies.append(("list_widget", widget, lambda rows: widget_refill(widget, rows)))
+
+    proxy_view = QListView()
+    proxy_view.setUniformItemSizes(True)
+    source = AllHymns()
+    proxy = RankedFilter()
+    proxy.setSourceModel(source)
+    proxy_view.setModel(proxy)
+    strategies.append(("filter_proxy", proxy_view, lambda rows: proxy_filter(proxy, rows)))
+
+    model_view = QListView()
+    model_view.setUniformItemSizes(True)
+    model = HymnListModel()
+    model_view.setModel(model)
+    strategies.append(("list_model", model_view, lambda rows: model_reset(model, rows)))
+
+    timings = {}
+    for name, view, update in strategies:
+        view.resize(640, 400)
+        view.show()
+        app.processEvents()
+        samples, clears = [], []
+        for _ in range(args.repeat):
+            for query, rows in zip(queries, results):
+                start = time.perf_counter()
+                update(rows)
+                app.processEvents()
+                view.repaint()
+                elapsed = time.perf_counter() - start
+                samples.append(elapsed)
+                if not query:
+                    clears.append(elapsed)
+        view.hide()
+        timings[name] = {'per_keystroke': percentiles(samples), 'cleared_query': percentiles(clears)}
+
+    return {
+        'benchmark': 'qt',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'params': {'files': args.files, 'words': args.words, 'repeat': args.repeat,
+                   'platform': os.environ.get("QT_QPA_PLATFORM")},
+        'queries': len(queries),
+        'rows_per_query': {'mean': round(statistics.fmean(len(rows) for rows in results)),
+                           'max': max(len(rows) for rows in results)},
+        'strategies': timings
+    }
+
+
+def run_preview_benchmark(args):
+    import sqlite3
+
+    work_dir = tempfile.mkdtemp(prefix="hymnal_bench_")
+    try:
+        rng = random.Random(19)
+        paths = []
+        for index, title in enumerate(hymn_titles(args.files)):
+            path = os.path.join(work_dir, title + (".ppsx" if index % 2 else ".pptx"))
+            write_presentation(path, [lyric_lines(rng, 4) for _ in range(args.slides)])
+            paths.append(path)
+        db_path = os.path.join(work_dir, "previews.sqlite3")
+
+        previews = hymn_library.SlidePreviewCache(db_path, max_entries=args.max_entries)
+        renders = [timed(previews.get, path)[0] for path in paths]
+        failed = sum(previews.get(path).image is None for path in paths[-args.max_entries:])
+        peeks = [timed(previews.peek, rng.choice(paths[-hymn_library.SlidePreviewCache.MEMORY:]))[0]
+                 for _ in range(args.repeat * 100)]
+
+        # A fresh cache (a restart) has nothing in memory, so every preview comes from disk
+        reopened = hymn_library.SlidePreviewCache(db_path, max_entries=args.max_entries)
+        kept = paths[-args.max_entries:]
+        disk_hits = [timed(reopened.get, path)[0] for path in kept]
+        evicted = paths[:-args.max_entries]
+        rows = {path for path, in sqlite3.connect(db_path).execute("SELECT path FROM previews")}
+
+        rewritten = kept[0]
+        new_slides = [["Rewritten first line"] + lyric_lines(rng, 3)]
+        write_presentation(rewritten, new_slides)
+        os.utime(rewritten, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+        reopened.forget([rewritten])
+        before = reopened.rendered
+        fresh = reopened.get(rewritten)
+
+        return {
+            'benchmark': 'preview',
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'params': {'files': args.files, 'slides': args.slides, 'max_entries': args.max_entries,
+                       'repeat': args.repeat},
+            'render': percentiles(renders),
+            'disk_hit': percentiles(disk_hits),
+            'memory_peek': percentiles(peeks),
+            'without_thumbnail': failed,
+            'rows_kept': len(rows),
+            'evicted_least_recent': not rows & set(evicted) and rows == set(kept),
+            'rewrite_rerendered': reopened.rendered == before + 1 and fresh.text.startswith("Rewritten first line"),
+            'db_bytes': os.path.getsize(db_path)
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def write_background(path, size=(1920, 1080)):
+    """A full-HD PNG with enough detail that decoding and LANCZOS cost what a real bg.png does"""
+    from PIL import Image
+
+    gradient = Image.linear_gradient("L")
+    bands = (gradient.resize(size), gradient.rotate(90).resize(size), Image.effect_noise(size, 40))
+    Image.merge("RGB", bands).save(path)
+
+
+def tk_configure_events(args, handler):
+    """Show a window laid out like sdahymns v4 and feed its <Configure> events to handler(widget_is_root, size)"""
+    import tkinter as tk
+
+    root = tk.Tk()
+    root.geometry("620x422+40+40")
+    background_label = tk.Label(root)
+    background_label.place(relwidth=1, relheight=1)
+
+    def on_configure(event=None):
+        if event is None or event.widget is root:
+            image = handler(True, (root.winfo_width(), root.winfo_height()))
+        else:
+            image = handler(False, (root.winfo_width(), root.winfo_height()))
+        if image is not None:
+            background_label.config(image=image)
+            background_label.image = image
+
+    on_configure()
+    menu_bar = tk.Frame(root, bg="white", height=30)
+    menu_bar.pack(fill=tk.X, side=tk.TOP)
+    for label in ("Add hymns", "Help", "About", "Clear app"):
+        tk.Button(menu_bar, text=label, relief="flat").pack(side=tk.LEFT)
+    search_frame = tk.Frame(menu_bar, bg="white")
+    search_frame.pack(side=tk.RIGHT, padx=10)
+    tk.Entry(search_frame, width=20).pack(side=tk.LEFT)
+    tk.Label(search_frame, text="search").pack(side=tk.LEFT)
+    main_frame = tk.Frame(root, bg="white")
+    main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 35))
+    listbox = tk.Listbox(main_frame)
+    scrollbar = tk.Scrollbar(main_frame, orient=tk.VERTICAL, command=listbox.yview)
+    listbox.grid(row=0, column=0, sticky="nsew")
+    scrollbar.grid(row=0, column=1, sticky="ns")
+    main_frame.grid_rowconfigure(0, weight=1)
+    main_frame.grid_columnconfigure(0, weight=1)
+    listbox.insert(tk.END, *hymn_titles(500))
+    root.bind("<Configure>", on_configure)
+
+    root.update()
+    for _ in range(args.toggles):
+        for geometry in ("1280x800", "620x422"):
+            root.geometry(geometry)
+            root.update()
+    root.destroy()
+
+
+def replayed_configure_events(args, handler):
+    """The same startup without a display: what Tk reports for that layout, one event per widget"""
+    children = 15  # sdahymns v4: frames, buttons, entry, icon label, listbox, scrollbar, background label
+    handler(True, (1, 1))  # the explicit call before the window is mapped
+    for size in [(620, 422)] + [(1280, 800), (620, 422)] * args.toggles:
+        for _ in range(children):
+            handler(False, size)
+        handler(True, size)
+
+
+def run_background_benchmark(args):
+    work_dir = tempfile.mkdtemp(prefix="hymnal_bench_")
+    try:
+        from PIL import Image
+
+        path = os.path.join(work_dir, "bg.png")
+        write_background(path)
+        try:
+            import tkinter as tk
+            from PIL import ImageTk
+
+            tk.Tk().destroy()
+            mode, drive, convert = "tk", tk_configure_events, ImageTk.PhotoImage
+        except Exception:
+            mode, drive, convert = "replayed", replayed_configure_events, None
+
+        def old_handler(widget_is_root, size):
+            # update_background before this change: reopen and resize on every event
+            stats['events'] += 1
+            start = time.perf_counter()
+            image = Image.open(path).resize((max(1, size[0]), max(1, size[1])), Image.LANCZOS)
+            stats['resizes'] += 1
+            if convert is not None:
+                image = convert(image)
+            stats['seconds'] += time.perf_counter() - start
+            return image
+
+        def cached_handler(widget_is_root, size):
+            stats['events'] += 1
+            if not widget_is_root or size == last_size[0]:
+                return None
+            start = time.perf_counter()
+            last_size[0] = size
+            image = background.get(size)
+            stats['seconds'] += time.perf_counter() - start
+            stats['resizes'] = background.resizes
+            return image
+
+        runs = {}
+        for name, handler in (("old", old_handler), ("cached", cached_handler)):
+            stats = {'events': 0, 'resizes': 0, 'seconds': 0.0}
+            background = hymn_library.BackgroundImage(path, convert)
+            last_size = [None]
+            drive(args, handler)
+            runs[name] = {'configure_events': stats['events'], 'resizes': stats['resizes'],
+                          'handler_ms': round(stats['seconds'] * 1000, 3)}
+
+        return {
+            'benchmark': 'background',
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'params': {'toggles': args.toggles},
+            'mode': mode,
+            'runs': runs
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_watch_benchmark(args):
+    work_dir = tempfile.mkdtemp(prefix="hymnal_bench_")
+    try:
+        root = os.path.join(work_dir, "library")
+        cache_file = os.path.join(work_dir, "cache", "hymn_index.json")
+        build_library(root, args.files, args.folders)
+        library = hymn_library.HymnLibrary(root, cache_file=cache_file).build()
+
+        seen = {}
+
+        def on_change(added, removed):
+            now = time.perf_counter()
+            for hymn in added:
+                seen.setdefault(("add", hymn.path), now)
+            for hymn in removed:
+                seen.setdefault(("remove", hymn.path), now)
+
+        watcher = hymn_library.HymnWatcher(library, on_change, poll_interval=args.poll_interval,
+                                           backend=None if args.backend == "auto" else args.backend).start()
+
+        searches, bad_results = [], []
+        stop = threading.Event()
+
+        def search_loop():
+            rng = random.Random(11)
+            while not stop.is_set():
+                term = rng.choice(WORDS)[:rng.randint(2, 5)]
+                elapsed, results = timed(library.rank, term)
+                searches.append(elapsed)
+                scores = [score for score, _ in results]
+                if not results or scores != sorted(scores, reverse=True):
+                    bad_results.append(term)
+                time.sleep(0.001)
+
+        searcher = threading.Thread(target=search_loop, daemon=True)
+        searcher.start()
+
+        rng = random.Random(7)
+        folders = sorted({os.path.dirname(hymn.path) for hymn in library.hymns})
+        expected, counts = [], {'add': 0, 'remove': 0, 'rename': 0, 'new_folder': 0}
+        for op_index in range(args.ops):
+            op = rng.choice(["add", "remove", "rename", "new_folder"])
+            if op in ("add", "new_folder"):
+                folder = rng.choice(folders)
+                if op == "new_folder":
+                    folder = os.path.join(folder, f"Churn {op_index:04d}")
+                    os.mkdir(folder)
+                path = os.path.join(folder, f"9{op_index:04d} - Churn Hymn.pptx")
+                open(path, "w").close()
+                expected.append((("add", path), time.perf_counter()))
+            else:
+                victim = rng.choice(library.hymns).path
+                if not os.path.exists(victim):
+                    continue
+                if op == "remove":
+                    os.remove(victim)
+                    expected.append((("remove", victim), time.perf_counter()))
+                else:
+                    target = os.path.join(os.path.dirname(victim), f"8{op_index:04d} - Renamed Hymn.ppsx")
+                    os.rename(victim, target)
+                    moment = time.perf_counter()
+                    expected.append((("remove", victim), moment))
+                    expected.append((("add", target), moment))
+            counts[op] += 1
+            time.sleep(args.interval)
+
+        deadline = time.perf_counter() + args.settle
+        on_disk = set()
+        while time.perf_counter() < deadline:
+            on_disk = {os.path.join(folder, file) for folder, _, files in os.walk(root) for file in files
+                       if file.lower().endswith(hymn_library.HYMN_EXTENSIONS)}
+            if on_disk == {hymn.path for hymn in library.hymns}:
+                break
+            time.sleep(0.1)
+        stop.set()
+        searcher.join()
+        watcher.stop()
+
+        latencies = [seen[key] - moment for key, moment in expected if key in seen]
+        consistent = on_disk == {hymn.path for hymn in library.hymns}
+        failures = []
+        if len(latencies) < len(expected):
+            failures.append(f"{len(expected) - len(latencies)} change(s) never reached the index")
+        if not consistent:
+            failures.append("index does not match the disk after settling")
+        return {
+            'benchmark': 'watch',
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'params': {'files': args.files, 'folders': args.folders, 'ops': args.ops,
+                       'interval': args.interval, 'backend': args.backend, 'poll_interval': args.poll_interval},
+            'backend': watcher.backend,
+            'operations': counts,
+            'propagation': percentiles(latencies),
+            'missed_events': len(expected) - len(latencies),
+            'search_during_churn': percentiles(searches),
+            'bad_search_results': len(bad_results),
+            'consistent': consistent,
+            'failures': failures
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def print_summary(result):
+    print(f"[{result['benchmark']}] @ {result['revision']}  {result['params']}")
+    if result['benchmark'] == 'search':
+        print(f"  vocabulary {result['vocabulary']} words, index built in {result['index_build_ms']} ms")
+        print(f"  ranked search:        {result['ranked']}")
+        for kind, summary in result['ranked_by_kind'].items():
+            print(f"    {kind:<8}            {summary}")
+        print(f"  cold expansion cache: {result['ranked_cold_cache']}")
+        print(f"  old substring scan:   {result['substring_scan']}")
+        print(f"  number/typo queries with the intended hymn first: {result['expected_hymn_first']}")
+        return
+    if result['benchmark'] == 'lyrics':
+        print(f"  {result['extracted']} hymns extracted ({result['failed']} failed), db {result['db_bytes']} bytes")
+        print(f"  first index:          {result['first_index_single_s']} s in one process, "
+              f"{result['first_index_pool_s']} s with {result['params']['workers']} workers")
+        print(f"  no-change update:     {result['no_change_update']}")
+        print(f"  {result['files_changed']} files changed:      {result['changed_update_ms']} ms "
+              f"({result['reextracted']} re-extracted)")
+        print(f"  phrase search:        {result['search']}")
+        print(f"  source hymn in results: {result['source_hymn_found']}")
+        return
+    if result['benchmark'] == 'qt':
+        print(f"  {result['queries']} queries, rows per query {result['rows_per_query']}")
+        for name, timing in result['strategies'].items():
+            print(f"  {name:<13} per keystroke: {timing['per_keystroke']}")
+            print(f"  {'':<13} cleared query: {timing['cleared_query']}")
+        return
+    if result['benchmark'] == 'preview':
+        print(f"  render first slide:   {result['render']} ({result['without_thumbnail']} without a thumbnail)")
+        print(f"  disk hit (restart):   {result['disk_hit']}")
+        print(f"  memory peek (GUI):    {result['memory_peek']}")
+        print(f"  {result['rows_kept']} previews kept, db {result['db_bytes']} bytes; least recent evicted: "
+              f"{result['evicted_least_recent']}; rewritten deck re-rendered: {result['rewrite_rerendered']}")
+        return
+    if result['benchmark'] == 'background':
+        print(f"  {result['mode']} <Configure> events, maximized and restored {result['params']['toggles']} times")
+        for name, run in result['runs'].items():
+            print(f"  {name:<8} {run['configure_events']} events, {run['resizes']} resizes, "
+                  f"{run['handler_ms']} ms in update_background")
+        return
+    if result['benchmark'] == 'watch':
+        print(f"  backend {result['backend']}, operations {result['operations']}")
+        print(f"  change -> index:      {result['propagation']} ({result['missed_events']} missed)")
+        print(f"  search during churn:  {result['search_during_churn']} "
+              f"({result['bad_search_results']} empty or unordered)")
+        print(f"  index matches disk:   {result['consistent']}")
+        for failure in result['failures']:
+            print(f"  FAILED: {failure}")
+        return
+    print(f"  {result['hymns_indexed']} hymns indexed, cache {result['cache_bytes']} bytes")
+    print(f"  os.walk per search:   {result['os_walk']}")
+    print(f"  cold build:           {result['cold_build']}")
+    print(f"  warm start:           {result['warm_start']} ({result['warm_folders_rescanned']} folders rescanned)")
+    print(f"  one folder changed:   {result['one_folder_changed']} "
+          f"({result['changed_folders_rescanned']} folders rescanned)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Hymnal library index")
+    parser.add_argument("--output", default=RESULTS_FILE, help=f"results file (default: {RESULTS_FILE})")
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+
+    startup = benchmarks.add_parser("startup", help="index startup time on a synthetic library")
+    startup.add_argument("--files", type=int, default=10000)
+    startup.add_argument("--folders", type=int, default=100)
+    startup.add_argument("--repeat", type=int, default=5)
+    startup.set_defaults(handler=run_startup_benchmark)
+
+    search = benchmarks.add_parser("search", help="ranked search latency and typo tolerance")
+    search.add_argument("--files", type=int, default=10000)
+    search.add_argument("--queries", type=int, default=500)
+    search.add_argument("--top", type=int, default=50, help="results kept per query")
+    search.add_argument("--repeat", type=int, default=3)
+    search.set_defaults(handler=run_search_benchmark)
+
+    lyrics = benchmarks.add_parser("lyrics", help="lyric extraction and full-text search")
+    lyrics.add_argument("--files", type=int, default=400)
+    lyrics.add_argument("--slides", type=int, default=4)
+    lyrics.add_argument("--workers", type=int, default=None)
+    lyrics.add_argument("--queries", type=int, default=200)
+    lyrics.add_argument("--repeat", type=int, default=5)
+    lyrics.set_defaults(handler=run_lyrics_benchmark)
+
+    qt = benchmarks.add_parser("qt", help="result list update cost in the Qt app (offscreen)")
+    qt.add_argument("--files", type=int, default=10000)
+    qt.add_argument("--words", type=int, default=5, help="words typed and cleared per run")
+    qt.add_argument("--repeat", type=int, default=3)
+    qt.set_defaults(handler=run_qt_benchmark)
+
+    preview = benchmarks.add_parser("preview", help="slide preview rendering and its disk cache")
+    preview.add_argument("--files", type=int, default=200)
+    preview.add_argument("--slides", type=int, default=4)
+    preview.add_argument("--max-entries", type=int, default=100)
+    preview.add_argument("--repeat", type=int, default=5)
+    preview.set_defaults(handler=run_preview_benchmark)
+
+    background = benchmarks.add_parser("background", help="background resizes during tkinter startup")
+    background.add_argument("--toggles", type=int, default=3, help="maximize/restore cycles after startup")
+    background.set_defaults(handler=run_background_benchmark)
+
+    watch = benchmarks.add_parser("watch", help="index updates from the watcher under churn")
+    watch.add_argument("--files", type=int, default=5000)
+    watch.add_argument("--folders", type=int, default=50)
+    watch.add_argument("--ops", type=int, default=200)
+    watch.add_argument("--interval", type=float, default=0.02, help="seconds between filesystem changes")
+    watch.add_argument("--backend", choices=["auto", "inotify", "win32", "poll"], default="auto")
+    watch.add_argument("--poll-interval", type=float, default=0.5)
+    watch.add_argument("--settle", type=float, default=10.0, help="seconds to wait for the index to catch up")
+    watch.set_defaults(handler=run_watch_benchmark)
+
+    args = parser.parse_args()
+    args.output = os.path.abspath(args.output)
+
+    result = args.handler(args)
+    print_summary(result)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "a") as f:
+        f.write(json.dumps(result) + "\n")
+    print(f"Results appended to {args.output}")
+    return 1 if result.get('failures') else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,12 +2,15 @@ import os
 import psutil
 import shutil
 import tkinter as tk
+from collections import Counter
+from functools import lru_cache
 from tkinter import Scrollbar, Listbox, Entry, Button, Menu, messagebox
 from PIL import Image, ImageTk
 from tkinter import filedialog
 
 
 def search_files(event=None):
+    global search_results
     search_term = search_entry.get().lower()
     allowed_extensions = [".pps", ".ppsx", ".ppt", ".pptx", ".mp4"]
     search_results = []
@@ -15,41 +18,51 @@ def search_files(event=None):
     for root, dirs, files in os.walk(dir_path, topdown=True):
         for file in files:
             if any(file.lower().endswith(ext) for ext in allowed_extensions) and search_term in file.lower():
-                search_results.append(file)
+                # Keep the full path so opening a row never has to look the file up again
+                search_results.append(os.path.join(root, file))
 
     result_listbox.delete(0, tk.END)
 
     if not search_results:
         result_listbox.insert(tk.END, "No hymn found with that word in the title. Try another!")
     else:
-        for result in search_results:
-            # Remove the file extension from the result before displaying
-            result_without_extension = os.path.splitext(result)[0]
-            result_listbox.insert(tk.END, result_without_extension)
+        # Remove the file extension from the result before displaying
+        titles = [os.path.splitext(os.path.basename(result))[0] for result in search_results]
+        title_counts = Counter(title.lower() for title in titles)
+        for result, title in zip(search_results, titles):
+            if title_counts[title.lower()] > 1:
+                # Same title in several places: show which folder (and format) each one is
+                title += f" ({os.path.basename(os.path.dirname(result))}, {os.path.splitext(result)[1].lstrip('.')})"
+            result_listbox.insert(tk.END, title)
 
 def open_selected(event):
     selected_item_index = result_listbox.curselection()
-    if selected_item_index:
-        selected_item = result_listbox.get(selected_item_index)
-        selected_file_with_extension = None
-
-        # Recursively search for the selected file in dir_path and its subfolders
-        for root, _, files in os.walk(dir_path):
-            for file in files:
-                if selected_item.lower() in file.lower():
-                    selected_file_with_extension = os.path.join(root, file)
-                    break
-            if selected_file_with_extension:
-                break
-
-        if selected_file_with_extension:
-            os.startfile(selected_file_with_extension)
+    # Rows line up with `search_results`; the "No hymn found" row has no entry there
+    if selected_item_index and selected_item_index[0] < len(search_results):
+        os.startfile(search_results[selected_item_index[0]])
             
-def update_background():
-    global resized_bg_image
-    bg_image = Image.open(r"Data\bg.png")  # Replace with your image file path
-    resized_bg_image = bg_image.resize((root.winfo_width(), root.winfo_height()), Image.LANCZOS)
-    bg_image_tk = ImageTk.PhotoImage(resized_bg_image)
+@lru_cache(maxsize=1)
+def background_source():
+    # Decoded once; every resize starts from this copy
+    with Image.open(r"Data\bg.png") as bg_image:  # Replace with your image file path
+        return bg_image.copy()
+
+@lru_cache(maxsize=4)
+def background_photo(width, height):
+    return ImageTk.PhotoImage(background_source().resize((max(1, width), max(1, height)), Image.LANCZOS))
+
+background_size = None
+
+def update_background(event=None):
+    global background_size
+    # <Configure> bound on root also fires for every child widget; only the window's own size matters
+    if event is not None and event.widget is not root:
+        return
+    size = (root.winfo_width(), root.winfo_height())
+    if size == background_size:
+        return
+    background_size = size
+    bg_image_tk = background_photo(*size)
     background_label.config(image=bg_image_tk)
     background_label.image = bg_image_tk
 
@@ -137,6 +150,7 @@ def close_all_powerpoint_shows():
         psutil.Process(pid).terminate()
    
 dir_path = os.path.dirname(os.path.realpath(__file__))
+search_results = []
 
 root = tk.Tk()
 root.title("Northeastern Mindanao Academy Church")
@@ -209,7 +223,7 @@ result_listbox.bind("<Return>", open_selected)
 root.grid_rowconfigure(1, weight=1)
 root.grid_columnconfigure(0, weight=1)
 
-root.bind("<Configure>", lambda event: update_background())
+root.bind("<Configure>", update_background)
 root.bind("<Shift_R>", lambda event: [toggle_focus(), clear_search_entry()])
 root.bind("<Up>", select_previous_result)
 root.bind("<Down>", select_next_result)
@@ -9,28 +9,72 @@ from tkinter import filedialog
 from tkinter import StringVar
 from screeninfo import get_monitors
 import shutil
+import queue
+from hymn_library import BackgroundImage, HymnLibrary, HymnWatcher, SearchWorker, default_cache_file
 
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
+library = HymnLibrary(dir_path, cache_file=default_cache_file(dir_path)).build()
+results = []
+# Filled by the watcher thread, drained on the Tk thread
+library_changes = queue.Queue()
+search_results_queue = queue.Queue()
 
 def search_files(event=None):
-    search_term = search_var.get().lower()
-    allowed_extensions = [".pps", ".ppsx", ".ppt", ".pptx"]
-    search_results = []
+    # Typing goes through the worker's debounce; everything else searches right away
+    search_worker.submit(search_var.get(), delay=0)
 
-    for root, dirs, files in os.walk(dir_path, topdown=True):
-        for file in files:
-            if any(file.lower().endswith(ext) for ext in allowed_extensions) and search_term in file.lower():
-                search_results.append(file)
+def find_results(search_term):
+    # Runs on the search worker thread
+    return [(hymn, library.label(hymn)) for hymn in library.search(search_term)]
+
+search_worker = SearchWorker(find_results, lambda *found: search_results_queue.put(found))
+
+def show_results(generation, search_term, rows):
+    global results
+    if generation != search_worker.current():
+        return
+    results = [hymn for hymn, _ in rows]
 
     result_listbox.delete(0, tk.END)
 
-    if not search_results:
+    if not results:
         result_listbox.insert(tk.END, "No hymn found with that word in the title. Try another!")
     else:
-        for result in search_results:
-            result_without_extension = os.path.splitext(result)[0]
-            result_listbox.insert(tk.END, result_without_extension)
+        # One Tcl call for the whole list instead of one per row
+        result_listbox.insert(tk.END, *[label for _, label in rows])
+
+def poll_search_results():
+    while not search_results_queue.empty():
+        show_results(*search_results_queue.get_nowait())
+    root.after(30, poll_search_results)
+
+def apply_library_changes(added, removed):
+    # Touch only the rows that changed so the selection and scroll position survive
+    added_paths = {hymn.path for hymn in added}
+    ranked = library.search(search_var.get())
+    matches = [(index, hymn) for index, hymn in enumerate(ranked) if hymn.path in added_paths]
+    if not results and matches:
+        result_listbox.delete(0, tk.END)
+
+    removed_paths = {hymn.path for hymn in removed}
+    for index in range(len(results) - 1, -1, -1):
+        if results[index].path in removed_paths:
+            del results[index]
+            result_listbox.delete(index)
+
+    # Rows that stayed keep their relative order, so new ones slot in at their rank
+    for index, hymn in matches:
+        results.insert(index, hymn)
+        result_listbox.insert(index, library.label(hymn))
+
+    if not results and result_listbox.size() == 0:
+        result_listbox.insert(tk.END, "No hymn found with that word in the title. Try another!")
+
+def poll_library_changes():
+    while not library_changes.empty():
+        apply_library_changes(*library_changes.get_nowait())
+    root.after(250, poll_library_changes)
 
 def quit_powerpoint():
     clear_search_entry()
@@ -54,36 +98,33 @@ def clear_search_entry():
 
 def open_selected(event):
     selected_item_index = result_listbox.curselection()
-    if selected_item_index:
-        selected_item = result_listbox.get(selected_item_index)
-        selected_file_with_extension = None
-
-        for root, _, files in os.walk(dir_path):
-            for file in files:
-                if selected_item.lower() in file.lower():
-                    selected_file_with_extension = os.path.join(root, file)
-                    break
-            if selected_file_with_extension:
-                break
-
-        if selected_file_with_extension:
-            try:
-                ppt = win32com.client.Dispatch('PowerPoint.Application')
-                ppt.Visible = True
-                presentation = ppt.Presentations.Open(selected_file_with_extension, WithWindow=True)
-                presentation.SlideShowSettings.AdvanceMode = 1
-                presentation.SlideShowSettings.ShowType = 1
-                presentation.SlideShowSettings.Run()
-                ppt.WindowState = 2
-            except Exception as e:
-                print("Error opening presentation in Presenter View:", e)
-                return
-
-def update_background():
-    global resized_bg_image
-    bg_image = Image.open(r"_internal/Data\bg.png")
-    resized_bg_image = bg_image.resize((root.winfo_width(), root.winfo_height()), Image.LANCZOS)
-    bg_image_tk = ImageTk.PhotoImage(resized_bg_image)
+    # Rows line up with `results`; the "No hymn found" row has no entry there
+    if selected_item_index and selected_item_index[0] < len(results):
+        selected_file_with_extension = results[selected_item_index[0]].path
+        try:
+            ppt = win32com.client.Dispatch('PowerPoint.Application')
+            ppt.Visible = True
+            presentation = ppt.Presentations.Open(selected_file_with_extension, WithWindow=True)
+            presentation.SlideShowSettings.AdvanceMode = 1
+            presentation.SlideShowSettings.ShowType = 1
+            presentation.SlideShowSettings.Run()
+            ppt.WindowState = 2
+        except Exception as e:
+            print("Error opening presentation in Presenter View:", e)
+
+background = BackgroundImage(r"_internal/Data\bg.png", ImageTk.PhotoImage)
+background_size = None
+
+def update_background(event=None):
+    global background_size
+    # <Configure> bound on root also fires for every child widget; only the window's own size matters
+    if event is not None and event.widget is not root:
+        return
+    size = (root.winfo_width(), root.winfo_height())
+    if size == background_size:
+        return
+    background_size = size
+    bg_image_tk = background.get(size)
     background_label.config(image=bg_image_tk)
     background_label.image = bg_image_tk
 
@@ -125,14 +166,18 @@ def add_hymns():
         hymns_directory = os.path.join(dir_path, "Data", "4 More Hymns")
         os.makedirs(hymns_directory, exist_ok=True)
 
+        added = []
         for file_path in file_paths:
             file_name = os.path.basename(file_path)
             destination_path = os.path.join(hymns_directory, file_name)
             try:
                 shutil.copy(file_path, destination_path)
+                added.append(destination_path)
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to copy {file_name}: {str(e)}")
 
+        apply_library_changes(library.add_files(added), [])
+
         messagebox.showinfo("Success", f"{len(file_paths)} hymn(s) added successfully!")
 
 def apphelp():
@@ -194,7 +239,7 @@ menu_bar.add_command(label="Clear", command=quit_powerpoint)
 search_var = StringVar()
 search_entry = Entry(root, highlightbackground="white", highlightthickness=1, textvariable=search_var)
 search_entry.grid(row=0, column=1, padx=0, pady=0)
-search_var.trace_add("write", lambda *args: search_files())
+search_var.trace_add("write", lambda *args: search_worker.submit(search_var.get()))
 search_entry.focus_set()
 
 search_button = Button(root, text="Search", command=search_files)
@@ -218,10 +263,13 @@ result_listbox.bind("<Return>", open_selected)
 root.grid_rowconfigure(1, weight=1)
 root.grid_columnconfigure(0, weight=1)
 
-root.bind("<Configure>", lambda event: update_background())
+root.bind("<Configure>", update_background)
 root.bind("<Shift_R>", lambda event: toggle_focus())
 root.bind("<Up>", select_previous_result)
 root.bind("<Down>", select_next_result)
 
 search_files()
+watcher = HymnWatcher(library, lambda added, removed: library_changes.put((added, removed))).start()
+poll_library_changes()
+poll_search_results()
 root.mainloop()
@@ -6,26 +6,71 @@ import tkinter as tk
 from tkinter import Scrollbar, Listbox, Entry, Menu, messagebox, filedialog, StringVar
 from PIL import Image, ImageTk
 import shutil
+import queue
+from hymn_library import BackgroundImage, HymnLibrary, HymnWatcher, SearchWorker, default_cache_file
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
+library = HymnLibrary(dir_path, cache_file=default_cache_file(dir_path)).build()
+results = []
+# Filled by the watcher thread, drained on the Tk thread
+library_changes = queue.Queue()
+search_results_queue = queue.Queue()
 
 def search_files(event=None):
-    search_term = search_var.get().lower()
-    allowed_extensions = [".pps", ".ppsx", ".ppt", ".pptx"]
-    search_results = []
+    # Typing goes through the worker's debounce; everything else searches right away
+    search_worker.submit(search_var.get(), delay=0)
 
-    for root, dirs, files in os.walk(dir_path, topdown=True):
-        for file in files:
-            if any(file.lower().endswith(ext) for ext in allowed_extensions) and search_term in file.lower():
-                search_results.append(file)
+def find_results(search_term):
+    # Runs on the search worker thread
+    return [(hymn, library.label(hymn)) for hymn in library.search(search_term)]
+
+search_worker = SearchWorker(find_results, lambda *found: search_results_queue.put(found))
+
+def show_results(generation, search_term, rows):
+    global results
+    if generation != search_worker.current():
+        return
+    results = [hymn for hymn, _ in rows]
 
     result_listbox.delete(0, tk.END)
 
-    if not search_results:
+    if not results:
         result_listbox.insert(tk.END, "No hymn found with that word in the title. Try another!")
     else:
-        for result in search_results:
-            result_listbox.insert(tk.END, os.path.splitext(result)[0])
+        # One Tcl call for the whole list instead of one per row
+        result_listbox.insert(tk.END, *[label for _, label in rows])
+
+def poll_search_results():
+    while not search_results_queue.empty():
+        show_results(*search_results_queue.get_nowait())
+    root.after(30, poll_search_results)
+
+def apply_library_changes(added, removed):
+    # Touch only the rows that changed so the selection and scroll position survive
+    added_paths = {hymn.path for hymn in added}
+    ranked = library.search(search_var.get())
+    matches = [(index, hymn) for index, hymn in enumerate(ranked) if hymn.path in added_paths]
+    if not results and matches:
+        result_listbox.delete(0, tk.END)
+
+    removed_paths = {hymn.path for hymn in removed}
+    for index in range(len(results) - 1, -1, -1):
+        if results[index].path in removed_paths:
+            del results[index]
+            result_listbox.delete(index)
+
+    # Rows that stayed keep their relative order, so new ones slot in at their rank
+    for index, hymn in matches:
+        results.insert(index, hymn)
+        result_listbox.insert(index, library.label(hymn))
+
+    if not results and result_listbox.size() == 0:
+        result_listbox.insert(tk.END, "No hymn found with that word in the title. Try another!")
+
+def poll_library_changes():
+    while not library_changes.empty():
+        apply_library_changes(*library_changes.get_nowait())
+    root.after(250, poll_library_changes)
 
 def quit_powerpoint():
     clear_search_entry()
@@ -47,35 +92,30 @@ def clear_search_entry():
 
 def open_selected(event):
     selected = result_listbox.curselection()
-    if selected:
-        item = result_listbox.get(selected[0])
-        for root_dir, _, files in os.walk(dir_path):
-            for file in files:
-                if item.lower() in file.lower():
-                    full_path = os.path.join(root_dir, file)
-                    try:
-                        pythoncom.CoInitialize()
-                        ppt = win32com.client.Dispatch('PowerPoint.Application')
-                        ppt.Visible = True
-                        
-                        # Add these lines to bypass security warnings
-                        ppt.DisplayAlerts = False
-                        
-                        pres = ppt.Presentations.Open(full_path, WithWindow=True)
-                        pres.SlideShowSettings.AdvanceMode = 1
-                        pres.SlideShowSettings.ShowType = 1
-                        pres.SlideShowSettings.Run()
-                        ppt.WindowState = 2
-                        pres.SlideShowSettings.ShowPresenterView = True
-                        
-                        # Reset alerts after opening
-                        ppt.DisplayAlerts = False
-                        
-                        pythoncom.CoUninitialize()
-                        return
-                    except Exception as e:
-                        print("Error:", e)
-                        pythoncom.CoUninitialize()
+    # Rows line up with `results`; the "No hymn found" row has no entry there
+    if selected and selected[0] < len(results):
+        full_path = results[selected[0]].path
+        try:
+            pythoncom.CoInitialize()
+            ppt = win32com.client.Dispatch('PowerPoint.Application')
+            ppt.Visible = True
+            
+            # Add these lines to bypass security warnings
+            ppt.DisplayAlerts = False
+            
+            pres = ppt.Presentations.Open(full_path, WithWindow=True)
+            pres.SlideShowSettings.AdvanceMode = 1
+            pres.SlideShowSettings.ShowType = 1
+            pres.SlideShowSettings.Run()
+            ppt.WindowState = 2
+            pres.SlideShowSettings.ShowPresenterView = True
+            
+            # Reset alerts after opening
+            ppt.DisplayAlerts = False
+        except Exception as e:
+            print("Error:", e)
+        finally:
+            pythoncom.CoUninitialize()
 
 def toggle_focus(event=None):
     if search_entry.focus_get() == search_entry:
@@ -107,11 +147,15 @@ def add_hymns():
     if paths:
         target = os.path.join(dir_path, "_internal", "Data", "Added More Hymns") 
         os.makedirs(target, exist_ok=True)
+        added = []
         for path in paths:
             try:
-                shutil.copy(path, os.path.join(target, os.path.basename(path)))
+                destination = os.path.join(target, os.path.basename(path))
+                shutil.copy(path, destination)
+                added.append(destination)
             except Exception as e:
                 messagebox.showerror("Error", f"Could not copy {path}: {e}")
+        apply_library_changes(library.add_files(added), [])
         messagebox.showinfo("Done", f"{len(paths)} hymn(s) added!")
 
 def apphelp():
@@ -128,16 +172,24 @@ def delete_temp_folder():
     else:
         messagebox.showinfo("Info", "Temporary folder does not exist.")
 
-def update_background():
-    global resized_bg_image
+background = BackgroundImage(r"_internal/Data/bg.png", ImageTk.PhotoImage)
+background_size = None
+
+def update_background(event=None):
+    global background_size
+    # <Configure> bound on root also fires for every child widget; only the window's own size matters
+    if event is not None and event.widget is not root:
+        return
+    size = (root.winfo_width(), root.winfo_height())
+    if size == background_size:
+        return
     try:
-        bg_image = Image.open(r"_internal/Data/bg.png")
-        resized_bg_image = bg_image.resize((root.winfo_width(), root.winfo_height()), Image.LANCZOS)
-        bg_image_tk = ImageTk.PhotoImage(resized_bg_image)
-        background_label.config(image=bg_image_tk)
-        background_label.image = bg_image_tk
-    except:
-        pass
+        bg_image_tk = background.get(size)
+    except Exception:
+        return
+    background_size = size
+    background_label.config(image=bg_image_tk)
+    background_label.image = bg_image_tk
 
 # Dictionary to track active menus
 active_menus = {}
@@ -280,7 +332,7 @@ search_button.image = search_icon
 search_button.pack(side=tk.LEFT, padx=(2, 0))
 search_button.bind("<Button-1>", lambda e: search_files())
 
-search_var.trace_add("write", lambda *args: search_files())
+search_var.trace_add("write", lambda *args: search_worker.submit(search_var.get()))
 
 # === Main Content ===
 main_frame = tk.Frame(root, bg="white")
@@ -300,7 +352,7 @@ main_frame.grid_columnconfigure(0, weight=1)
 result_listbox.bind("<Double-Button-1>", open_selected)
 result_listbox.bind("<Return>", open_selected)
 
-root.bind("<Configure>", lambda e: update_background())
+root.bind("<Configure>", update_background)
 root.bind("<Shift_R>", toggle_focus)
 root.bind("<Up>", select_previous_result)
 root.bind("<Down>", select_next_result)
@@ -315,4 +367,7 @@ check_mouse_position()
 
 search_entry.focus_set()
 search_files()
+watcher = HymnWatcher(library, lambda added, removed: library_changes.put((added, removed))).start()
+poll_library_changes()
+poll_search_results()
 root.mainloop()
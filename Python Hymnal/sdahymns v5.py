@@ -1,17 +1,29 @@
 import os
 import sys
+import multiprocessing
 from PySide6.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QListWidget, QLineEdit,
+    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QListView, QLineEdit,
     QPushButton, QLabel, QFileDialog, QMessageBox, QScrollArea, QFrame
 )
 from PySide6.QtGui import QIcon, QPixmap
-from PySide6.QtCore import Qt, QSize
+from PySide6.QtCore import Qt, QSize, Signal, QModelIndex
 import pythoncom
 import win32com.client
 import shutil
 import threading
+from hymn_library import (
+    HymnLibrary, HymnWatcher, LyricIndex, SearchWorker, SlidePreviewCache,
+    default_cache_file, default_lyrics_file, default_previews_file
+)
+from hymn_list_model import HymnListModel
 
 class HymnalApp(QWidget):
+    # Emitted from the watcher thread; Qt queues it onto the GUI thread
+    library_changed = Signal(list, list)
+    lyrics_indexed = Signal(int)
+    results_ready = Signal(int, str, list)
+    preview_ready = Signal(int, str, object)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Seventh Day Adventist Hymnal")
@@ -19,9 +31,31 @@ class HymnalApp(QWidget):
         self.setWindowIcon(QIcon("_internal/Data/favicon.ico"))
 
         self.dir_path = os.path.dirname(os.path.realpath(__file__))
+        self.library = HymnLibrary(self.dir_path, cache_file=default_cache_file(self.dir_path)).build()
+        try:
+            self.lyrics = LyricIndex(default_lyrics_file(self.dir_path))
+        except Exception as e:
+            # SQLite without FTS5, or the cache folder is not writable
+            print("Lyric search unavailable:", e)
+            self.lyrics = None
+        try:
+            self.previews = SlidePreviewCache(default_previews_file(self.dir_path))
+        except Exception as e:
+            print("Slide previews unavailable:", e)
+            self.previews = None
+        self.results_ready.connect(self.show_results)
+        self.search_worker = SearchWorker(self.find_results, self.results_ready.emit)
+        # Holding an arrow key only renders the row it stops on
+        self.preview_ready.connect(self.show_preview)
+        self.preview_worker = SearchWorker(self.find_preview, self.preview_ready.emit, delay=0.08)
         self.init_ui()
         self.search_bar.setFocus()
 
+        self.library_changed.connect(self.apply_library_changes)
+        self.watcher = HymnWatcher(self.library, self.library_changed.emit).start()
+        self.lyrics_indexed.connect(self.refresh_lyric_results)
+        self.refresh_lyrics()
+
     def init_ui(self):
         main_layout = QVBoxLayout(self)
         
@@ -46,47 +80,131 @@ class HymnalApp(QWidget):
         # Search bar
         self.search_bar = QLineEdit()
         self.search_bar.setPlaceholderText("Search hymns...")
-        self.search_bar.textChanged.connect(self.search_files)
+        self.search_bar.textChanged.connect(self.search_worker.submit)
         menu_layout.addWidget(self.search_bar)
 
         main_layout.addLayout(menu_layout)
 
         # Result list
-        self.result_list = QListWidget()
-        self.result_list.itemDoubleClicked.connect(self.open_selected)
-        main_layout.addWidget(self.result_list)
+        self.result_model = HymnListModel(self)
+        self.result_list = QListView()
+        self.result_list.setModel(self.result_model)
+        # Every row is one line of text, so the view can lay out rows without measuring each
+        self.result_list.setUniformItemSizes(True)
+        self.result_list.setEditTriggers(QListView.NoEditTriggers)
+        self.result_list.doubleClicked.connect(self.open_selected)
+        self.result_list.selectionModel().currentChanged.connect(self.preview_current)
+
+        # Preview of the highlighted hymn's first slide
+        preview_frame = QFrame()
+        preview_frame.setFixedWidth(250)
+        preview_layout = QVBoxLayout(preview_frame)
+        preview_layout.setContentsMargins(0, 0, 0, 0)
+        self.preview_image = QLabel()
+        self.preview_image.setFixedSize(QSize(240, 135))
+        self.preview_image.setAlignment(Qt.AlignCenter)
+        self.preview_text = QLabel()
+        self.preview_text.setWordWrap(True)
+        self.preview_text.setAlignment(Qt.AlignTop | Qt.AlignLeft)
+        preview_scroll = QScrollArea()
+        preview_scroll.setWidgetResizable(True)
+        preview_scroll.setFrameShape(QFrame.NoFrame)
+        preview_scroll.setWidget(self.preview_text)
+        preview_layout.addWidget(self.preview_image)
+        preview_layout.addWidget(preview_scroll)
+
+        content_layout = QHBoxLayout()
+        content_layout.addWidget(self.result_list)
+        content_layout.addWidget(preview_frame)
+        main_layout.addLayout(content_layout)
 
         self.search_files()
 
     def search_files(self):
-        term = self.search_bar.text().lower()
-        allowed_extensions = [".pps", ".ppsx", ".ppt", ".pptx"]
-        self.result_list.clear()
-        found = False
+        # Typing goes through the worker's debounce; everything else searches right away
+        self.search_worker.submit(self.search_bar.text(), delay=0)
 
-        for root, dirs, files in os.walk(self.dir_path):
-            for file in files:
-                if any(file.lower().endswith(ext) for ext in allowed_extensions):
-                    if term in file.lower():
-                        self.result_list.addItem(os.path.splitext(file)[0])
-                        found = True
+    def find_results(self, term):
+        """Runs on the search worker: [(hymn, row text)]"""
+        rows = [(hymn, self.library.label(hymn)) for hymn in self.library.search(term)]
 
-        if not found:
-            self.result_list.addItem("No hymn found. Try another!")
+        # Hymns whose slides contain the words typed, after the title matches
+        if self.lyrics and len(term.strip()) >= 3:
+            if self.search_worker.superseded():
+                return None
+            shown = {hymn.path for hymn, _ in rows}
+            for path, snippet, _ in self.lyrics.search(term):
+                hymn = self.library.get(path)
+                if hymn and path not in shown:
+                    rows.append((hymn, f"{self.library.label(hymn)}  \u2014  {snippet}"))
+        return rows
+
+    def show_results(self, generation, term, rows):
+        if generation != self.search_worker.current():
+            return
+        self.result_model.set_rows(rows, "No hymn found. Try another!")
+        # A model reset drops the current row without emitting currentChanged
+        self.preview_current(self.result_list.currentIndex())
 
         if term.strip() == "":
             self.result_list.scrollToTop()
 
+    def apply_library_changes(self, added, removed):
+        # Touch only the rows that changed so the selection and scroll position survive
+        added_paths = {hymn.path for hymn in added}
+        ranked = self.library.search(self.search_bar.text())
+        matches = [(row, hymn) for row, hymn in enumerate(ranked) if hymn.path in added_paths]
+        self.result_model.remove_paths({hymn.path for hymn in removed})
+        if self.previews:
+            # A rewritten file arrives as removed and added; either way its preview is stale
+            self.previews.forget(added_paths | {hymn.path for hymn in removed})
+
+        # Rows that stayed keep their relative order, so new ones slot in at their rank
+        for row, hymn in matches:
+            self.result_model.insert_row(row, hymn, self.library.label(hymn))
+        self.preview_current(self.result_list.currentIndex())
+        self.refresh_lyrics()
+
+    def refresh_lyrics(self):
+        if self.lyrics:
+            self.lyrics.refresh_in_background(lambda: self.library.hymns, self.lyrics_indexed.emit)
+
+    def refresh_lyric_results(self, count):
+        # Newly extracted slides may match what is already typed
+        if len(self.search_bar.text().strip()) >= 3:
+            self.search_files()
+
+    def preview_current(self, current, previous=None):
+        path = current.data(HymnListModel.PathRole)
+        preview = self.previews.peek(path) if self.previews and path else None
+        # Submit even on a hit so a preview still rendering for an earlier row is dropped
+        self.preview_worker.submit(path if self.previews and preview is None else None)
+        if preview is not None:
+            self.display_preview(preview)
+        else:
+            self.preview_image.clear()
+            self.preview_text.setText("Loading preview\u2026" if self.previews and path else "")
+
+    def find_preview(self, path):
+        """Runs on the preview worker: disk cache, or render the first slide"""
+        return self.previews.get(path) if path else None
+
+    def show_preview(self, generation, path, preview):
+        if generation == self.preview_worker.current():
+            self.display_preview(preview)
+
+    def display_preview(self, preview):
+        pixmap = QPixmap()
+        if preview.image and pixmap.loadFromData(preview.image):
+            self.preview_image.setPixmap(pixmap)
+        else:
+            self.preview_image.clear()
+        self.preview_text.setText(preview.text or preview.error or "")
+
     def open_selected(self):
-        selected = self.result_list.currentItem()
-        if selected:
-            name = selected.text()
-            for root, _, files in os.walk(self.dir_path):
-                for file in files:
-                    if name.lower() in file.lower():
-                        full_path = os.path.join(root, file)
-                        threading.Thread(target=self.launch_ppt, args=(full_path,), daemon=True).start()
-                        return
+        path = self.result_list.currentIndex().data(HymnListModel.PathRole)
+        if path:
+            threading.Thread(target=self.launch_ppt, args=(path,), daemon=True).start()
 
     def launch_ppt(self, file_path):
         try:
@@ -127,8 +245,8 @@ class HymnalApp(QWidget):
     def toggle_focus(self):
         if self.search_bar.hasFocus():
             self.result_list.setFocus()
-            if self.result_list.count() > 0:
-                self.result_list.setCurrentRow(0)
+            if self.result_model.rowCount() > 0:
+                self.result_list.setCurrentIndex(self.result_model.index(0))
         else:
             self.result_list.clearSelection()
             self.search_bar.setFocus()
@@ -146,25 +264,31 @@ class HymnalApp(QWidget):
             self.quit_powerpoint()
 
     def select_next_result(self):
-        current = self.result_list.currentRow()
-        if current < self.result_list.count() - 1:
-            self.result_list.setCurrentRow(current + 1)
+        current = self.result_list.currentIndex().row()
+        if current >= self.result_model.rowCount() - 1 and self.result_model.canFetchMore(QModelIndex()):
+            self.result_model.fetchMore(QModelIndex())
+        if current < self.result_model.rowCount() - 1:
+            self.result_list.setCurrentIndex(self.result_model.index(current + 1))
 
     def select_previous_result(self):
-        current = self.result_list.currentRow()
+        current = self.result_list.currentIndex().row()
         if current > 0:
-            self.result_list.setCurrentRow(current - 1)
+            self.result_list.setCurrentIndex(self.result_model.index(current - 1))
 
     def add_hymns(self):
         paths, _ = QFileDialog.getOpenFileNames(self, "Select Hymns", filter="PowerPoint Files (*.pps *.ppsx)")
         if paths:
             target = os.path.join(self.dir_path, "_internal", "Data", "Added More Hymns")
             os.makedirs(target, exist_ok=True)
+            added = []
             for path in paths:
                 try:
-                    shutil.copy(path, os.path.join(target, os.path.basename(path)))
+                    destination = os.path.join(target, os.path.basename(path))
+                    shutil.copy(path, destination)
+                    added.append(destination)
                 except Exception as e:
                     QMessageBox.critical(self, "Error", f"Could not copy {path}: {e}")
+            self.apply_library_changes(self.library.add_files(added), [])
             QMessageBox.information(self, "Done", f"{len(paths)} hymn(s) added!")
         self.search_bar.setFocus()
         
@@ -175,8 +299,16 @@ class HymnalApp(QWidget):
     def show_about(self):
         QMessageBox.information(self, "About", "Seventh Day Adventist Church Hymnal\n\nDeveloper: Jelmar A. Orapa\nEmail: orapajelmar@gmail.com")
         self.search_bar.setFocus()
+
+    def closeEvent(self, event):
+        self.watcher.stop()
+        self.search_worker.stop()
+        self.preview_worker.stop()
+        super().closeEvent(event)
         
 if __name__ == "__main__":
+    # The lyric indexer's worker processes re-launch the frozen exe
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     hymnal_app = HymnalApp()
     hymnal_app.show()
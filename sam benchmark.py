@@ -0,0 +1,734 @@
+"""Benchmarks for the SAM recording path and camera loop.
+
+record: seeds a realistic attendance database and SF2 workbook in a scratch
+folder, replays scan bursts into QRScannerAPI with the webview stubbed out and
+reports throughput and latency percentiles.
+
+camera: drives _camera_loop with a replayed capture and reports allocations
+and GC pauses per frame.
+
+decode: replays a queue of students each holding a QR ID in front of the
+camera and counts how many decoder calls each unique student costs.
+
+lowlight: replays dim, motion-blurred gate footage (synthetic, or a recorded
+clip) and compares the detection rate of the plain decoder with the
+low-light assist, along with the latency the assist adds.
+
+Every run appends one JSON line to a results file in the per-user cache
+folder (--output to change it) so runs from different versions can be
+compared. record is the default, so the original flag-only
+form still works.
+
+    python "sam benchmark.py" --students 1200 --days 200 --scans 1000
+    python "sam benchmark.py" record --students 1200 --days 200 --scans 1000
+    python "sam benchmark.py" camera --frames 600 --video gate.mp4
+    python "sam benchmark.py" decode --students 30 --hold 45
+    python "sam benchmark.py" lowlight --students 30 --brightness 0.3 --blur 9
+"""
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime, timedelta
+
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+# Per-user, so runs never leave untracked files in the source tree
+RESULTS_FILE = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache"),
+                            "SAM", "bench_results.jsonl")
+
+
+class FakeWindow:
+    """Stands in for the pywebview window and counts JS dispatches"""
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+
+    def evaluate_js(self, js_code):
+        self.calls += 1
+        self.bytes += len(js_code)
+
+
+def install_webview_stub():
+    window = FakeWindow()
+    stub = types.ModuleType("webview")
+    stub.windows = [window]
+    stub.create_window = lambda *args, **kwargs: window
+    stub.start = lambda *args, **kwargs: None
+    sys.modules["webview"] = stub
+    return window
+
+
+def load_sam(sam_path):
+    spec = importlib.util.spec_from_file_location("sam_app", sam_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["sam_app"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentiles(samples):
+    """Summarize latencies (seconds) in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(pct):
+        return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': round(pick(50), 3),
+        'p90_ms': round(pick(90), 3),
+        'p99_ms': round(pick(99), 3),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+
+
+def school_days(count, end=None):
+    """Return the last count weekdays up to end, oldest first"""
+    day = end or datetime.now().date()
+    days = []
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    return list(reversed(days))
+
+
+def student_names(count):
+    return [f"Student {i:04d}" for i in range(1, count + 1)]
+
+
+def seed_database(db_path, names, days, date_format, time_format, attendance_rate=0.95, seed=7):
+    """Create an attendance database covering the given school days"""
+    import sqlite3
+
+    rng = random.Random(seed)
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS attendance (
+            date TEXT,
+            time TEXT,
+            name TEXT,
+            UNIQUE(date, name)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_date_name ON attendance(date, name)")
+    rows = 0
+    for day in days[:-1]:  # leave today empty for the replay
+        date_str = day.strftime(date_format)
+        batch = []
+        for name in names:
+            if rng.random() < attendance_rate:
+                # Arrivals cluster around 7:30 with a late tail past 8:15
+                minutes = max(0, min(150, int(rng.gauss(60, 25))))
+                arrival = datetime.combine(day, datetime.min.time()) + timedelta(hours=6, minutes=30 + minutes,
+                                                                                  seconds=rng.randrange(60))
+                batch.append((date_str, arrival.strftime(time_format), name))
+        conn.executemany("INSERT OR IGNORE INTO attendance (date, time, name) VALUES (?, ?, ?)", batch)
+        rows += len(batch)
+    conn.commit()
+    conn.close()
+    return rows
+
+
+def build_sf2_template(path, names, days, date_format):
+    """Write a workbook with the SF2 layout SAM expects (dates on row 11, names in column B)"""
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "SF2"
+    month_days = days[-25:]
+    for offset, day in enumerate(month_days):
+        ws.cell(row=11, column=4 + offset, value=day.strftime(date_format))
+
+    name_rows = list(range(14, 44)) + list(range(46, 76))
+    for row, name in zip(name_rows, names):
+        ws.cell(row=row, column=2, value=name)
+    wb.save(path)
+    return min(len(names), len(name_rows))
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def write_settings(extra=None):
+    settings = {
+        "auto_backup": False,
+        "auto_archive": False,
+        "sync_role": "off",
+        "sampling_profiler": False
+    }
+    settings.update(extra or {})
+    os.makedirs("_internal/data", exist_ok=True)
+    with open("_internal/data/settings.json", "w") as f:
+        json.dump(settings, f)
+
+
+def run_benchmark(args):
+    window = install_webview_stub()
+    sam = load_sam(args.sam)
+
+    work_dir = tempfile.mkdtemp(prefix="sam_bench_")
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        write_settings()
+
+        date_format, time_format = "%m/%d/%y", "%H:%M:%S"
+        names = student_names(args.students)
+        days = school_days(args.days)
+
+        seed_time, seeded_rows = timed(seed_database, "_internal/data/attendance.db", names, days,
+                                       date_format, time_format)
+        sf2_students = None
+        if not args.skip_sf2:
+            sf2_students = build_sf2_template("_internal/data/SF2 Automated.xlsx", names, days, date_format)
+
+        init_time, api = timed(sam.QRScannerAPI)
+
+        rng = random.Random(args.seed)
+        queue = rng.sample(names, min(args.scans, len(names)))
+        # A share of students present their ID twice, as happens at the gate
+        queue += rng.sample(queue, int(len(queue) * args.duplicate_rate))
+
+        record_latencies = []
+        replay_start = time.perf_counter()
+        for start in range(0, len(queue), args.burst):
+            for name in queue[start:start + args.burst]:
+                elapsed, _ = timed(api.record_attendance, name)
+                record_latencies.append(elapsed)
+            if args.burst_gap:
+                time.sleep(args.burst_gap)
+        replay_time = time.perf_counter() - replay_start
+
+        load_latencies = [timed(api.load_today_records)[0] for _ in range(args.repeat)]
+
+        sf2 = {}
+        if not args.skip_sf2:
+            sf2['update'] = percentiles([timed(api.update_sf2_automated)[0] for _ in range(args.repeat)])
+            sf2['late_arrivals'] = percentiles([timed(api.update_sf2_late_arrivals)[0] for _ in range(args.repeat)])
+
+        metrics = api.get_metrics()['metrics']
+        api.cleanup()
+
+        return {
+            'benchmark': 'record',
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'sam': os.path.basename(args.sam),
+            'revision': git_revision(),
+            'params': {
+                'students': args.students,
+                'days': args.days,
+                'scans': len(queue),
+                'burst': args.burst,
+                'seeded_rows': seeded_rows,
+                'sf2_students': sf2_students
+            },
+            'seed_s': round(seed_time, 3),
+            'startup_s': round(init_time, 3),
+            'throughput_scans_per_s': round(len(queue) / replay_time, 1) if replay_time else None,
+            'record_attendance': percentiles(record_latencies),
+            'load_today_records': percentiles(load_latencies),
+            'sf2': sf2,
+            'js_dispatches': window.calls,
+            'js_bytes': window.bytes,
+            'metrics': metrics
+        }
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class ReplayCapture:
+    """cv2.VideoCapture stand-in that replays frames from a video file or synthetic noise
+
+    Like a real driver it honours read(image=...) by filling the caller's buffer,
+    and otherwise hands back a freshly allocated frame.
+    """
+
+    def __init__(self, frames, limit):
+        self.frames = frames
+        self.limit = limit
+        self.position = 0
+        self.opened = True
+        self.frame_peaks = []
+
+    @classmethod
+    def load(cls, video_path, limit, width=1280, height=720):
+        import numpy as np
+
+        frames = []
+        if video_path:
+            import cv2
+
+            source = cv2.VideoCapture(video_path)
+            while len(frames) < min(limit, 300):
+                ok, frame = source.read()
+                if not ok:
+                    break
+                frames.append(frame)
+            source.release()
+        if not frames:
+            rng = np.random.default_rng(3)
+            frames = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(8)]
+        return cls(frames, limit)
+
+    def isOpened(self):
+        return self.opened
+
+    def release(self):
+        self.opened = False
+
+    def read(self, image=None):
+        if tracemalloc.is_tracing():
+            # Peak traced memory since the previous read = transient allocations of one frame
+            current, peak = tracemalloc.get_traced_memory()
+            if self.position:
+                self.frame_peaks.append(peak - self._frame_base)
+            tracemalloc.reset_peak()
+            self._frame_base = current
+        if self.position >= self.limit:
+            return False, None
+        frame = self.frames[self.position % len(self.frames)]
+        self.position += 1
+        if image is not None and image.shape == frame.shape:
+            image[...] = frame
+            return True, image
+        return True, frame.copy()
+
+
+def run_camera_benchmark(args):
+    window = install_webview_stub()
+    sam = load_sam(args.sam)
+
+    work_dir = tempfile.mkdtemp(prefix="sam_bench_")
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        write_settings({"camera_fps": 60, "preview_width": args.preview_width})
+        api = sam.QRScannerAPI()
+        capture = ReplayCapture.load(args.video, args.frames)
+
+        gc_pauses = []
+        gc_started = {}
+
+        def on_gc(phase, info):
+            if phase == "start":
+                gc_started['t'] = time.perf_counter()
+            elif 't' in gc_started:
+                gc_pauses.append(time.perf_counter() - gc_started.pop('t'))
+
+        gc.collect()
+        gc.callbacks.append(on_gc)
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        try:
+            api.cap = capture
+            api.camera_active = True
+            api._camera_wanted = True
+            api._camera_loop()
+        finally:
+            elapsed = time.perf_counter() - start
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            gc.callbacks.remove(on_gc)
+
+        frames = capture.position
+        allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename') if stat.size_diff > 0)
+        allocations = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+        metrics = api.get_metrics()['metrics']
+        api.cleanup()
+
+        return {
+            'benchmark': 'camera',
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'sam': os.path.basename(args.sam),
+            'revision': git_revision(),
+            'params': {
+                'frames': frames,
+                'video': os.path.basename(args.video) if args.video else None,
+                'preview_width': args.preview_width
+            },
+            'loop_s': round(elapsed, 3),
+            'transient_bytes_per_frame': int(statistics.median(capture.frame_peaks)) if capture.frame_peaks else None,
+            'retained_bytes_per_frame': round(allocated / frames, 1) if frames else None,
+            'retained_blocks_per_frame': round(allocations / frames, 2) if frames else None,
+            'tracemalloc_peak_bytes': peak,
+            'gc_collections': len(gc_pauses),
+            'gc_pause': percentiles(gc_pauses),
+            'js_dispatches': window.calls,
+            'js_bytes': window.bytes,
+            'metrics': metrics
+        }
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class StudentQueueCapture:
+    """Synthetic gate footage: students present a QR ID one after another
+
+    Each student holds their code for hold frames while it drifts and jitters a
+    little, then leaves the frame for gap frames. Frames are rendered on demand
+    into one buffer so long queues do not need the footage in memory.
+    """
+
+    def __init__(self, names, hold=45, gap=10, width=1280, height=720, code_size=220, seed=5):
+        import numpy as np
+        import cv2
+
+        self.np = np
+        self.names = names
+        self.hold = hold
+        self.gap = gap
+        self.code_size = code_size
+        self.rng = random.Random(seed)
+        self.limit = len(names) * (hold + gap)
+        self.position = 0
+        self.opened = True
+        noise = np.random.default_rng(seed).integers(90, 140, (height, width), dtype=np.uint8)
+        self.background = cv2.cvtColor(cv2.GaussianBlur(noise, (9, 9), 0), cv2.COLOR_GRAY2BGR)
+        self.frame = self.background.copy()
+        encoder = cv2.QRCodeEncoder.create()
+        self.codes = {}
+        for name in names:
+            code = encoder.encode(name)
+            code = cv2.copyMakeBorder(code, 4, 4, 4, 4, cv2.BORDER_CONSTANT, value=255)
+            code = cv2.resize(code, (code_size, code_size), interpolation=cv2.INTER_NEAREST)
+            self.codes[name] = cv2.cvtColor(code, cv2.COLOR_GRAY2BGR)
+
+    def isOpened(self):
+        return self.opened
+
+    def release(self):
+        self.opened = False
+
+    def read(self, image=None):
+        if self.position >= self.limit:
+            return False, None
+        student, offset = divmod(self.position, self.hold + self.gap)
+        self.position += 1
+        frame = image if image is not None and image.shape == self.frame.shape else self.frame
+        frame[...] = self.background
+        if offset < self.hold:
+            height, width = frame.shape[:2]
+            x = width // 3 + offset * 3 + self.rng.randint(-2, 2)
+            y = height // 4 + self.rng.randint(-2, 2)
+            frame[y:y + self.code_size, x:x + self.code_size] = self.codes[self.names[student]]
+        return True, frame
+
+
+def run_decode_benchmark(args):
+    window = install_webview_stub()
+    sam = load_sam(args.sam)
+
+    decoded = {}
+    decode_calls = [0]
+    original_decode = sam.pyzbar.decode
+
+    def counting_decode(image, *decode_args, **decode_kwargs):
+        decode_calls[0] += 1
+        results = original_decode(image, *decode_args, **decode_kwargs)
+        for barcode in results:
+            payload = barcode.data.decode('utf-8')
+            decoded[payload] = decoded.get(payload, 0) + 1
+        return results
+
+    work_dir = tempfile.mkdtemp(prefix="sam_bench_")
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)
+    sam.pyzbar.decode = counting_decode
+    try:
+        write_settings({"camera_fps": 60, "qr_tracking": not args.no_tracking})
+        api = sam.QRScannerAPI()
+        names = student_names(args.students)
+        capture = StudentQueueCapture(names, hold=args.hold, gap=args.gap)
+
+        start = time.perf_counter()
+        api.cap = capture
+        api.camera_active = True
+        api._camera_wanted = True
+        api._camera_loop()
+        elapsed = time.perf_counter() - start
+
+        metrics = api.get_metrics()['metrics']
+        api.cleanup()
+
+        seen = [name for name in names if name in decoded]
+        successful_decodes = sum(decoded.get(name, 0) for name in names)
+        return {
+            'benchmark': 'decode',
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'sam': os.path.basename(args.sam),
+            'revision': git_revision(),
+            'params': {
+                'students': args.students,
+                'hold_frames': args.hold,
+                'gap_frames': args.gap,
+                'tracking': not args.no_tracking
+            },
+            'loop_s': round(elapsed, 3),
+            'frames': capture.position,
+            'decode_calls': decode_calls[0],
+            'students_decoded': len(seen),
+            'students_recorded': metrics['counters'].get('scans_recorded', 0),
+            # Every decoder call costs the same whether or not it finds a code
+            'decodes_per_student': round(decode_calls[0] / len(seen), 2) if seen else None,
+            'successful_decodes_per_student': round(successful_decodes / len(seen), 2) if seen else None,
+            'js_dispatches': window.calls,
+            'metrics': metrics
+        }
+    finally:
+        sam.pyzbar.decode = original_decode
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class DimFootage:
+    """Wraps a capture and degrades every frame the way a dark gate at 7 am does"""
+
+    def __init__(self, capture, brightness=0.3, contrast=0.5, blur=9, noise=6.0, seed=9):
+        import numpy as np
+        import cv2
+
+        self.cv2 = cv2
+        self.capture = capture
+        self.brightness = brightness
+        self.contrast = contrast
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.kernel = None
+        if blur > 1:
+            # Horizontal motion blur, the usual case for an ID card swung into view
+            self.kernel = np.zeros((blur, blur), np.float32)
+            self.kernel[blur // 2, :] = 1.0 / blur
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def release(self):
+        self.capture.release()
+
+    def read(self, image=None):
+        ret, frame = self.capture.read()
+        if not ret:
+            return ret, frame
+        cv2 = self.cv2
+        if self.kernel is not None:
+            frame = cv2.filter2D(frame, -1, self.kernel)
+        # Squash contrast around mid grey, then darken
+        frame = cv2.convertScaleAbs(frame, alpha=self.contrast * self.brightness,
+                                    beta=128 * (1 - self.contrast) * self.brightness)
+        if self.noise:
+            grain = self.rng.normal(0, self.noise, frame.shape).astype('int16')
+            frame = cv2.convertScaleAbs(frame.astype('int16') + grain)
+        return True, frame
+
+
+def run_lowlight_benchmark(args):
+    install_webview_stub()
+    sam = load_sam(args.sam)
+    import cv2
+
+    if args.video:
+        capture = cv2.VideoCapture(args.video)
+        expected = None
+    else:
+        names = student_names(args.students)
+        queue = StudentQueueCapture(names, hold=args.hold, gap=args.gap)
+        capture = DimFootage(queue, brightness=args.brightness, contrast=args.contrast,
+                             blur=args.blur, noise=args.noise)
+        expected = lambda position: divmod(position - 1, args.hold + args.gap)[1] < args.hold
+
+    metrics = sam.MetricsRegistry()
+    assist = sam.LowLightDecoder(args.budget_ms, metrics=metrics)
+    frames = code_frames = plain_hits = assisted_hits = 0
+    plain_latencies, assist_latencies = [], []
+    plain_found, assisted_found = set(), set()
+
+    while frames < args.max_frames:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames += 1
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        has_code = expected(queue.position) if expected else None
+        code_frames += bool(has_code)
+
+        elapsed, barcodes = timed(sam.pyzbar.decode, gray)
+        plain_latencies.append(elapsed)
+        if barcodes:
+            assist.reset()
+            plain_hits += 1
+            assisted_hits += 1
+            payloads = {barcode.data for barcode in barcodes}
+            plain_found.update(payloads)
+            assisted_found.update(payloads)
+            continue
+
+        elapsed, barcodes = timed(assist.decode, gray)
+        assist_latencies.append(elapsed)
+        if barcodes:
+            assisted_hits += 1
+            assisted_found.update(barcode.data for barcode in barcodes)
+    capture.release()
+
+    denominator = code_frames or frames
+    return {
+        'benchmark': 'lowlight',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'sam': os.path.basename(args.sam),
+        'revision': git_revision(),
+        'params': {
+            'video': args.video,
+            'students': None if args.video else args.students,
+            'brightness': args.brightness,
+            'contrast': args.contrast,
+            'blur': args.blur,
+            'noise': args.noise,
+            'budget_ms': args.budget_ms
+        },
+        'frames': frames,
+        'code_frames': code_frames if expected else None,
+        'plain_detection_rate': round(plain_hits / denominator, 3) if denominator else None,
+        'assisted_detection_rate': round(assisted_hits / denominator, 3) if denominator else None,
+        'codes_found_plain': len(plain_found),
+        'codes_found_assisted': len(assisted_found),
+        'plain_decode': percentiles(plain_latencies),
+        'assist_added': percentiles(assist_latencies),
+        'assist_stages': {name: hits for name, hits in assist.hits.items() if hits},
+        'metrics': metrics.snapshot()
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def print_summary(result):
+    print(f"[{result['benchmark']}] {result['sam']} @ {result['revision']}  {result['params']}")
+    if result['benchmark'] == 'camera':
+        print(f"  loop {result['loop_s']} s, peak traced {result['tracemalloc_peak_bytes']} bytes")
+        print(f"  transient per frame (median): {result['transient_bytes_per_frame']} bytes")
+        print(f"  retained per frame: {result['retained_bytes_per_frame']} bytes in "
+              f"{result['retained_blocks_per_frame']} blocks")
+        print(f"  gc: {result['gc_collections']} collections, pauses {result['gc_pause']}")
+        for label in ['capture', 'decode', 'encode']:
+            print(f"  {label}: {result['metrics']['latency'].get(label)}")
+        return
+    if result['benchmark'] == 'decode':
+        print(f"  {result['frames']} frames in {result['loop_s']} s, {result['decode_calls']} decoder calls")
+        print(f"  students decoded {result['students_decoded']}, recorded {result['students_recorded']}")
+        print(f"  decoder calls per unique student: {result['decodes_per_student']}"
+              f" ({result['successful_decodes_per_student']} successful)")
+        for label in ['decode', 'track']:
+            print(f"  {label}: {result['metrics']['latency'].get(label)}")
+        return
+    if result['benchmark'] == 'lowlight':
+        rate = f" of {result['code_frames']} frames with a code" if result['code_frames'] is not None else ""
+        print(f"  {result['frames']} frames{rate}")
+        print(f"  detection rate: plain {result['plain_detection_rate']}, "
+              f"assisted {result['assisted_detection_rate']}")
+        print(f"  codes found: plain {result['codes_found_plain']}, assisted {result['codes_found_assisted']}")
+        print(f"  plain decode: {result['plain_decode']}")
+        print(f"  assist added: {result['assist_added']}")
+        print(f"  winning stages: {result['assist_stages']}")
+        return
+    print(f"  startup {result['startup_s']} s, throughput {result['throughput_scans_per_s']} scans/s")
+    for label in ['record_attendance', 'load_today_records']:
+        print(f"  {label}: {result[label]}")
+    for label, summary in result['sf2'].items():
+        print(f"  sf2 {label}: {summary}")
+    print(f"  js dispatches: {result['js_dispatches']} ({result['js_bytes']} bytes)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SAM recording path and camera loop")
+    parser.add_argument("--sam", default=os.path.join(BASE_DIR, "sam v2.4.py"), help="SAM script to benchmark")
+    parser.add_argument("--output", default=RESULTS_FILE, help=f"results file (default: {RESULTS_FILE})")
+    # Also accepted after the benchmark name, as the flag-only form allowed
+    paths = argparse.ArgumentParser(add_help=False)
+    paths.add_argument("--sam", default=argparse.SUPPRESS)
+    paths.add_argument("--output", default=argparse.SUPPRESS)
+    benchmarks = parser.add_subparsers(dest="benchmark")
+
+    record = benchmarks.add_parser("record", parents=[paths], help="replay scan bursts into record_attendance (default)")
+    record.add_argument("--students", type=int, default=1200)
+    record.add_argument("--days", type=int, default=200, help="school days of history to seed")
+    record.add_argument("--scans", type=int, default=1000, help="unique students scanned in the replay")
+    record.add_argument("--burst", type=int, default=25, help="scans per burst")
+    record.add_argument("--burst-gap", type=float, default=0.0, help="seconds to pause between bursts")
+    record.add_argument("--duplicate-rate", type=float, default=0.1)
+    record.add_argument("--repeat", type=int, default=5, help="repetitions for load and SF2 timings")
+    record.add_argument("--skip-sf2", action="store_true")
+    record.add_argument("--seed", type=int, default=11)
+    record.set_defaults(handler=run_benchmark)
+
+    camera = benchmarks.add_parser("camera", parents=[paths], help="measure allocations and GC pauses in the camera loop")
+    camera.add_argument("--frames", type=int, default=600)
+    camera.add_argument("--video", help="video file to replay; synthetic 720p noise when omitted")
+    camera.add_argument("--preview-width", type=int, default=640)
+    camera.set_defaults(handler=run_camera_benchmark)
+
+    decode = benchmarks.add_parser("decode", parents=[paths], help="count full decodes per unique student in a scan queue")
+    decode.add_argument("--students", type=int, default=30)
+    decode.add_argument("--hold", type=int, default=45, help="frames each student holds their ID up")
+    decode.add_argument("--gap", type=int, default=10, help="empty frames between students")
+    decode.add_argument("--no-tracking", action="store_true", help="disable qr_tracking for a baseline")
+    decode.set_defaults(handler=run_decode_benchmark)
+
+    lowlight = benchmarks.add_parser("lowlight", parents=[paths], help="detection rate and added latency of the low-light assist")
+    lowlight.add_argument("--video", help="recorded dim footage to replay; synthetic gate queue when omitted")
+    lowlight.add_argument("--students", type=int, default=30)
+    lowlight.add_argument("--hold", type=int, default=20, help="frames each student holds their ID up")
+    lowlight.add_argument("--gap", type=int, default=10, help="empty frames between students")
+    lowlight.add_argument("--brightness", type=float, default=0.3, help="1.0 is the undimmed frame")
+    lowlight.add_argument("--contrast", type=float, default=0.5)
+    lowlight.add_argument("--blur", type=int, default=9, help="motion blur length in pixels")
+    lowlight.add_argument("--noise", type=float, default=6.0, help="sensor noise standard deviation")
+    lowlight.add_argument("--budget-ms", type=int, default=15)
+    lowlight.add_argument("--max-frames", type=int, default=5000)
+    lowlight.set_defaults(handler=run_lowlight_benchmark)
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not {"-h", "--help"} & set(argv) and not set(benchmarks.choices) & set(argv):
+        argv.insert(0, "record")
+    args = parser.parse_args(argv)
+    args.sam = os.path.abspath(args.sam)
+    args.output = os.path.abspath(args.output)
+
+    result = args.handler(args)
+    print_summary(result)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "a") as f:
+        f.write(json.dumps(result) + "\n")
+    print(f"Results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@ import webview
 import sqlite3
 import cv2
 from pyzbar import pyzbar
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import subprocess
 import platform
@@ -14,30 +14,2330 @@ from openpyxl import load_workbook
 from openpyxl.styles import Font, Alignment, Border, Side
 from openpyxl.drawing.image import Image
 from openpyxl.utils import get_column_letter
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 import shutil
 import gc
 import atexit
+import sys
+import traceback
+import gzip
+import struct
+import zlib
+import re
+import csv
+import hashlib
+import hmac
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import heapq
+import itertools
+import types
+import binascii
+import queue
+import urllib.request
+import urllib.error
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+class SettingsStore:
+    """settings.json with atomic multi-key writes, precompiled derived values and change subscribers"""
+    INT_KEYS = ["metrics_interval", "metrics_keep_days", "camera_fps", "duplicate_scan_timeout", "backup_interval",
+                "backup_keep", "camera_index", "school_year_start_month", "sync_port", "sync_interval",
+                "camera_warm_timeout", "preview_width", "camera_quality", "event_log_fsync",
+                "event_log_keep_days", "low_light_budget_ms"]
+    BOOL_KEYS = ["auto_backup", "sound_notifications", "visual_notifications", "auto_update_sf2",
+                 "window_always_on_top", "dark_mode", "sampling_profiler", "auto_archive", "qr_tracking",
+                 "event_log", "low_light_assist"]
+    RANGES = {
+        "camera_quality": (1, 100),
+        "camera_fps": (1, 60),
+        "preview_width": (160, 1920),
+        "duplicate_scan_timeout": (1, 30),
+        "metrics_interval": (60, 3600),
+        "metrics_keep_days": (1, 365),
+        "backup_interval": (1, 168),
+        "backup_keep": (1, 365),
+        "school_year_start_month": (1, 12),
+        "sync_interval": (1, 3600),
+        "camera_index": (0, 10),
+        "camera_warm_timeout": (0, 3600),
+        "event_log_fsync": (1, 300),
+        "event_log_keep_days": (1, 3650),
+        "low_light_budget_ms": (1, 100)
+    }
+    SYNC_ROLES = ["off", "station", "aggregator"]
+
+    def __init__(self, path, defaults):
+        self.path = path
+        self.defaults = defaults
+        self.values = {}
+        # Derived values are updated in place so hot loops can keep a reference
+        self.derived = types.SimpleNamespace()
+        self._subscribers = []
+        self._lock = threading.RLock()
+        self._day_cache = (None, None, None)
+
+    def load(self):
+        """Load settings from file, falling back to defaults"""
+        needs_save = False
+        try:
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            saved, needs_save = {}, True
+        except Exception as e:
+            print(f"Error loading settings: {e}")
+            saved, needs_save = {}, True
+
+        if "auto_save_interval" in saved:
+            # Renamed once the auto-save job only dumped metrics
+            saved.setdefault("metrics_interval", saved.pop("auto_save_interval"))
+            needs_save = True
+
+        merged = {**self.defaults, **saved}
+        try:
+            self.validate(merged)
+        except Exception as e:
+            print(f"Error validating settings: {e}")
+            merged = dict(self.defaults)
+            self.validate(merged)
+            needs_save = True
+
+        with self._lock:
+            self.values.clear()
+            self.values.update(merged)
+            self.compile()
+        if needs_save:
+            self.save()
+
+    def coerce(self, key, value):
+        """Convert a value from the frontend to the setting's type, raising ValueError if invalid"""
+        if key not in self.defaults:
+            raise KeyError(f"Unknown setting: {key}")
+        if key == "late_arrival_time":
+            datetime.strptime(value, "%H:%M")
+        elif key in ["date_format", "time_format"]:
+            datetime.now().strftime(value)
+        elif key == "sync_role":
+            if value not in self.SYNC_ROLES:
+                raise ValueError("must be off, station or aggregator")
+        elif key in self.INT_KEYS:
+            value = int(value)
+        elif key in self.BOOL_KEYS:
+            value = bool(value)
+        return value
+
+    def validate(self, values):
+        """Clamp ranges and repair invalid values in place"""
+        try:
+            datetime.strptime(values["late_arrival_time"], "%H:%M")
+        except (TypeError, ValueError):
+            values["late_arrival_time"] = self.defaults["late_arrival_time"]
+
+        for key, (low, high) in self.RANGES.items():
+            values[key] = max(low, min(high, int(values[key])))
+        if values["sync_role"] not in self.SYNC_ROLES:
+            values["sync_role"] = "off"
+        if not values["station_id"]:
+            values["station_id"] = platform.node() or "station"
+
+    def compile(self):
+        """Precompute values the hot paths need"""
+        derived = self.derived
+        derived.cutoff_time = datetime.strptime(self.values["late_arrival_time"], "%H:%M").time()
+        derived.fps_delay = 1.0 / self.values["camera_fps"]
+        derived.date_format = self.values["date_format"]
+        derived.time_format = self.values["time_format"]
+        derived.duplicate_scan_timeout = self.values["duplicate_scan_timeout"]
+        derived.jpeg_quality = self.values["camera_quality"]
+
+    def format_date(self, moment):
+        """Format a datetime's date, caching the string for the current day"""
+        day, date_format, text = self._day_cache
+        if day != moment.date() or date_format != self.derived.date_format:
+            day, date_format = moment.date(), self.derived.date_format
+            text = moment.strftime(date_format)
+            self._day_cache = (day, date_format, text)
+        return text
+
+    def seed_date(self, day, text, date_format):
+        """Prime the format_date cache with a date string formatted ahead of time"""
+        if date_format == self.derived.date_format:
+            self._day_cache = (day, date_format, text)
+
+    def save(self):
+        """Write settings atomically"""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_file = f"{self.path}.tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(self.values, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.path)
+            return {'success': True, 'message': 'Settings saved successfully'}
+        except Exception as e:
+            return {'success': False, 'message': f'Error saving settings: {str(e)}'}
+
+    def update(self, changes):
+        """Validate and apply several settings with one write; returns the keys that changed"""
+        with self._lock:
+            candidate = dict(self.values)
+            for key, value in changes.items():
+                try:
+                    candidate[key] = self.coerce(key, value)
+                except KeyError:
+                    raise
+                except Exception as e:
+                    raise ValueError(f"Invalid value for {key}: {str(e)}")
+            self.validate(candidate)
+
+            changed = {key: value for key, value in candidate.items() if self.values.get(key) != value}
+            if not changed:
+                return {}
+
+            previous = dict(self.values)
+            self.values.update(changed)
+            result = self.save()
+            if not result['success']:
+                self.values.clear()
+                self.values.update(previous)
+                raise OSError(result['message'])
+            self.compile()
+
+        self._notify(changed)
+        return changed
+
+    def reset(self):
+        return self.update(dict(self.defaults))
+
+    def subscribe(self, callback, keys=None):
+        """Call callback(changed) after updates touching keys (all keys when None)"""
+        self._subscribers.append((set(keys) if keys else None, callback))
+
+    def _notify(self, changed):
+        for keys, callback in list(self._subscribers):
+            relevant = {key: value for key, value in changed.items() if keys is None or key in keys}
+            if relevant:
+                try:
+                    callback(relevant)
+                except Exception as e:
+                    print(f"Settings subscriber error: {e}")
+
+
+class LatencyHistogram:
+    """HDR-style latency histogram with log-linear buckets in microseconds"""
+    SUB_BUCKET_BITS = 4  # 16 sub-buckets per power of two, ~6% relative error
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _bucket(self, micros):
+        """Return the lower bound of the bucket a value falls in"""
+        exponent = micros.bit_length() - 1
+        if exponent < self.SUB_BUCKET_BITS:
+            return micros
+        shift = exponent - self.SUB_BUCKET_BITS
+        return (micros >> shift) << shift
+
+    def record(self, seconds):
+        micros = max(1, int(seconds * 1_000_000))
+        key = self._bucket(micros)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.total += micros
+        if self.min is None or micros < self.min:
+            self.min = micros
+        if self.max is None or micros > self.max:
+            self.max = micros
+
+    def percentile(self, pct):
+        """Return the approximate latency in microseconds at the given percentile"""
+        if not self.count:
+            return 0
+        target = max(1, int(round(self.count * pct / 100.0)))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= target:
+                return min(key, self.max)
+        return self.max
+
+    def summary(self):
+        """Summarize the histogram in milliseconds"""
+        return {
+            'count': self.count,
+            'min_ms': round((self.min or 0) / 1000.0, 3),
+            'mean_ms': round(self.total / self.count / 1000.0, 3) if self.count else 0,
+            'p50_ms': round(self.percentile(50) / 1000.0, 3),
+            'p90_ms': round(self.percentile(90) / 1000.0, 3),
+            'p99_ms': round(self.percentile(99) / 1000.0, 3),
+            'max_ms': round((self.max or 0) / 1000.0, 3)
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe counters and latency histograms for the hot paths"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time_module.time()
+        self.counters = {}
+        self.histograms = {}
+        self._file_lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Time the wrapped block into the named histogram"""
+        start = time_module.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time_module.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'uptime_s': round(time_module.time() - self.started_at, 1),
+                'counters': dict(self.counters),
+                'latency': {name: h.summary() for name, h in self.histograms.items()}
+            }
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time_module.time()
+            self.counters.clear()
+            self.histograms.clear()
+
+    def dump(self, file_path, keep_days=None):
+        """Append the current snapshot as one JSON line, dropping lines older than keep_days"""
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        snapshot = self.snapshot()
+        with self._file_lock:
+            with open(file_path, 'a') as f:
+                f.write(json.dumps(snapshot) + "\n")
+            if keep_days:
+                self._prune(file_path, datetime.now() - timedelta(days=keep_days))
+        return snapshot
+
+    @staticmethod
+    def _prune(file_path, cutoff):
+        """Rewrite the file without lines older than cutoff
+
+        Only runs once the oldest line is a day past the cutoff, so the file is
+        rewritten about once a day rather than on every dump.
+        """
+        def timestamp(line):
+            try:
+                return datetime.fromisoformat(json.loads(line)['timestamp'])
+            except (ValueError, KeyError, TypeError):
+                return None  # unreadable lines are dropped by the next rewrite
+
+        with open(file_path, 'r') as f:
+            oldest = timestamp(f.readline())
+        if oldest and oldest >= cutoff - timedelta(days=1):
+            return
+        temp_path = file_path + ".tmp"
+        with open(file_path, 'r') as src, open(temp_path, 'w') as dst:
+            for line in src:
+                moment = timestamp(line)
+                if moment and moment >= cutoff:
+                    dst.write(line)
+        os.replace(temp_path, file_path)
+
+
+class SamplingProfiler:
+    """Periodically samples thread stacks and aggregates them as collapsed stacks"""
+
+    def __init__(self, interval=0.01, max_depth=30):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = {}
+        self.sample_count = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.samples.clear()
+        self.sample_count = 0
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = traceback.extract_stack(frame, limit=self.max_depth)
+                key = ';'.join(f"{os.path.basename(f.filename)}:{f.name}" for f in stack)
+                self.samples[key] = self.samples.get(key, 0) + 1
+            self.sample_count += 1
+
+    def write(self, file_path):
+        """Write samples in collapsed-stack format (flamegraph.pl / speedscope)"""
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'w') as f:
+            for stack, count in sorted(self.samples.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+        return file_path
+
+
+class JobScheduler:
+    """One timer thread for the day rollover and periodic jobs
+
+    Deadlines are wall-clock timestamps. The thread never sleeps longer than
+    max_sleep, so a deadline that passes while the PC was suspended fires soon
+    after resume, and wall-clock jumps (NTP, manual changes, DST) are detected
+    by comparing the wall and monotonic clocks and reported to on_clock_jump.
+    """
+
+    def __init__(self, max_sleep=15.0, jump_threshold=5.0, on_clock_jump=None):
+        self.max_sleep = max_sleep
+        self.jump_threshold = jump_threshold
+        self.on_clock_jump = on_clock_jump
+        self._heap = []
+        self._jobs = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def schedule_at(self, name, when, func, interval=None, threaded=False):
+        """Run func at wall-clock time when, then every interval seconds if given; replaces a job of the same name"""
+        entry = [when, next(self._counter), name, func, interval, threaded, True]
+        with self._lock:
+            old = self._jobs.get(name)
+            if old:
+                old[6] = False
+            self._jobs[name] = entry
+            heapq.heappush(self._heap, entry)
+        self._wake_event.set()
+
+    def schedule_every(self, name, interval, func, first_delay=None, threaded=False):
+        delay = interval if first_delay is None else first_delay
+        self.schedule_at(name, time_module.time() + delay, func, interval=interval, threaded=threaded)
+
+    def cancel(self, name):
+        with self._lock:
+            entry = self._jobs.pop(name, None)
+            if entry:
+                entry[6] = False
+
+    def next_run(self, name):
+        entry = self._jobs.get(name)
+        return entry[0] if entry else None
+
+    def _run(self):
+        last_wall, last_mono = time_module.time(), time_module.monotonic()
+        while not self._stop_event.is_set():
+            with self._lock:
+                while self._heap and not self._heap[0][6]:
+                    heapq.heappop(self._heap)
+                delay = self._heap[0][0] - time_module.time() if self._heap else self.max_sleep
+
+            if delay > 0:
+                self._wake_event.wait(min(delay, self.max_sleep))
+                self._wake_event.clear()
+            if self._stop_event.is_set():
+                break
+
+            wall, mono = time_module.time(), time_module.monotonic()
+            drift = (wall - last_wall) - (mono - last_mono)
+            last_wall, last_mono = wall, mono
+            if abs(drift) > self.jump_threshold and self.on_clock_jump:
+                try:
+                    self.on_clock_jump(drift)
+                except Exception as e:
+                    print(f"Clock jump handler error: {e}")
+
+            self._run_due(time_module.time())
+
+    def _run_due(self, now):
+        due = []
+        with self._lock:
+            while self._heap and (not self._heap[0][6] or self._heap[0][0] <= now):
+                entry = heapq.heappop(self._heap)
+                if not entry[6]:
+                    continue
+                due.append(entry)
+                if entry[4]:
+                    # Next run is relative to now so a long suspend does not replay missed runs
+                    entry = [now + entry[4], next(self._counter)] + entry[2:]
+                    self._jobs[entry[2]] = entry
+                    heapq.heappush(self._heap, entry)
+                else:
+                    self._jobs.pop(entry[2], None)
+
+        for _, _, name, func, _, threaded, _ in due:
+            if threaded:
+                threading.Thread(target=self._call, args=(name, func), daemon=True).start()
+            else:
+                self._call(name, func)
+
+    def _call(self, name, func):
+        try:
+            func()
+        except Exception as e:
+            print(f"Scheduled job {name} failed: {e}")
+
+
+class BackupService:
+    """Background online backups of the attendance database into rotated gzip snapshots"""
+
+    def __init__(self, db_path, backup_dir, interval_hours=24, keep=14, pages_per_step=64,
+                 step_pause=0.005, metrics=None):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval = interval_hours * 3600
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.metrics = metrics
+        self.last_result = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Allow backups to run (they are scheduled by the owner's JobScheduler)"""
+        self._stop_event.clear()
+
+    def stop(self):
+        """Cancel any backup in progress and refuse new ones"""
+        self._stop_event.set()
+
+    def reconfigure(self, interval_hours=None, keep=None):
+        if interval_hours is not None:
+            self.interval = interval_hours * 3600
+        if keep is not None:
+            self.keep = keep
+
+    def seconds_until_due(self):
+        """Seconds until the next backup is due, based on the newest snapshot"""
+        snapshots = self.list_snapshots()
+        if not snapshots:
+            return 0
+        return max(0, self.interval - (time_module.time() - snapshots[0]['mtime']))
+
+    def list_snapshots(self):
+        """List snapshots newest first"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        snapshots = []
+        for entry in os.scandir(self.backup_dir):
+            if entry.is_file() and entry.name.startswith("attendance_") and entry.name.endswith(".db.gz"):
+                stat = entry.stat()
+                snapshots.append({'file': entry.path, 'size': stat.st_size, 'mtime': stat.st_mtime})
+        snapshots.sort(key=lambda item: item['mtime'], reverse=True)
+        return snapshots
+
+    def backup(self):
+        """Take one online backup, verify it and rotate old snapshots"""
+        if self._stop_event.is_set():
+            return {'success': False, 'message': 'Backups are stopped'}
+        if not self._lock.acquire(blocking=False):
+            return {'success': False, 'message': 'Backup already in progress'}
+
+        def pause(status, remaining, total):
+            # Yield between page steps so the scanner's writes are never held up
+            if self._stop_event.is_set():
+                raise InterruptedError("Backup cancelled")
+            time_module.sleep(self.step_pause)
+
+        temp_file = snapshot_file = None
+        start = time_module.perf_counter()
+        try:
+            # Inside the try so a missing or unwritable folder still releases the lock
+            os.makedirs(self.backup_dir, exist_ok=True)
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            temp_file = os.path.join(self.backup_dir, f".attendance_{stamp}.db.tmp")
+            snapshot_file = os.path.join(self.backup_dir, f"attendance_{stamp}.db.gz")
+            source = sqlite3.connect(self.db_path)
+            target = sqlite3.connect(temp_file)
+            try:
+                source.backup(target, pages=self.pages_per_step, progress=pause)
+                check = target.execute("PRAGMA integrity_check").fetchone()[0]
+            finally:
+                target.close()
+                source.close()
+
+            if check != "ok":
+                raise sqlite3.DatabaseError(f"Integrity check failed: {check}")
+
+            with open(temp_file, 'rb') as src, gzip.open(snapshot_file, 'wb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            self.rotate()
+
+            self.last_result = {
+                'success': True,
+                'message': 'Backup completed',
+                'file': snapshot_file,
+                'duration_s': round(time_module.perf_counter() - start, 3)
+            }
+            if self.metrics:
+                self.metrics.incr('backups')
+                self.metrics.observe('backup', time_module.perf_counter() - start)
+        except Exception as e:
+            if snapshot_file and os.path.exists(snapshot_file):
+                os.remove(snapshot_file)
+            self.last_result = {'success': False, 'message': f'Backup failed: {str(e)}'}
+            if self.metrics:
+                self.metrics.incr('backup_failures')
+            print(self.last_result['message'])
+        finally:
+            if temp_file and os.path.exists(temp_file):
+                try:
+                    os.remove(temp_file)
+                except OSError:
+                    pass
+            self._lock.release()
+
+        return self.last_result
+
+    def rotate(self):
+        """Delete snapshots beyond the retention count"""
+        for snapshot in self.list_snapshots()[self.keep:]:
+            try:
+                os.remove(snapshot['file'])
+            except OSError as e:
+                print(f"Error removing old backup {snapshot['file']}: {e}")
+
+
+class AttendanceArchive:
+    """Moves closed school years out of the live table into per-year SQLite files"""
+    ARCHIVE_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS attendance (
+            date TEXT,
+            time TEXT,
+            name TEXT,
+            UNIQUE(date, name)
+        )
+    """
+
+    def __init__(self, db_path, archive_dir, date_format, start_month=6, metrics=None):
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.date_format = date_format
+        self.start_month = start_month
+        self.metrics = metrics
+        self._lock = threading.Lock()
+
+    def school_year_of(self, day):
+        """Return the starting calendar year of the school year containing day"""
+        return day.year if day.month >= self.start_month else day.year - 1
+
+    def archive_path(self, school_year):
+        return os.path.join(self.archive_dir, f"attendance_SY{school_year}-{school_year + 1}.db")
+
+    def list_archives(self):
+        """Return {school_year: path} for every archive file on disk"""
+        archives = {}
+        if not os.path.isdir(self.archive_dir):
+            return archives
+        for entry in os.scandir(self.archive_dir):
+            name = entry.name
+            if name.startswith("attendance_SY") and name.endswith(".db"):
+                try:
+                    archives[int(name[len("attendance_SY"):len("attendance_SY") + 4])] = entry.path
+                except ValueError:
+                    continue
+        return archives
+
+    def _group_dates(self, date_strings, unparsed=None):
+        """Group date strings by school year; ones that do not parse are skipped (and collected in unparsed)"""
+        by_year = {}
+        for date_str in date_strings:
+            try:
+                day = datetime.strptime(date_str, self.date_format).date()
+            except (TypeError, ValueError):
+                if unparsed is not None:
+                    unparsed.append(date_str)
+                continue
+            by_year.setdefault(self.school_year_of(day), []).append(date_str)
+        return by_year
+
+    def archive_closed_years(self, chunk_size=50, backup=None):
+        """Move every school year before the current one into its archive file
+
+        backup, when given, is called first and archiving is skipped unless it
+        succeeds. Only live rows identical to their archived copy are deleted; a
+        row whose date and name are already archived with another time is left
+        in place and reported as a conflict.
+        """
+        if not self._lock.acquire(blocking=False):
+            return {'success': False, 'message': 'Archiving already in progress'}
+
+        current_year = self.school_year_of(datetime.now().date())
+        archived, conflicts, unparsed = {}, {}, []
+        try:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            try:
+                dates = [row[0] for row in conn.execute("SELECT DISTINCT date FROM attendance")]
+                closed = {year: ds for year, ds in self._group_dates(dates, unparsed).items() if year < current_year}
+
+                if closed and backup:
+                    result = backup()
+                    if not result['success']:
+                        return {'success': False, 'message': f"Archiving skipped: {result['message']}"}
+
+                for year, year_dates in sorted(closed.items()):
+                    archive_file = self.archive_path(year)
+                    archive_conn = sqlite3.connect(archive_file)
+                    try:
+                        archive_conn.execute(self.ARCHIVE_SCHEMA)
+                        archive_conn.commit()
+                    finally:
+                        archive_conn.close()
+
+                    conn.execute("ATTACH DATABASE ? AS archive", (archive_file,))
+                    try:
+                        moved = conflicted = 0
+                        # Short transactions so the scanner's connection is never locked out for long
+                        for i in range(0, len(year_dates), chunk_size):
+                            chunk = year_dates[i:i + chunk_size]
+                            placeholders = ','.join('?' for _ in chunk)
+                            with conn:
+                                conn.execute(f"""
+                                    INSERT OR IGNORE INTO archive.attendance (date, time, name)
+                                    SELECT date, time, name FROM main.attendance WHERE date IN ({placeholders})
+                                """, chunk)
+                                moved += conn.execute(f"""
+                                    DELETE FROM main.attendance WHERE date IN ({placeholders}) AND EXISTS (
+                                        SELECT 1 FROM archive.attendance a WHERE a.date = main.attendance.date
+                                        AND a.name = main.attendance.name AND a.time IS main.attendance.time)
+                                """, chunk).rowcount
+                                conflicted += conn.execute(
+                                    f"SELECT COUNT(*) FROM main.attendance WHERE date IN ({placeholders})", chunk
+                                ).fetchone()[0]
+                    finally:
+                        conn.execute("DETACH DATABASE archive")
+                    archived[f"{year}-{year + 1}"] = moved
+                    if conflicted:
+                        conflicts[f"{year}-{year + 1}"] = conflicted
+
+                if archived:
+                    conn.execute("VACUUM")
+            finally:
+                conn.close()
+
+            if self.metrics:
+                self.metrics.incr('archived_rows', sum(archived.values()))
+            if not archived:
+                message = 'No closed school years to archive'
+            else:
+                message = f'Archived {sum(archived.values())} records from {len(archived)} school year(s)'
+            if conflicts:
+                message += (f'; {sum(conflicts.values())} record(s) kept in the live table because the archive'
+                            f' already has them with a different time')
+            if unparsed:
+                message += f'; {len(unparsed)} date(s) do not match the date format and were not archived'
+            return {
+                'success': True,
+                'message': message,
+                'archived': archived,
+                'conflicts': conflicts,
+                'unparsed_dates': unparsed
+            }
+        except Exception as e:
+            return {'success': False, 'message': f'Error archiving attendance: {str(e)}'}
+        finally:
+            self._lock.release()
+
+    def fetch(self, date_strings, columns="date, name, time"):
+        """Fetch rows for the given dates from the live table and any archives covering them"""
+        date_strings = list(date_strings)
+        if not date_strings:
+            return []
+
+        archives = self.list_archives()
+        needed = [year for year in self._group_dates(date_strings) if year in archives]
+        placeholders = ','.join('?' for _ in date_strings)
+
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            sources = ["main.attendance"]
+            for year in needed:
+                alias = f"sy{year}"
+                conn.execute(f"ATTACH DATABASE ? AS {alias}", (archives[year],))
+                sources.append(f"{alias}.attendance")
+
+            query = " UNION ALL ".join(
+                f"SELECT {columns} FROM {source} WHERE date IN ({placeholders})" for source in sources
+            )
+            return conn.execute(query, date_strings * len(sources)).fetchall()
+        finally:
+            conn.close()
+
+
+class AttendanceExporter:
+    """Streams attendance history from the live table and archives to CSV, Parquet or Arrow IPC"""
+    FORMATS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+    COLUMNS = ["date", "time", "name", "section"]
+
+    def __init__(self, archive, chunk_size=5000, metrics=None):
+        self.archive = archive
+        self.chunk_size = chunk_size
+        self.metrics = metrics
+
+    def _open(self):
+        """Connect with every archive attached and the selected dates staged in a temp table"""
+        conn = sqlite3.connect(self.archive.db_path, timeout=10)
+        sources = ["main.attendance"]
+        for year, path in sorted(self.archive.list_archives().items()):
+            alias = f"sy{year}"
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+            sources.append(f"{alias}.attendance")
+        return conn, sources
+
+    def _stage_dates(self, conn, sources, start, end):
+        """Stored dates are not sortable, so filter distinct dates in Python and join on an ISO key"""
+        conn.execute("CREATE TEMP TABLE export_dates (date TEXT PRIMARY KEY, iso TEXT)")
+        distinct = set()
+        for source in sources:
+            distinct.update(row[0] for row in conn.execute(f"SELECT DISTINCT date FROM {source}"))
+
+        staged = []
+        for date_str in distinct:
+            try:
+                day = datetime.strptime(date_str, self.archive.date_format).date()
+            except (TypeError, ValueError):
+                continue
+            if (start is None or day >= start) and (end is None or day <= end):
+                staged.append((date_str, day.isoformat()))
+        conn.executemany("INSERT INTO export_dates (date, iso) VALUES (?, ?)", staged)
+        return len(staged)
+
+    def iter_chunks(self, start=None, end=None, sections=None):
+        """Yield lists of (iso_date, time, name, section) rows, at most chunk_size at a time"""
+        conn, sources = self._open()
+        try:
+            if not self._stage_dates(conn, sources, start, end):
+                return
+
+            # Join per source so each lookup uses the UNIQUE(date, name) index
+            union = " UNION ALL ".join(
+                f"SELECT d.iso AS iso, t.time AS time, t.name AS name "
+                f"FROM export_dates AS d JOIN {source} AS t ON t.date = d.date"
+                for source in sources
+            )
+            conn.execute("CREATE TEMP TABLE export_sections (name TEXT PRIMARY KEY, section TEXT)")
+            if conn.execute(
+                "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'students'"
+            ).fetchone():
+                conn.execute("""
+                    INSERT INTO export_sections (name, section)
+                    SELECT name, MAX(section) FROM main.students GROUP BY name
+                """)
+            query = f"""
+                SELECT a.iso, a.time, a.name, COALESCE(s.section, '')
+                FROM ({union}) AS a
+                LEFT JOIN export_sections AS s ON s.name = a.name
+            """
+            params = []
+            if sections:
+                query += f" WHERE s.section IN ({','.join('?' for _ in sections)})"
+                params.extend(sections)
+            query += " ORDER BY a.iso, a.time, a.name"
+
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def _write_csv(self, tmp_file, chunks):
+        rows_written = 0
+        with open(tmp_file, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.COLUMNS)
+            for rows in chunks:
+                writer.writerows(rows)
+                rows_written += len(rows)
+        return rows_written
+
+    def _write_arrow(self, tmp_file, chunks, fmt):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError(f"pyarrow is required for {fmt} export (pip install pyarrow)")
+
+        schema = pa.schema([(column, pa.string()) for column in self.COLUMNS])
+        if fmt == "parquet":
+            writer = pq.ParquetWriter(tmp_file, schema, compression="zstd")
+        else:
+            writer = pa.ipc.new_file(tmp_file, schema)
+
+        rows_written = 0
+        try:
+            for rows in chunks:
+                columns = list(zip(*rows))
+                batch = pa.record_batch([pa.array(column, pa.string()) for column in columns], schema=schema)
+                if fmt == "parquet":
+                    writer.write_batch(batch)
+                else:
+                    writer.write(batch)
+                rows_written += len(rows)
+        finally:
+            writer.close()
+        return rows_written
+
+    def export(self, file_path, fmt="csv", start=None, end=None, sections=None):
+        """Write the filtered history to file_path; memory stays bounded by chunk_size"""
+        if fmt not in self.FORMATS:
+            return {'success': False, 'message': f'Unknown export format: {fmt}'}
+
+        started = time_module.perf_counter()
+        tmp_file = file_path + ".tmp"
+        try:
+            directory = os.path.dirname(file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            chunks = self.iter_chunks(start, end, sections)
+            if fmt == "csv":
+                rows_written = self._write_csv(tmp_file, chunks)
+            else:
+                rows_written = self._write_arrow(tmp_file, chunks, fmt)
+            os.replace(tmp_file, file_path)
+        except Exception as e:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            return {'success': False, 'message': f'Error exporting attendance: {str(e)}'}
+
+        if self.metrics:
+            self.metrics.incr('exported_rows', rows_written)
+        return {
+            'success': True,
+            'message': f'Exported {rows_written} records to {os.path.basename(file_path)}',
+            'file': file_path,
+            'rows': rows_written,
+            'duration_s': round(time_module.perf_counter() - started, 2)
+        }
+
+
+class SF2Layout:
+    """Header row, date columns and name rows of an SF2 worksheet, detected once per template"""
+    HEADER_SCAN_ROWS = 30
+    VERSION = 3  # bumped when detection changes so cached layouts are re-detected
+    # Only rows that start with the label: "Totalan, Maria" is a learner, and totals
+    # labelled mid-text are caught by their formulas below
+    LABEL_PATTERN = re.compile(r"^\W*(total|combined)\b|===|\bnames?\b|^\s*(male|female)\s*$", re.IGNORECASE)
+    COMBINED_PATTERN = re.compile(r"^\W*combined", re.IGNORECASE)
+
+    def __init__(self, header_row, name_column, date_columns, name_rows):
+        self.header_row = header_row
+        self.name_column = name_column
+        self.date_columns = date_columns  # [(column, iso_date)]
+        self.name_rows = name_rows  # [(row, name)]
+        self._maps = {}
+
+    @staticmethod
+    def _as_date(value, date_format):
+        if isinstance(value, datetime):
+            return value.date()
+        if hasattr(value, "isoformat") and hasattr(value, "year"):
+            return value
+        if isinstance(value, str) and value.strip():
+            try:
+                return datetime.strptime(value.strip(), date_format).date()
+            except ValueError:
+                return None
+        return None
+
+    @classmethod
+    def detect(cls, file_path, date_format):
+        """Scan the active sheet once: the row with the most dates is the header, names sit left of it"""
+        wb = load_workbook(file_path, read_only=True, data_only=False)
+        try:
+            rows = [tuple(row) for row in wb.active.iter_rows(values_only=True)]
+        finally:
+            wb.close()
+
+        header_row, date_columns = None, []
+        for index, row in enumerate(rows[:cls.HEADER_SCAN_ROWS]):
+            found = []
+            for column, value in enumerate(row, start=1):
+                day = cls._as_date(value, date_format)
+                if day:
+                    found.append((column, day.isoformat()))
+            if len(found) > len(date_columns):
+                header_row, date_columns = index + 1, found
+        if not date_columns:
+            raise ValueError("No date header row found in SF2")
+
+        def is_text(value):
+            return isinstance(value, str) and value.strip() and not value.startswith("=")
+
+        body = rows[header_row:]
+        first_date_column = date_columns[0][0]
+        counts = {
+            column: sum(1 for row in body if len(row) >= column and is_text(row[column - 1]))
+            for column in range(1, first_date_column)
+        }
+        if not counts or not max(counts.values()):
+            raise ValueError("No name column found in SF2")
+        name_column = max(counts, key=counts.get)
+
+        # The table ends at the combined total, or at the first blank row once the male and
+        # female blocks have both started; guidelines and signatures follow below it
+        name_rows, blocks, in_block = [], 0, False
+        for offset, row in enumerate(body):
+            value = row[name_column - 1] if len(row) >= name_column else None
+            if is_text(value) and cls.COMBINED_PATTERN.search(value):
+                break
+            if value is None or (isinstance(value, str) and not value.strip()):
+                if blocks >= 2:
+                    break
+                in_block = False
+                continue
+            if not is_text(value) or cls.LABEL_PATTERN.search(value):
+                in_block = False
+                continue
+            # Totals rows carry formulas in every date column
+            date_values = [row[column - 1] if len(row) >= column else None for column, _ in date_columns]
+            if all(isinstance(v, str) and v.startswith("=") for v in date_values):
+                in_block = False
+                continue
+            if not in_block:
+                blocks += 1
+                in_block = True
+            name_rows.append((header_row + 1 + offset, value.strip()))
+
+        return cls(header_row, name_column, date_columns, name_rows)
+
+    def name_blocks(self):
+        """Contiguous (first_row, last_row) runs of name rows"""
+        blocks = []
+        for row, _ in self.name_rows:
+            if blocks and blocks[-1][1] == row - 1:
+                blocks[-1][1] = row
+            else:
+                blocks.append([row, row])
+        return [tuple(block) for block in blocks]
+
+    def date_strings(self, date_format):
+        return [datetime.strptime(iso, "%Y-%m-%d").strftime(date_format) for _, iso in self.date_columns]
+
+    def cell_map(self, date_format):
+        """(name, date_str) -> [(row, column)]; a name listed twice maps to both rows"""
+        cells = self._maps.get(date_format)
+        if cells is None:
+            cells = {}
+            dates = list(zip([column for column, _ in self.date_columns], self.date_strings(date_format)))
+            for row, name in self.name_rows:
+                for column, date_str in dates:
+                    cells.setdefault((name, date_str), []).append((row, column))
+            self._maps[date_format] = cells
+        return cells
+
+    def to_dict(self):
+        return {
+            'header_row': self.header_row,
+            'name_column': self.name_column,
+            'date_columns': self.date_columns,
+            'name_rows': self.name_rows
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['header_row'], data['name_column'],
+                   [tuple(item) for item in data['date_columns']],
+                   [tuple(item) for item in data['name_rows']])
+
+
+class SF2LayoutCache:
+    """SF2 layouts keyed by template mtime and content hash, persisted across restarts"""
+
+    def __init__(self, cache_file=None, metrics=None):
+        self.cache_file = cache_file
+        self.metrics = metrics
+        self._entries = {}
+        self._lock = threading.Lock()
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    @staticmethod
+    def _digest(file_path):
+        sha1 = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                sha1.update(block)
+        return sha1.hexdigest()
+
+    def _save(self):
+        if not self.cache_file:
+            return
+        # Parsed layouts stay in memory only
+        entries = {
+            key: {k: v for k, v in entry.items() if k != '_layout'} for key, entry in self._entries.items()
+        }
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            print(f"Error saving SF2 layout cache: {e}")
+
+    def get(self, file_path, date_format):
+        """Return the layout, re-detecting only when the template's content has changed"""
+        key = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['date_format'] == date_format and entry.get('version') == SF2Layout.VERSION:
+                if entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                    return self._hit(entry)
+                digest = self._digest(file_path)
+                if entry['sha1'] == digest:
+                    # Touched or copied but unchanged
+                    entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                    self._save()
+                    return self._hit(entry)
+            else:
+                digest = self._digest(file_path)
+
+            if self.metrics:
+                self.metrics.incr('sf2_layout_misses')
+            layout = SF2Layout.detect(file_path, date_format)
+            self._entries[key] = {
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'sha1': digest,
+                'date_format': date_format,
+                'version': SF2Layout.VERSION,
+                'layout': layout.to_dict(),
+                '_layout': layout
+            }
+            self._save()
+            return layout
+
+    def _hit(self, entry):
+        if self.metrics:
+            self.metrics.incr('sf2_layout_hits')
+        if '_layout' not in entry:
+            entry['_layout'] = SF2Layout.from_dict(entry['layout'])
+        return entry['_layout']
+
+    def refresh(self, file_path):
+        """Re-key the cached layout after SAM itself saved values into the template"""
+        key = os.path.abspath(file_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return
+            stat = os.stat(file_path)
+            entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size, sha1=self._digest(file_path))
+            self._save()
+
+
+class SF2Updater:
+    """Writes attendance into the SF2 workbook: 0 or "x" for each day, then late markers
+
+    One lock covers every load-modify-save, so the window, the aggregator's
+    /sf2 handler and anything else sharing an updater never overlap on the
+    workbook or on its backup copy.
+    """
+
+    def __init__(self, sf2_file, settings, layouts, late_image="_internal/data/late.png", metrics=None):
+        self.sf2_file = sf2_file
+        self.settings = settings  # SettingsStore
+        self.layouts = layouts
+        self.late_image = late_image
+        self.metrics = metrics
+        self.lock = threading.RLock()
+
+    @contextmanager
+    def open_workbook(self, file_path):
+        """Context manager for safely opening Excel workbooks"""
+        wb = None
+        try:
+            if os.path.exists(file_path):
+                os.chmod(file_path, 0o666)
+            wb = load_workbook(file_path, data_only=False)
+            yield wb
+        except PermissionError as e:
+            raise Exception(f"File is locked or in use: {e}")
+        finally:
+            if wb:
+                try:
+                    wb.close()
+                except:
+                    pass
+                wb = None
+            gc.collect()
+            time_module.sleep(0.2)
+    
+    def update(self, source):
+        """Both passes under one lock; the late pass re-marks cells the first one resets to 0"""
+        with self.lock:
+            with self._timer('sf2_update'):
+                result = self.update_automated(source)
+            if not result['success']:
+                return result
+            with self._timer('sf2_late_arrivals'):
+                return self.update_late_arrivals(source)
+
+    def _timer(self, name):
+        return self.metrics.timer(name) if self.metrics else nullcontext()
+
+    def update_automated(self, source):
+        """Mark each day 0 (present) or "x" (absent)"""
+        with self.lock:
+            return self._update_automated(source)
+
+    def _update_automated(self, source):
+        backup_file = f"{self.sf2_file}.backup"
+        try:
+            sf2_file = self.sf2_file
+            
+            if not os.path.exists(sf2_file):
+                return {'success': False, 'message': f'{os.path.basename(sf2_file)} not found'}
+            
+            shutil.copy2(sf2_file, backup_file)
+            
+            date_format = self.settings.values["date_format"]
+            try:
+                layout = self.layouts.get(sf2_file, date_format)
+            except ValueError:
+                return {'success': False, 'message': 'No valid dates found in SF2'}
+            cells = layout.cell_map(date_format)
+            
+            present = {(name, date) for date, name, _ in source.fetch(layout.date_strings(date_format))}
+            
+            with self.open_workbook(sf2_file) as wb:
+                ws = wb.active
+                changes_made = 0
+                
+                for key, coordinates in cells.items():
+                    new_value = 0 if key in present else "x"
+                    for row, col in coordinates:
+                        cell = ws.cell(row=row, column=col)
+                        
+                        if cell.data_type == 'f':
+                            continue
+                        
+                        if cell.value != new_value:
+                            cell.value = new_value
+                            if new_value == "x":
+                                cell.font = Font(color="000000")
+                            changes_made += 1
+                
+                if changes_made > 0:
+                    wb.save(sf2_file)
+                    self.layouts.refresh(sf2_file)
+                    return {'success': True, 'message': f'Updated {changes_made} cells in SF2'}
+                else:
+                    return {'success': True, 'message': 'SF2 already up-to-date'}
+                    
+        except Exception as e:
+            if os.path.exists(backup_file):
+                shutil.copy2(backup_file, sf2_file)
+            return {'success': False, 'message': f'Error updating SF2: {str(e)}'}
+        finally:
+            if os.path.exists(backup_file):
+                try:
+                    os.remove(backup_file)
+                except:
+                    pass
+    
+    def update_late_arrivals(self, source):
+        """Replace the 0 of late arrivals with a black triangle"""
+        with self.lock:
+            return self._update_late_arrivals(source)
+
+    def _update_late_arrivals(self, source):
+        backup_file = f"{self.sf2_file}.backup"
+        try:
+            sf2_file = self.sf2_file
+            
+            if not os.path.exists(sf2_file):
+                return {'success': False, 'message': f'{os.path.basename(sf2_file)} not found'}
+            
+            shutil.copy2(sf2_file, backup_file)
+            
+            date_format = self.settings.values["date_format"]
+            try:
+                layout = self.layouts.get(sf2_file, date_format)
+            except ValueError as e:
+                return {'success': False, 'message': str(e)}
+            cells = layout.cell_map(date_format)
+            
+            with self.open_workbook(sf2_file) as wb:
+                ws = wb.active
+                late_arrivals_count = 0
+                # Use the configurable late arrival time
+                cutoff_time = self.settings.derived.cutoff_time
+                
+                # Only attendance rows need visiting; the map gives their cells directly
+                for date_str, name, attendance_time_str in source.fetch(layout.date_strings(date_format)):
+                    coordinates = cells.get((name, date_str))
+                    if not coordinates or not attendance_time_str:
+                        continue
+                    
+                    try:
+                        attendance_time = datetime.strptime(attendance_time_str, self.settings.values["time_format"]).time()
+                    except (ValueError, TypeError) as e:
+                        print(f"Error parsing time for {name} on {date_str}: {e}")
+                        continue
+                    
+                    if attendance_time <= cutoff_time:
+                        continue
+                    
+                    for row, col in coordinates:
+                        cell = ws.cell(row=row, column=col)
+                        
+                        if cell.data_type == 'f':
+                            continue
+                        
+                        cell.value = None
+                        cell.number_format = 'General'
+                        
+                        self.add_late_marker_to_cell(ws, cell)
+                        late_arrivals_count += 1
+                
+                if late_arrivals_count > 0:
+                    wb.save(sf2_file)
+                    self.layouts.refresh(sf2_file)
+                    return {'success': True, 'message': f'Added {late_arrivals_count} late arrival markers'}
+                else:
+                    return {'success': True, 'message': 'No late arrivals found'}
+                    
+        except Exception as e:
+            if os.path.exists(backup_file):
+                shutil.copy2(backup_file, sf2_file)
+            return {'success': False, 'message': f'Error updating late arrivals: {str(e)}'}
+        finally:
+            if os.path.exists(backup_file):
+                try:
+                    os.remove(backup_file)
+                except:
+                    pass
+    
+    def add_late_marker_to_cell(self, worksheet, cell):
+        """Add a black triangle image in the upper left corner of the cell"""
+        try:
+            triangle_image_path = self.late_image
+            
+            if not os.path.exists(triangle_image_path):
+                print(f"Triangle image not found at {triangle_image_path}")
+                self.add_triangle_border_fallback(cell)
+                return
+            
+            img = Image(triangle_image_path)
+            cell_coord = cell.coordinate
+            img.anchor = cell_coord
+            worksheet.add_image(img)
+            
+        except Exception as img_error:
+            print(f"Error adding image: {img_error}")
+            self.add_triangle_border_fallback(cell)
+    
+    def add_triangle_border_fallback(self, cell):
+        """Fallback method to visually indicate late arrival with borders"""
+        try:
+            thin_border = Side(border_style="thin", color="000000")
+            cell.border = Border(top=thin_border, left=thin_border)
+            cell.comment = "Late arrival"
+            
+        except Exception as e:
+            print(f"Error adding fallback border: {e}")
+
+
+class EventLog:
+    """Append-only binary log of every scan outcome, one file per day"""
+    MAGIC = b"SAMEVT1\n"
+    # Record frame: payload length, CRC32 of payload
+    FRAME = struct.Struct("<HI")
+    # Payload head: timestamp, event type, source; followed by code, name, detail strings
+    HEAD = struct.Struct("<dBB")
+    TYPES = ["recorded", "duplicate", "unknown_code", "decode_error", "error", "camera"]
+    SOURCES = ["scan", "manual", "system"]
+    MAX_FIELD = 1024
+
+    def __init__(self, log_dir, keep_days=90, metrics=None):
+        self.log_dir = log_dir
+        self.keep_days = keep_days
+        self.metrics = metrics
+        self._file = None
+        self._day = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def path_for(self, day):
+        return os.path.join(self.log_dir, f"events_{day.strftime('%Y%m%d')}.bin")
+
+    def list_days(self):
+        """Return {date: path} for every daily log on disk"""
+        days = {}
+        if not os.path.isdir(self.log_dir):
+            return days
+        for entry in os.scandir(self.log_dir):
+            if entry.name.startswith("events_") and entry.name.endswith(".bin"):
+                try:
+                    days[datetime.strptime(entry.name[7:15], "%Y%m%d").date()] = entry.path
+                except ValueError:
+                    continue
+        return days
+
+    def _roll(self, day):
+        """Switch to the file for day, closing the previous one and pruning old logs"""
+        if self._file:
+            self._sync()
+            self._file.close()
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._file = open(self.path_for(day), "ab")
+        if self._file.tell() == 0:
+            self._file.write(self.MAGIC)
+        self._day = day
+
+        cutoff = day - timedelta(days=self.keep_days)
+        for old_day, path in self.list_days().items():
+            if old_day < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @classmethod
+    def encode(cls, timestamp, event_type, source, code, name, detail):
+        payload = bytearray(cls.HEAD.pack(timestamp, cls.TYPES.index(event_type), cls.SOURCES.index(source)))
+        for field in (code, name, detail):
+            data = (field or "").encode("utf-8")[:cls.MAX_FIELD]
+            payload += struct.pack("<H", len(data)) + data
+        return cls.FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def append(self, event_type, code="", name="", detail="", source="scan"):
+        """Buffered append; durability comes from the periodic flush"""
+        now = datetime.now()
+        record = self.encode(now.timestamp(), event_type, source, code, name, detail)
+        with self._lock:
+            if self._day != now.date():
+                self._roll(now.date())
+            self._file.write(record)
+            self._dirty = True
+        if self.metrics:
+            self.metrics.incr(f'events_{event_type}')
+
+    def _sync(self):
+        if self._file and self._dirty:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+
+    def flush(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._sync()
+                self._file.close()
+                self._file = None
+                self._day = None
+
+    @classmethod
+    def read(cls, path):
+        """Yield events from a daily log, stopping quietly at a torn or corrupt tail"""
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(cls.MAGIC):
+            raise ValueError(f"{path} is not a SAM event log")
+
+        offset = len(cls.MAGIC)
+        view = memoryview(data)
+        while offset + cls.FRAME.size <= len(data):
+            length, crc = cls.FRAME.unpack_from(data, offset)
+            start = offset + cls.FRAME.size
+            payload = view[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            timestamp, type_index, source_index = cls.HEAD.unpack_from(payload, 0)
+            position = cls.HEAD.size
+            fields = []
+            for _ in range(3):
+                (size,) = struct.unpack_from("<H", payload, position)
+                position += 2
+                fields.append(bytes(payload[position:position + size]).decode("utf-8", "replace"))
+                position += size
+            yield {
+                'ts': timestamp,
+                'type': cls.TYPES[type_index],
+                'source': cls.SOURCES[source_index],
+                'code': fields[0],
+                'name': fields[1],
+                'detail': fields[2]
+            }
+            offset = start + length
+
+    def query(self, day, since=None, until=None, types=None, text=None, limit=None):
+        """Events for one day, filtered by time of day, type and a code/name substring"""
+        path = self.path_for(day)
+        if not os.path.exists(path):
+            return []
+        if day == self._day:
+            self.flush()
+
+        text = text.lower() if text else None
+        events = []
+        for event in self.read(path):
+            moment = datetime.fromtimestamp(event['ts']).time()
+            if since and moment < since:
+                continue
+            if until and moment > until:
+                break
+            if types and event['type'] not in types:
+                continue
+            if text and text not in event['code'].lower() and text not in event['name'].lower():
+                continue
+            events.append(event)
+        if limit:
+            events = events[-limit:]
+        return events
+
+
+class SyncClient:
+    """Pushes this station's change log to the aggregation node in batches
+
+    Attendance recorded before sync was turned on is queued into the change
+    log on the first pass. Each change log carries a random epoch so the
+    aggregator notices when a station's database was recreated and its
+    sequence numbers started over.
+    """
+
+    def __init__(self, db_path, station_id, server_url, interval=15, batch_size=500, token="", metrics=None):
+        self.db_path = db_path
+        self.station_id = station_id
+        self.server_url = server_url.rstrip('/')
+        self.interval = interval
+        self.batch_size = batch_size
+        self.token = token
+        self.metrics = metrics
+        self.last_error = None
+        self.last_sync = None
+        self._backfilled = False
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def notify(self):
+        """Wake the sync thread early after a new local change"""
+        self._wake_event.set()
+
+    def _run(self):
+        backoff = self.interval
+        while not self._stop_event.is_set():
+            self._wake_event.wait(backoff)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                break
+            result = self.sync_once()
+            # Back off while the aggregator is unreachable, up to 10 minutes
+            backoff = self.interval if result['success'] else min(backoff * 2, 600)
+
+    def _state(self, conn, key):
+        row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _acked_seq(self, conn):
+        return int(self._state(conn, 'acked_seq') or 0)
+
+    def _epoch(self, conn):
+        epoch = self._state(conn, 'epoch')
+        if not epoch:
+            epoch = os.urandom(8).hex()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('epoch', ?)", (epoch,))
+        return epoch
+
+    def backfill(self, conn):
+        """Queue attendance rows that never went through the change log; returns how many"""
+        with conn:
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_changelog_date_name ON changelog(date, name)")
+            cursor = conn.execute("""
+                INSERT INTO changelog (date, time, name)
+                SELECT date, time, name FROM attendance AS a
+                WHERE NOT EXISTS (SELECT 1 FROM changelog AS c WHERE c.date = a.date AND c.name = a.name)
+                ORDER BY a.rowid
+            """)
+        self._backfilled = True
+        return cursor.rowcount
+
+    def sync_once(self):
+        """Push every unacknowledged change, one batch per request"""
+        pushed = 0
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            if not self._backfilled:
+                self.backfill(conn)
+            epoch = self._epoch(conn)
+            headers = {'Content-Type': 'application/json'}
+            if self.token:
+                headers['X-SAM-Token'] = self.token
+            while not self._stop_event.is_set():
+                acked = self._acked_seq(conn)
+                rows = conn.execute(
+                    "SELECT seq, date, time, name FROM changelog WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (acked, self.batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+
+                payload = {
+                    'station': self.station_id,
+                    'epoch': epoch,
+                    'changes': [{'seq': seq, 'date': date, 'time': time, 'name': name}
+                                for seq, date, time, name in rows]
+                }
+                request = urllib.request.Request(
+                    f"{self.server_url}/sync",
+                    data=json.dumps(payload).encode('utf-8'),
+                    headers=headers,
+                    method='POST'
+                )
+                start = time_module.perf_counter()
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    reply = json.loads(response.read().decode('utf-8'))
+                if self.metrics:
+                    self.metrics.observe('sync_batch', time_module.perf_counter() - start)
+
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO sync_state (key, value) VALUES ('acked_seq', ?)",
+                        (str(reply['acked_seq']),)
+                    )
+                pushed += len(rows)
+                if reply['acked_seq'] < rows[-1][0]:
+                    break
+
+            self.last_error = None
+            self.last_sync = datetime.now().isoformat(timespec='seconds')
+            return {'success': True, 'message': f'Pushed {pushed} change(s)', 'pushed': pushed}
+        except (urllib.error.URLError, OSError, ValueError, KeyError, sqlite3.Error) as e:
+            self.last_error = str(e)
+            if self.metrics:
+                self.metrics.incr('sync_failures')
+            return {'success': False, 'message': f'Sync failed: {str(e)}', 'pushed': pushed}
+        finally:
+            conn.close()
+
+
+class SyncAggregator:
+    """Local HTTP service that merges station change logs into one attendance table
+
+    Listens on 127.0.0.1 unless given another host. When a token is set,
+    every request except /health must send it in the X-SAM-Token header.
+    """
+
+    def __init__(self, db_path, settings, host="127.0.0.1", port=8765, sf2=None, token=""):
+        self.db_path = db_path
+        self.settings = settings  # SettingsStore: date and time formats
+        self.host = host
+        self.port = port
+        self.sf2 = sf2
+        self.token = token
+        self._write_lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.init_db()
+
+    def init_db(self):
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS attendance (
+                    date TEXT,
+                    time TEXT,
+                    name TEXT,
+                    station TEXT,
+                    UNIQUE(date, name)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS stations (
+                    station TEXT PRIMARY KEY,
+                    last_seq INTEGER,
+                    last_seen TEXT,
+                    epoch TEXT
+                )
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(stations)")]
+            if "epoch" not in columns:
+                conn.execute("ALTER TABLE stations ADD COLUMN epoch TEXT")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _parse_time(self, value):
+        return datetime.strptime(value, self.settings.derived.time_format).time()
+
+    def _time_before(self, candidate, current):
+        """SQL helper: whether candidate is earlier than current in the configured time format"""
+        try:
+            return self._parse_time(candidate) < self._parse_time(current)
+        except (TypeError, ValueError):
+            # Unparseable times never replace a good one
+            return False
+
+    def apply_changes(self, station, changes, epoch=None):
+        """Merge one batch; UNIQUE(date, name) conflicts keep the earliest time"""
+        with self._write_lock:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.create_function("time_before", 2, self._time_before, deterministic=True)
+            try:
+                row = conn.execute("SELECT last_seq, epoch FROM stations WHERE station = ?", (station,)).fetchone()
+                last_seq, known_epoch = row if row else (0, None)
+                if epoch and known_epoch and epoch != known_epoch:
+                    # The station's database was recreated and its sequence started over
+                    last_seq = 0
+                fresh = [c for c in changes if c['seq'] > last_seq]
+                with conn:
+                    conn.executemany("""
+                        INSERT INTO attendance (date, time, name, station) VALUES (?, ?, ?, ?)
+                        ON CONFLICT(date, name) DO UPDATE SET time = excluded.time, station = excluded.station
+                        WHERE time_before(excluded.time, attendance.time)
+                    """, [(c['date'], c['time'], c['name'], station) for c in fresh])
+                    if fresh:
+                        last_seq = max(c['seq'] for c in fresh)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO stations (station, last_seq, last_seen, epoch) VALUES (?, ?, ?, ?)",
+                        (station, last_seq, datetime.now().isoformat(timespec='seconds'), epoch or known_epoch)
+                    )
+                return {'acked_seq': last_seq, 'applied': len(fresh)}
+            finally:
+                conn.close()
+
+    def get_stats(self, date_str):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            rows = conn.execute(
+                "SELECT date, time, name, station FROM attendance WHERE date = ?", (date_str,)
+            ).fetchall()
+            stations = conn.execute("SELECT station, last_seq, last_seen FROM stations").fetchall()
+        finally:
+            conn.close()
+
+        def arrival(row):
+            try:
+                return (0, self._parse_time(row[1]))
+            except (TypeError, ValueError):
+                return (1, row[1] or "")
+
+        rows.sort(key=arrival)
+        per_station = {}
+        for row in rows:
+            per_station[row[3]] = per_station.get(row[3], 0) + 1
+        return {
+            'date': date_str,
+            'scan_count': len(rows),
+            'per_station': per_station,
+            'stations': [{'station': s, 'last_seq': q, 'last_seen': t} for s, q, t in stations],
+            'data': [{'Date': d, 'Time': t, 'Name': n, 'Station': st} for d, t, n, st in rows]
+        }
+
+    def generate_sf2(self):
+        """Update the aggregator's SF2 workbook from the merged attendance"""
+        if not self.sf2:
+            return {'success': False, 'message': 'No SF2 workbook configured on the aggregator'}
+        source = AttendanceArchive(self.db_path, os.path.join(os.path.dirname(self.db_path), "archive_merged"),
+                                   self.settings.values["date_format"])
+        return self.sf2.update(source)
+
+    def _make_handler(self):
+        aggregator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _authorized(self):
+                if not aggregator.token:
+                    return True
+                if hmac.compare_digest(self.headers.get('X-SAM-Token', ''), aggregator.token):
+                    return True
+                self._reply(401, {'success': False, 'message': 'Missing or wrong sync token'})
+                return False
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path == '/health':
+                    self._reply(200, {'success': True})
+                elif not self._authorized():
+                    return
+                elif url.path == '/stats':
+                    date_format = aggregator.settings.derived.date_format
+                    date_str = query.get('date', [datetime.now().strftime(date_format)])[0]
+                    self._reply(200, aggregator.get_stats(date_str))
+                else:
+                    self._reply(404, {'success': False, 'message': 'Not found'})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                if not self._authorized():
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    body = json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+                    if url.path == '/sync':
+                        self._reply(200, aggregator.apply_changes(body['station'], body['changes'], body.get('epoch')))
+                    elif url.path == '/sf2':
+                        self._reply(200, aggregator.generate_sf2())
+                    else:
+                        self._reply(404, {'success': False, 'message': 'Not found'})
+                except (ValueError, KeyError, TypeError) as e:
+                    self._reply(400, {'success': False, 'message': f'Bad request: {str(e)}'})
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class FramePool:
+    """Reusable capture, grayscale and downscaled preview buffers for the camera loop"""
+
+    def __init__(self, preview_width=640, jpeg_quality=70):
+        self.preview_width = preview_width
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.frame = None
+        self.gray = None
+        self.preview_buffer = None
+        self.scale = 1.0
+
+    def set_quality(self, jpeg_quality):
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+
+    def read(self, cap):
+        """Read the next frame into the pooled buffer"""
+        if self.frame is None:
+            ret, frame = cap.read()
+        else:
+            ret, frame = cap.read(image=self.frame)
+        if ret and frame is not self.frame:
+            # First frame, or the device changed resolution
+            self._allocate(frame)
+        return ret, self.frame
+
+    def _allocate(self, frame):
+        height, width = frame.shape[:2]
+        self.frame = frame
+        self.gray = None
+        self.scale = min(1.0, self.preview_width / float(width))
+        preview_size = (max(1, int(width * self.scale)), max(1, int(height * self.scale)))
+        self.preview_buffer = cv2.resize(frame, preview_size, interpolation=cv2.INTER_AREA)
+
+    def grayscale(self):
+        """Convert the current frame to grayscale in place for the decoder"""
+        self.gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        return self.gray
+
+    def preview(self):
+        """Downscale the current frame into the preview buffer"""
+        if self.scale == 1.0:
+            self.preview_buffer[...] = self.frame
+        else:
+            height, width = self.preview_buffer.shape[:2]
+            cv2.resize(self.frame, (width, height), dst=self.preview_buffer, interpolation=cv2.INTER_AREA)
+        return self.preview_buffer
+
+    def encode_preview(self):
+        """JPEG-encode the preview buffer and return it base64-encoded"""
+        ok, encoded = cv2.imencode('.jpg', self.preview_buffer, self.encode_params)
+        if not ok:
+            return None
+        # b2a_base64 reads the numpy buffer directly, no intermediate bytes copy
+        return binascii.b2a_base64(encoded, newline=False).decode('ascii')
+
+
+class LowLightDecoder:
+    """Retries a failed decode on enhanced copies of the frame within a per-frame time budget"""
+    MAX_BACKOFF = 8
+
+    def __init__(self, budget_ms=15, metrics=None):
+        self.budget = budget_ms / 1000.0
+        self.metrics = metrics
+        self.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+        self.buffers = {}
+        # Stages that found codes recently are tried first
+        self.hits = {"clahe": 0, "sharpen": 0, "threshold": 0, "upscale": 0, "downscale": 0}
+        self._skip = 0
+        self._backoff = 0
+
+    def _stage(self, name, enhanced):
+        """Return (image, scale) for a stage; scale maps stage coordinates back to the frame"""
+        buffers = self.buffers
+        if name == "clahe":
+            return enhanced, 1.0
+        if name == "sharpen":
+            buffers["blur"] = cv2.GaussianBlur(enhanced, (0, 0), 2.0, dst=buffers.get("blur"))
+            buffers["sharpen"] = cv2.addWeighted(enhanced, 1.8, buffers["blur"], -0.8, 0,
+                                                 dst=buffers.get("sharpen"))
+            return buffers["sharpen"], 1.0
+        if name == "threshold":
+            buffers["threshold"] = cv2.adaptiveThreshold(enhanced, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                                         cv2.THRESH_BINARY, 31, 5, dst=buffers.get("threshold"))
+            return buffers["threshold"], 1.0
+        if name == "upscale":
+            # Small or distant codes gain pixels per module
+            buffers["upscale"] = cv2.resize(enhanced, None, dst=buffers.get("upscale"), fx=1.5, fy=1.5,
+                                            interpolation=cv2.INTER_CUBIC)
+            return buffers["upscale"], 1 / 1.5
+        # Motion blur shrinks relative to the module size when downscaled
+        buffers["downscale"] = cv2.resize(enhanced, None, dst=buffers.get("downscale"), fx=0.5, fy=0.5,
+                                          interpolation=cv2.INTER_AREA)
+        return buffers["downscale"], 2.0
+
+    def decode(self, gray):
+        """Try the enhancement stages until one decodes or the budget runs out"""
+        if self._skip:
+            # Nothing found lately (usually an empty gate); retry less often
+            self._skip -= 1
+            return []
+
+        deadline = time_module.perf_counter() + self.budget
+        if self.metrics:
+            self.metrics.incr('assist_attempts')
+        if self.buffers.get("clahe") is not None and self.buffers["clahe"].shape != gray.shape:
+            self.buffers.clear()
+        enhanced = self.buffers["clahe"] = self.clahe.apply(gray, dst=self.buffers.get("clahe"))
+
+        for name in sorted(self.hits, key=self.hits.get, reverse=True):
+            image, scale = self._stage(name, enhanced)
+            barcodes = pyzbar.decode(image)
+            if barcodes:
+                self.hits[name] += 1
+                self._backoff = 0
+                if self.metrics:
+                    self.metrics.incr('assist_hits')
+                    self.metrics.incr(f'assist_{name}')
+                if scale == 1.0:
+                    return barcodes
+                return [
+                    types.SimpleNamespace(data=barcode.data, type=barcode.type,
+                                          rect=tuple(int(v * scale) for v in barcode.rect))
+                    for barcode in barcodes
+                ]
+            if time_module.perf_counter() > deadline:
+                if self.metrics:
+                    self.metrics.incr('assist_over_budget')
+                break
+
+        self._backoff = min(self.MAX_BACKOFF, self._backoff * 2 or 1)
+        self._skip = self._backoff
+        return []
+
+    def reset(self):
+        """Forget the backoff once the plain decoder sees codes again"""
+        self._skip = 0
+        self._backoff = 0
+
+
+class QRTracker:
+    """Follows already-decoded QR codes between frames with template matching
+
+    While every track matches, the frame is not decoded at all; otherwise tracked
+    codes are masked out so pyzbar only spends time on codes it has not seen yet.
+    Every full_decode_interval frames the whole frame is decoded and the tracks
+    are checked against what it contains (see verify).
+    """
+
+    def __init__(self, match_threshold=0.6, max_misses=2, full_decode_interval=15, search_margin=0.5):
+        self.match_threshold = match_threshold
+        self.max_misses = max_misses
+        self.full_decode_interval = full_decode_interval
+        self.search_margin = search_margin
+        self.tracks = {}
+        self.frame_index = 0
+
+    def reset(self):
+        self.tracks.clear()
+        self.frame_index = 0
+
+    def _clip(self, gray, x, y, w, h):
+        height, width = gray.shape[:2]
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(width, x + w), min(height, y + h)
+        return x0, y0, x1, y1
+
+    def update(self, gray):
+        """Advance every track into the new frame; returns [(qr_data, rect)] still visible"""
+        self.frame_index += 1
+        visible = []
+        for qr_data, track in list(self.tracks.items()):
+            x, y, w, h = track['rect']
+            margin_x, margin_y = int(w * self.search_margin), int(h * self.search_margin)
+            x0, y0, x1, y1 = self._clip(gray, x - margin_x, y - margin_y, w + 2 * margin_x, h + 2 * margin_y)
+            template = track['template']
+            th, tw = template.shape[:2]
+            if x1 - x0 < tw or y1 - y0 < th:
+                found = False
+            else:
+                scores = cv2.matchTemplate(gray[y0:y1, x0:x1], template, cv2.TM_CCOEFF_NORMED)
+                _, score, _, location = cv2.minMaxLoc(scores)
+                found = score >= self.match_threshold
+
+            if found:
+                track['rect'] = (x0 + location[0], y0 + location[1], tw, th)
+                track['misses'] = 0
+                visible.append((qr_data, track['rect']))
+            else:
+                track['misses'] += 1
+                if track['misses'] > self.max_misses:
+                    # The code left the frame; the next sighting is decoded again
+                    del self.tracks[qr_data]
+        return visible
+
+    def needs_full_decode(self):
+        return not self.tracks or self.frame_index % self.full_decode_interval == 0
+
+    def confirmed(self):
+        """True when every track matched in the last update, so the frame needs no decode"""
+        return bool(self.tracks) and all(track['misses'] == 0 for track in self.tracks.values())
+
+    @staticmethod
+    def _overlaps(a, b):
+        return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+    def verify(self, decoded):
+        """Check the tracks against a full decode; decoded is [(qr_data, rect)]
+
+        The template match keys mostly on the finder patterns, so a different code
+        held up in the same spot still scores as the tracked one. A track covered by
+        another decoded code is dropped, as is one that two full decodes in a row
+        did not see.
+        """
+        for qr_data, track in list(self.tracks.items()):
+            if any(data == qr_data for data, _ in decoded):
+                track['unverified'] = 0
+            elif any(self._overlaps(track['rect'], rect) for _, rect in decoded):
+                del self.tracks[qr_data]
+            else:
+                track['unverified'] += 1
+                if track['unverified'] >= 2:
+                    del self.tracks[qr_data]
+
+    def mask(self, gray):
+        """Blank tracked codes out of the decoder input in place"""
+        for track in self.tracks.values():
+            x0, y0, x1, y1 = self._clip(gray, *track['rect'])
+            gray[y0:y1, x0:x1] = 255
+
+    def observe(self, gray, qr_data, rect):
+        """Start or refresh a track from a fresh decode"""
+        x0, y0, x1, y1 = self._clip(gray, *rect)
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            return
+        track = self.tracks.get(qr_data)
+        patch = gray[y0:y1, x0:x1]
+        if track and track['template'].shape == patch.shape:
+            track['template'][...] = patch
+        else:
+            track = self.tracks[qr_data] = {'template': patch.copy()}
+        track['rect'] = (x0, y0, x1 - x0, y1 - y0)
+        track['misses'] = 0
+        track['unverified'] = 0
+
+
+class CameraManager:
+    """Opens and releases capture devices on a worker thread and keeps a warm handle"""
+
+    def __init__(self, warm_timeout=60, probe_ttl=30, metrics=None):
+        self.warm_timeout = warm_timeout
+        self.probe_ttl = probe_ttl
+        self.metrics = metrics
+        self.cap = None
+        self.index = None
+        self.parked_at = None
+        self._probes = {}
+        self._jobs = queue.Queue()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def warm(self):
+        return self.cap is not None and self.parked_at is not None
+
+    def submit(self, func, *args):
+        """Run func on the camera worker thread; calls are executed in order"""
+        if not self._stopped:
+            self._jobs.put((func, args))
+
+    def call(self, func, *args, timeout=5.0):
+        """Run func on the worker thread and wait for its result"""
+        done = threading.Event()
+        result = {}
+
+        def job():
+            try:
+                result['value'] = func(*args)
+            finally:
+                done.set()
+
+        self.submit(job)
+        if not done.wait(timeout):
+            raise TimeoutError("Camera worker did not respond")
+        return result.get('value')
+
+    def _run(self):
+        while True:
+            try:
+                func, args = self._jobs.get(timeout=1.0)
+            except queue.Empty:
+                self._expire_warm_handle()
+                continue
+            if func is None:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Camera worker error: {e}")
+
+    def _expire_warm_handle(self):
+        if self.warm and time_module.monotonic() - self.parked_at >= self.warm_timeout:
+            self.release()
+
+    def acquire(self, index):
+        """Return an opened capture for index, reusing the warm handle when possible (worker thread)"""
+        if self.cap is not None and self.index == index and self.cap.isOpened():
+            self.parked_at = None
+            if self.metrics:
+                self.metrics.incr('camera_warm_reuse')
+            return self.cap
+
+        self.release()
+        start = time_module.perf_counter()
+        cap = cv2.VideoCapture(index)
+        if self.metrics:
+            self.metrics.observe('camera_open', time_module.perf_counter() - start)
+        opened = cap.isOpened()
+        self._probes[index] = (opened, time_module.monotonic())
+        if not opened:
+            cap.release()
+            return None
+
+        self.cap, self.index, self.parked_at = cap, index, None
+        return cap
+
+    def park(self):
+        """Keep the handle open for a quick resume; it is released after warm_timeout (worker thread)"""
+        if self.cap is None:
+            return
+        if self.warm_timeout <= 0:
+            self.release()
+        else:
+            self.parked_at = time_module.monotonic()
+
+    def release(self):
+        """Release the device handle (worker thread)"""
+        if self.cap is not None:
+            try:
+                if self.cap.isOpened():
+                    self.cap.release()
+            except Exception as e:
+                print(f"Camera release error: {e}")
+        self.cap, self.index, self.parked_at = None, None, None
+
+    def probe(self, index):
+        """Check if a device can be opened, answering from the handle or the probe cache first"""
+        if self.cap is not None and self.index == index:
+            return True
+        cached = self._probes.get(index)
+        if cached and time_module.monotonic() - cached[1] < self.probe_ttl:
+            return cached[0]
+
+        def run_probe():
+            cap = cv2.VideoCapture(index)
+            opened = cap.isOpened()
+            cap.release()
+            self._probes[index] = (opened, time_module.monotonic())
+            return opened
+
+        return self.call(run_probe)
+
+    def shutdown(self, timeout=2.0):
+        """Release the device and stop the worker"""
+        if self._stopped:
+            return
+        self.submit(self.release)
+        self._jobs.put((None, ()))
+        self._stopped = True
+        self._thread.join(timeout=timeout)
+
+
+DEFAULT_SETTINGS = {
+    "late_arrival_time": "08:15",
+    "metrics_interval": 300,  # seconds between metrics snapshots
+    "metrics_keep_days": 30,
+    "camera_quality": 70,  # JPEG quality 1-100
+    "camera_fps": 30,
+    "preview_width": 640,  # pixels; the preview is downscaled to at most this width
+    "duplicate_scan_timeout": 3,  # seconds
+    "qr_tracking": True,  # follow decoded codes instead of re-decoding them every frame
+    "low_light_assist": True,  # retry failed decodes on enhanced frames
+    "low_light_budget_ms": 15,  # per-frame time budget for the retries
+    "date_format": "%m/%d/%y",
+    "time_format": "%H:%M:%S",
+    "auto_backup": True,
+    "backup_interval": 24,  # hours
+    "backup_keep": 14,  # snapshots
+    "auto_archive": False,  # archiving deletes live rows, so it only runs automatically when enabled
+    "school_year_start_month": 6,
+    "station_id": "",
+    "sync_role": "off",  # off, station or aggregator
+    "sync_server": "http://127.0.0.1:8765",
+    "sync_port": 8765,
+    "sync_interval": 15,  # seconds
+    "sync_token": "",  # shared secret; the aggregator only listens beyond localhost with one
+    "sound_notifications": True,
+    "visual_notifications": True,
+    "auto_update_sf2": True,
+    "camera_index": 0,
+    "camera_warm_timeout": 60,  # seconds to keep the device open after stopping
+    "window_always_on_top": False,
+    "dark_mode": False,
+    "font_size": "medium",
+    "sampling_profiler": False,
+    "event_log": True,  # append every scan outcome to the daily event log
+    "event_log_fsync": 5,  # seconds between fsyncs of the event log
+    "event_log_keep_days": 90
+}
+
 
 class QRScannerAPI:
+    JOB_HISTORY = 20  # finished background jobs kept for get_job_result
+
     def __init__(self):
         self.data = []
         self.camera_thread = None
         self.scan_count = 0
         self.last_clear_date = datetime.now().date()
         self.camera_active = False
+        self.frame_pool = None
+        self.low_light = None
+        self.camera_state = "stopped"
+        self.camera_message = ""
+        self._camera_wanted = False
         self.cap = None
         self.scanned_codes = set()
         self._shutdown_event = threading.Event()
         self._window_closed = False
         self._ui_lock = threading.Lock()
         self._cleanup_done = False
+        self._jobs = {}  # job id -> {'kind', 'status', 'result'}, oldest first
+        self._job_ids = itertools.count(1)
+        self._jobs_lock = threading.Lock()
+        self.metrics = MetricsRegistry()
+        self.metrics_file = "_internal/data/metrics.jsonl"
+        self.profiler = None
         
         # Initialize settings before other components
         self.init_settings()
+        self.camera_manager = CameraManager(
+            warm_timeout=self.settings["camera_warm_timeout"],
+            metrics=self.metrics
+        )
         self.init_db()
+        self.load_roster()
+        self.sf2_layouts = SF2LayoutCache("_internal/data/sf2_layout.json", metrics=self.metrics)
+        self.sf2 = SF2Updater("_internal/data/SF2 Automated.xlsx", self.settings_store, self.sf2_layouts,
+                              metrics=self.metrics)
         self.load_today_records()
         self.start_midnight_checker()
+        self.init_event_log()
+        self.init_backup_service()
+        self.init_archive()
+        self.init_metrics_dump()
+        self.init_sync()
+        if self.settings["sampling_profiler"]:
+            self.set_profiler(True)
         
         atexit.register(self.cleanup)
         self._camera_lock = threading.Lock()  # Add this line
@@ -46,77 +2346,25 @@ class QRScannerAPI:
         """Initialize settings system with default values"""
         self.settings_file = "_internal/data/settings.json"
         
-        # Default settings
-        self.default_settings = {
-            "late_arrival_time": "08:15",
-            "auto_save_interval": 300,  # seconds
-            "camera_quality": 70,  # JPEG quality 1-100
-            "camera_fps": 30,
-            "duplicate_scan_timeout": 3,  # seconds
-            "date_format": "%m/%d/%y",
-            "time_format": "%H:%M:%S",
-            "auto_backup": True,
-            "backup_interval": 24,  # hours
-            "sound_notifications": True,
-            "visual_notifications": True,
-            "auto_update_sf2": True,
-            "camera_index": 0,
-            "window_always_on_top": False,
-            "dark_mode": False,
-            "font_size": "medium"
-        }
+        self.default_settings = dict(DEFAULT_SETTINGS)
         
         # Load or create settings
+        self.settings_store = SettingsStore(self.settings_file, self.default_settings)
+        self.settings = self.settings_store.values
         self.load_settings()
+        self.settings_store.subscribe(self._on_settings_changed)
 
     def load_settings(self):
         """Load settings from file or create with defaults"""
-        try:
-            os.makedirs(os.path.dirname(self.settings_file), exist_ok=True)
-            
-            if os.path.exists(self.settings_file):
-                with open(self.settings_file, 'r') as f:
-                    saved_settings = json.load(f)
-                
-                # Merge with defaults to ensure all keys exist
-                self.settings = {**self.default_settings, **saved_settings}
-                
-                # Validate settings
-                self.validate_settings()
-            else:
-                self.settings = self.default_settings.copy()
-                self.save_settings()
-                
-        except Exception as e:
-            print(f"Error loading settings: {e}")
-            self.settings = self.default_settings.copy()
-            self.save_settings()
+        self.settings_store.load()
 
     def validate_settings(self):
         """Validate and fix invalid settings"""
-        # Validate time format
-        try:
-            datetime.strptime(self.settings["late_arrival_time"], "%H:%M")
-        except ValueError:
-            self.settings["late_arrival_time"] = self.default_settings["late_arrival_time"]
-        
-        # Validate numeric ranges
-        self.settings["camera_quality"] = max(1, min(100, self.settings["camera_quality"]))
-        self.settings["camera_fps"] = max(1, min(60, self.settings["camera_fps"]))
-        self.settings["duplicate_scan_timeout"] = max(1, min(30, self.settings["duplicate_scan_timeout"]))
-        self.settings["auto_save_interval"] = max(60, min(3600, self.settings["auto_save_interval"]))
-        self.settings["backup_interval"] = max(1, min(168, self.settings["backup_interval"]))
-        self.settings["camera_index"] = max(0, min(10, self.settings["camera_index"]))
+        self.settings_store.validate(self.settings)
 
     def save_settings(self):
         """Save current settings to file"""
-        try:
-            os.makedirs(os.path.dirname(self.settings_file), exist_ok=True)
-            with open(self.settings_file, 'w') as f:
-                json.dump(self.settings, f, indent=2)
-            return {'success': True, 'message': 'Settings saved successfully'}
-        except Exception as e:
-            return {'success': False, 'message': f'Error saving settings: {str(e)}'}
+        return self.settings_store.save()
 
     def get_settings(self):
         """Get current settings for frontend"""
@@ -131,69 +2379,37 @@ class QRScannerAPI:
             return {'success': False, 'message': f'Unknown setting: {key}'}
         
         try:
-            # Type conversion and validation
-            if key == "late_arrival_time":
-                # Validate time format
-                datetime.strptime(value, "%H:%M")
-            elif key in ["auto_save_interval", "camera_fps", "duplicate_scan_timeout", 
-                        "backup_interval", "camera_index"]:
-                value = int(value)
-            elif key == "camera_quality":
-                value = max(1, min(100, int(value)))
-            elif key in ["auto_backup", "sound_notifications", "visual_notifications",
-                        "auto_update_sf2", "window_always_on_top", "dark_mode"]:
-                value = bool(value)
-            
-            self.settings[key] = value
-            save_result = self.save_settings()
-            
-            if save_result['success']:
-                # Apply certain settings immediately
-                self.apply_setting_change(key, value)
-                return {'success': True, 'message': f'Setting {key} updated successfully'}
-            else:
-                return save_result
-                
+            self.settings_store.update({key: value})
+            return {'success': True, 'message': f'Setting {key} updated successfully'}
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
         except Exception as e:
-            return {'success': False, 'message': f'Invalid value for {key}: {str(e)}'}
+            return {'success': False, 'message': f'Error saving settings: {str(e)}'}
 
     def update_settings(self, new_settings):
-        """Update multiple settings at once"""
+        """Update multiple settings at once with a single write"""
         try:
-            # Backup current settings
-            old_settings = self.settings.copy()
-            
-            # Validate and update each setting
-            for key, value in new_settings.items():
-                if key in self.default_settings:
-                    result = self.update_setting(key, value)
-                    if not result['success']:
-                        # Restore old settings on any failure
-                        self.settings = old_settings
-                        return result
-            
+            valid_settings = {key: value for key, value in new_settings.items() if key in self.default_settings}
+            self.settings_store.update(valid_settings)
             return {'success': True, 'message': 'All settings updated successfully'}
-            
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
         except Exception as e:
             return {'success': False, 'message': f'Error updating settings: {str(e)}'}
 
     def reset_settings(self):
         """Reset all settings to defaults"""
         try:
-            self.settings = self.default_settings.copy()
-            save_result = self.save_settings()
-            
-            if save_result['success']:
-                # Apply all default settings
-                for key, value in self.settings.items():
-                    self.apply_setting_change(key, value)
-                return {'success': True, 'message': 'Settings reset to defaults'}
-            else:
-                return save_result
-                
+            self.settings_store.reset()
+            return {'success': True, 'message': 'Settings reset to defaults'}
         except Exception as e:
             return {'success': False, 'message': f'Error resetting settings: {str(e)}'}
 
+    def _on_settings_changed(self, changed):
+        """Settings store subscriber: apply changed keys that need immediate effect"""
+        for key, value in changed.items():
+            self.apply_setting_change(key, value)
+
     def apply_setting_change(self, key, value):
         """Apply setting changes that need immediate effect"""
         try:
@@ -205,10 +2421,42 @@ class QRScannerAPI:
             elif key == "font_size":
                 self._safe_js_call(f'applyFontSetting("font_size", {json.dumps(value)})')
             elif key == "camera_index" and self.camera_active:
-                # Restart camera with new index
+                # Restart camera with new index; the worker runs stop and start in order
                 self.stop_camera()
-                time_module.sleep(0.5)
                 self.start_camera()
+            elif key == "camera_warm_timeout":
+                self.camera_manager.warm_timeout = value
+            elif key == "low_light_budget_ms" and getattr(self, 'low_light', None):
+                self.low_light.budget = value / 1000.0
+            elif key == "camera_quality" and getattr(self, 'frame_pool', None):
+                self.frame_pool.set_quality(value)
+            elif key == "sampling_profiler":
+                self.set_profiler(value)
+            elif key == "auto_backup":
+                if value:
+                    self._schedule_backup()
+                else:
+                    self.scheduler.cancel("backup")
+            elif key == "metrics_interval":
+                self.init_metrics_dump()
+            elif key in ["event_log", "event_log_fsync", "event_log_keep_days"]:
+                self.init_event_log()
+            elif key == "school_year_start_month":
+                self.archive.start_month = value
+            elif key == "date_format":
+                self.archive.date_format = value
+                if self._next_day:
+                    self._prepare_next_day()
+            elif key in ["sync_role", "sync_server", "sync_port", "sync_interval", "sync_token", "station_id"]:
+                self.stop_sync()
+                self.init_sync()
+            elif key in ["backup_interval", "backup_keep"]:
+                self.backup_service.reconfigure(
+                    interval_hours=self.settings["backup_interval"],
+                    keep=self.settings["backup_keep"]
+                )
+                if self.settings["auto_backup"]:
+                    self._schedule_backup()
                 
         except Exception as e:
             print(f"Error applying setting change for {key}: {e}")
@@ -267,7 +2515,7 @@ class QRScannerAPI:
     
     def load_today_records(self):
         """Load all today's attendance records from database"""
-        today = datetime.now().strftime(self.settings["date_format"])
+        today = self.settings_store.format_date(datetime.now())
         self.cursor.execute("SELECT date, time, name FROM attendance WHERE date = ? ORDER BY time", (today,))
         rows = self.cursor.fetchall()
         self.data = [{'Date': row[0], 'Time': row[1], 'Name': row[2]} for row in rows]
@@ -275,16 +2523,31 @@ class QRScannerAPI:
         
         self._safe_js_call(f'updateAttendanceTable({json.dumps(self.data)})')
     
-    def record_attendance(self, name):
+    def record_attendance(self, name, code="", source="scan"):
         """Record attendance for a person"""
+        try:
+            with self.metrics.timer('record_attendance'):
+                result = self._record_attendance(name)
+        except Exception as e:
+            self._log_event("error", code, name, str(e), source)
+            raise
+        self._log_event("recorded" if result['success'] else result.get('type', 'error'),
+                        code, name, result.get('message', ''), source)
+        return result
+
+    def _record_attendance(self, name):
         now = datetime.now()
-        date_str = now.strftime(self.settings["date_format"])
-        time_str = now.strftime(self.settings["time_format"])
+        if now.date() != self.last_clear_date:
+            # First scan of a new day beat the scheduler (e.g. right after resume)
+            self._check_new_day()
+        date_str = self.settings_store.format_date(now)
+        time_str = now.strftime(self.settings_store.derived.time_format)
         
         self.cursor.execute("SELECT 1 FROM attendance WHERE date = ? AND name = ?", (date_str, name))
         exists = self.cursor.fetchone()
         
         if exists:
+            self.metrics.incr('scans_duplicate')
             return {
                 'success': False, 
                 'message': f'{name} already scanned today',
@@ -294,7 +2557,13 @@ class QRScannerAPI:
         try:
             self.cursor.execute("INSERT INTO attendance (date, time, name) VALUES (?, ?, ?)",
                               (date_str, time_str, name))
-            self.conn.commit()
+            self.cursor.execute("INSERT INTO changelog (date, time, name) VALUES (?, ?, ?)",
+                              (date_str, time_str, name))
+            with self.metrics.timer('db_commit'):
+                self.conn.commit()
+            self.metrics.incr('scans_recorded')
+            if self.sync_client:
+                self.sync_client.notify()
             
             self.load_today_records()
             
@@ -307,6 +2576,7 @@ class QRScannerAPI:
             }
             
         except sqlite3.IntegrityError:
+            self.metrics.incr('scans_duplicate')
             return {
                 'success': False,
                 'message': f'{name} already recorded today',
@@ -336,6 +2606,8 @@ class QRScannerAPI:
         """Get detailed camera status for debugging"""
         return {
             'camera_active': self.camera_active,
+            'camera_state': self.camera_state,
+            'camera_warm': self.camera_manager.warm,
             'cap_exists': self.cap is not None,
             'cap_opened': self.cap.isOpened() if self.cap else False,
             'thread_alive': self.camera_thread.is_alive() if self.camera_thread else False,
@@ -343,6 +2615,77 @@ class QRScannerAPI:
             'window_closed': self._window_closed
         }
 
+    def _start_job(self, kind, work, callback):
+        """Run work in a background thread and return its job id
+
+        The result goes to the frontend callback and is also kept for get_job_result,
+        so a frontend without the callback can poll for it.
+        """
+        job_id = f"{kind}-{next(self._job_ids)}"
+        with self._jobs_lock:
+            self._jobs[job_id] = {'kind': kind, 'status': 'running', 'result': None}
+            finished = [key for key, job in self._jobs.items() if job['status'] == 'done']
+            for key in finished[:max(0, len(finished) - self.JOB_HISTORY)]:
+                del self._jobs[key]
+
+        def run():
+            try:
+                result = work()
+            except Exception as e:
+                result = {'success': False, 'message': f'{kind} failed: {str(e)}'}
+            with self._jobs_lock:
+                self._jobs[job_id].update(status='done', result=result)
+            self._safe_js_call(f'{callback}({json.dumps(result)})')
+
+        threading.Thread(target=run, daemon=True).start()
+        return job_id
+
+    def get_job_result(self, job_id):
+        """Status of a background job; result is set once status is 'done'"""
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return {'success': False, 'message': f'Unknown job: {job_id}'}
+            return {'success': True, 'job': job_id, **job}
+
+    def get_metrics(self):
+        """Get hot-path counters and latency percentiles"""
+        snapshot = self.metrics.snapshot()
+        snapshot['profiler_active'] = bool(self.profiler and self.profiler.running)
+        return {'success': True, 'metrics': snapshot}
+
+    def dump_metrics(self, reset=False):
+        """Append a metrics snapshot to the JSON-lines metrics file"""
+        try:
+            snapshot = self.metrics.dump(self.metrics_file, keep_days=self.settings["metrics_keep_days"])
+            if reset:
+                self.metrics.reset()
+            return {'success': True, 'message': 'Metrics saved', 'file': self.metrics_file, 'metrics': snapshot}
+        except Exception as e:
+            return {'success': False, 'message': f'Error saving metrics: {str(e)}'}
+
+    def set_profiler(self, enabled):
+        """Start or stop the sampling profiler, writing collected stacks on stop"""
+        try:
+            if enabled:
+                if not self.profiler:
+                    self.profiler = SamplingProfiler()
+                self.profiler.start()
+                return {'success': True, 'message': 'Sampling profiler started'}
+
+            if not self.profiler or not self.profiler.running:
+                return {'success': True, 'message': 'Sampling profiler not running'}
+            self.profiler.stop()
+            profile_file = f"_internal/data/profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+            self.profiler.write(profile_file)
+            return {'success': True, 'message': 'Sampling profiler stopped', 'file': profile_file}
+        except Exception as e:
+            return {'success': False, 'message': f'Profiler error: {str(e)}'}
+
+    def toggle_profiler(self):
+        """Toggle the sampling profiler on/off"""
+        return self.set_profiler(not (self.profiler and self.profiler.running))
+
     def init_db(self):
         """Initialize SQLite database"""
         os.makedirs(os.path.join("_internal", "data"), exist_ok=True)
@@ -362,70 +2705,389 @@ class QRScannerAPI:
             CREATE INDEX IF NOT EXISTS idx_date_name ON attendance(date, name)
         """)
         
+        # Append-only change log replicated to the aggregation node
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS changelog (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT,
+                time TEXT,
+                name TEXT
+            )
+        """)
+        
+        # QR payloads registered by the ID card generator
+        self.cursor.execute(IDCardGenerator.STUDENTS_TABLE)
+        
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+        
         self.conn.commit()
     
+    def load_roster(self):
+        """Load registered QR payloads into memory so scans resolve without a query"""
+        self.roster = dict(self.conn.execute("SELECT payload, name FROM students").fetchall())
+        return {'success': True, 'students': len(self.roster)}
+
+    def generate_id_cards(self, roster_path, school_name=""):
+        """Generate ID cards for a roster in the background and report the result to the frontend"""
+        if not os.path.exists(roster_path):
+            return {'success': False, 'message': 'Roster file not found'}
+
+        def run():
+            try:
+                students = read_roster(roster_path, self.settings["date_format"])
+                generator = IDCardGenerator("_internal/data/attendance.db", "_internal/data/idcards",
+                                            school_name=school_name)
+                result = generator.generate(students)
+                self.load_roster()
+            except Exception as e:
+                result = {'success': False, 'message': f'Error generating ID cards: {str(e)}'}
+            return result
+
+        job = self._start_job("idcards", run, "handleIdCardsResult")
+        return {'success': True, 'message': 'Generating ID cards...', 'job': job}
+
+    def init_archive(self):
+        """Set up the school-year archive and move closed years out in the background"""
+        self.archive = AttendanceArchive(
+            "_internal/data/attendance.db",
+            "_internal/data/archive",
+            self.settings["date_format"],
+            start_month=self.settings["school_year_start_month"],
+            metrics=self.metrics
+        )
+        if self.settings["auto_archive"]:
+            threading.Thread(target=self.archive.archive_closed_years,
+                             kwargs={'backup': self.backup_service.backup}, daemon=True).start()
+
+    def export_attendance(self, fmt="csv", start_date=None, end_date=None, sections=None):
+        """Export attendance history in the background; dates are YYYY-MM-DD, sections a list"""
+        try:
+            start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+            end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+        except ValueError:
+            return {'success': False, 'message': 'Dates must be in YYYY-MM-DD format'}
+        if fmt not in AttendanceExporter.FORMATS:
+            return {'success': False, 'message': f'Unknown export format: {fmt}'}
+
+        file_name = f"attendance_{datetime.now().strftime('%Y%m%d_%H%M%S')}{AttendanceExporter.FORMATS[fmt]}"
+        file_path = os.path.join("_internal/data/exports", file_name)
+
+        def run():
+            exporter = AttendanceExporter(self.archive, metrics=self.metrics)
+            return exporter.export(file_path, fmt, start, end, sections or None)
+
+        job = self._start_job("export", run, "handleExportResult")
+        return {'success': True, 'message': 'Exporting attendance...', 'file': file_path, 'job': job}
+
+    def archive_old_years(self):
+        """Archive closed school years in the background and report the result to the frontend"""
+        def run():
+            return self.archive.archive_closed_years(backup=self.backup_service.backup)
+
+        job = self._start_job("archive", run, "handleArchiveResult")
+        return {'success': True, 'message': 'Archiving started', 'job': job}
+
+    def get_archives(self):
+        """List archived school years"""
+        try:
+            archives = self.archive.list_archives()
+            return {
+                'success': True,
+                'archives': [
+                    {'school_year': f"{year}-{year + 1}", 'file': path, 'size': os.path.getsize(path)}
+                    for year, path in sorted(archives.items())
+                ]
+            }
+        except Exception as e:
+            return {'success': False, 'message': f'Error listing archives: {str(e)}'}
+
+    def init_sync(self):
+        """Start the sync client, and the aggregation server on the aggregator node"""
+        self.sync_client = None
+        self.sync_aggregator = None
+        role = self.settings["sync_role"]
+        if role == "off":
+            return
+
+        server_url = self.settings["sync_server"]
+        token = self.settings["sync_token"]
+        try:
+            if role == "aggregator":
+                # Other stations can reach the node only once a shared token protects it
+                host = "0.0.0.0" if token else "127.0.0.1"
+                if not token:
+                    print("Sync aggregator is listening on 127.0.0.1 only; set sync_token to accept other stations")
+                self.sync_aggregator = SyncAggregator(
+                    "_internal/data/aggregate.db", self.settings_store, host=host,
+                    port=self.settings["sync_port"], sf2=self.sf2, token=token
+                )
+                self.sync_aggregator.start()
+                server_url = f"http://127.0.0.1:{self.sync_aggregator.port}"
+
+            self.sync_client = SyncClient(
+                "_internal/data/attendance.db",
+                self.settings["station_id"],
+                server_url,
+                interval=self.settings["sync_interval"],
+                token=token,
+                metrics=self.metrics
+            )
+            self.sync_client.start()
+        except Exception as e:
+            print(f"Error starting sync: {e}")
+
+    def stop_sync(self):
+        if getattr(self, 'sync_client', None):
+            self.sync_client.stop()
+            self.sync_client = None
+        if getattr(self, 'sync_aggregator', None):
+            self.sync_aggregator.stop()
+            self.sync_aggregator = None
+
+    def sync_now(self):
+        """Push pending changes to the aggregator immediately"""
+        if not self.sync_client:
+            return {'success': False, 'message': 'Sync is turned off'}
+        return self.sync_client.sync_once()
+
+    def get_sync_status(self):
+        """Get sync role, pending changes and last sync result"""
+        try:
+            row = self.conn.execute("SELECT value FROM sync_state WHERE key = 'acked_seq'").fetchone()
+            acked = int(row[0]) if row else 0
+            pending = self.conn.execute("SELECT COUNT(*) FROM changelog WHERE seq > ?", (acked,)).fetchone()[0]
+            return {
+                'success': True,
+                'role': self.settings["sync_role"],
+                'station_id': self.settings["station_id"],
+                'pending': pending,
+                'last_sync': self.sync_client.last_sync if self.sync_client else None,
+                'last_error': self.sync_client.last_error if self.sync_client else None
+            }
+        except Exception as e:
+            return {'success': False, 'message': f'Error reading sync status: {str(e)}'}
+
+    def get_merged_stats(self, date_str=None):
+        """Get merged attendance across stations (aggregator node only)"""
+        if not self.sync_aggregator:
+            return {'success': False, 'message': 'This station is not the aggregator'}
+        date_str = date_str or datetime.now().strftime(self.settings["date_format"])
+        return {'success': True, 'stats': self.sync_aggregator.get_stats(date_str)}
+
+    def init_backup_service(self):
+        """Create the backup service and start it when auto_backup is enabled"""
+        self.backup_service = BackupService(
+            "_internal/data/attendance.db",
+            "_internal/data/backups",
+            interval_hours=self.settings["backup_interval"],
+            keep=self.settings["backup_keep"],
+            metrics=self.metrics
+        )
+        if self.settings["auto_backup"]:
+            self._schedule_backup()
+
+    def _schedule_backup(self):
+        self.backup_service.start()
+        self.scheduler.schedule_at(
+            "backup",
+            time_module.time() + self.backup_service.seconds_until_due(),
+            self._run_scheduled_backup,
+            threaded=True
+        )
+
+    def _run_scheduled_backup(self):
+        self.backup_service.backup()
+        if self.settings["auto_backup"]:
+            self._schedule_backup()
+
+    def init_event_log(self):
+        """Open the daily event log and fsync it on a schedule"""
+        if getattr(self, 'event_log', None):
+            self.scheduler.cancel("event_log_flush")
+            self.event_log.close()
+        self.event_log = None
+        if not self.settings["event_log"]:
+            return
+        self.event_log = EventLog(
+            "_internal/data/events",
+            keep_days=self.settings["event_log_keep_days"],
+            metrics=self.metrics
+        )
+        self.scheduler.schedule_every("event_log_flush", self.settings["event_log_fsync"], self.event_log.flush)
+
+    def _log_event(self, event_type, code="", name="", detail="", source="scan"):
+        if self.event_log:
+            try:
+                self.event_log.append(event_type, code, name, detail, source)
+            except Exception as e:
+                print(f"Error writing event log: {e}")
+
+    def get_events(self, date=None, since=None, until=None, types=None, text=None, limit=500):
+        """Events for a day (YYYY-MM-DD, default today) with optional HH:MM bounds, types and search text"""
+        if not self.event_log:
+            return {'success': False, 'message': 'Event log is disabled'}
+        try:
+            day = datetime.strptime(date, "%Y-%m-%d").date() if date else datetime.now().date()
+            since = datetime.strptime(since, "%H:%M").time() if since else None
+            until = datetime.strptime(until, "%H:%M").time() if until else None
+            events = self.event_log.query(day, since, until, types, text, limit)
+            return {'success': True, 'events': events, 'count': len(events)}
+        except Exception as e:
+            return {'success': False, 'message': f'Error reading event log: {str(e)}'}
+
+    def init_metrics_dump(self):
+        """Append a metrics snapshot every metrics_interval seconds"""
+        self.scheduler.schedule_every(
+            "metrics", self.settings["metrics_interval"], self.dump_metrics, threaded=True
+        )
+
+    def backup_now(self):
+        """Run a backup in the background and report the result to the frontend"""
+        job = self._start_job("backup", self.backup_service.backup, "handleBackupResult")
+        return {'success': True, 'message': 'Backup started', 'job': job}
+
+    def get_backups(self):
+        """List available backup snapshots, newest first"""
+        try:
+            return {
+                'success': True,
+                'backups': self.backup_service.list_snapshots(),
+                'last_result': self.backup_service.last_result
+            }
+        except Exception as e:
+            return {'success': False, 'message': f'Error listing backups: {str(e)}'}
+
     def start_midnight_checker(self):
-        """Start background thread to check for new day"""
-        def check_midnight():
-            while not self._shutdown_event.is_set():
-                try:
-                    self._shutdown_event.wait(3600)
-                    if self._shutdown_event.is_set():
-                        break
-                        
-                    current_date = datetime.now().date()
-                    if current_date != self.last_clear_date:
-                        self.load_today_records()
-                        self.last_clear_date = current_date
-                        self._safe_js_call(f'handleNewDay({json.dumps(self.get_stats())})')
-                except Exception as e:
-                    print(f"Midnight checker error: {e}")
-                    break
-        
-        threading.Thread(target=check_midnight, daemon=True).start()
+        """Schedule the day rollover at the next local midnight"""
+        self.scheduler = JobScheduler(on_clock_jump=self._on_clock_jump)
+        self._next_day = None
+        self._schedule_rollover()
+        self.scheduler.start()
+
+    def _schedule_rollover(self):
+        tomorrow = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+        midnight = tomorrow.timestamp()
+        # Prepare a minute early so the switch itself is just a swap
+        self.scheduler.schedule_at("prepare_next_day", midnight - 60, self._prepare_next_day)
+        self.scheduler.schedule_at("day_rollover", midnight, self._check_new_day)
+
+    def _prepare_next_day(self):
+        """Precompute the next day's date string before midnight"""
+        next_date = datetime.now().date() + timedelta(days=1)
+        date_format = self.settings_store.derived.date_format
+        self._next_day = {
+            'date': next_date,
+            'date_format': date_format,
+            'date_str': datetime.combine(next_date, datetime.min.time()).strftime(date_format)
+        }
+
+    def _check_new_day(self):
+        """Switch the cached day state when the date has changed"""
+        try:
+            current_date = datetime.now().date()
+            if current_date != self.last_clear_date:
+                prepared = self._next_day
+                if prepared and prepared['date'] == current_date:
+                    # load_today_records and the first scan read it from the cache
+                    self.settings_store.seed_date(prepared['date'], prepared['date_str'], prepared['date_format'])
+                self._next_day = None
+                self.last_clear_date = current_date
+                self.scanned_codes.clear()
+                self.load_today_records()
+                self._safe_js_call(f'handleNewDay({json.dumps(self.get_stats())})')
+        except Exception as e:
+            print(f"Day rollover error: {e}")
+        finally:
+            self._schedule_rollover()
+
+    def _on_clock_jump(self, drift):
+        """Wall clock moved (sleep/resume, NTP or manual change): re-check the day and deadlines"""
+        print(f"Clock jump of {drift:.0f}s detected")
+        self._check_new_day()
 
     def check_camera_available(self):
         """Check if camera is available"""
         try:
-            cap = cv2.VideoCapture(self.settings["camera_index"])
-            if cap.isOpened():
-                cap.release()
+            if self.camera_manager.probe(self.settings["camera_index"]):
                 return {'success': True, 'message': 'Camera available'}
             return {'success': False, 'message': 'Camera not available'}
         except Exception as e:
             return {'success': False, 'message': f'Camera error: {str(e)}'}
     
+    def get_camera_state(self):
+        """Latest camera progress event, for frontends that poll instead of defining handleCameraEvent"""
+        return {'state': self.camera_state, 'message': self.camera_message, 'wanted': self._camera_wanted}
+
+    def _emit_camera_event(self, state, message=""):
+        self.camera_state = state
+        self.camera_message = message
+        if state in ("started", "stopped", "error"):
+            self._log_event("camera", name=state, detail=message, source="system")
+        self._safe_js_call(f'handleCameraEvent({json.dumps({"state": state, "message": message})})')
+
     def start_camera(self):
-        """Start camera scanning"""
-        if self.camera_active:
+        """Start camera scanning; the device is opened in the background"""
+        if self._camera_wanted:
             return {'success': False, 'message': 'Camera already active'}
         
         if self._shutdown_event.is_set():
             return {'success': False, 'message': 'Application is shutting down'}
         
+        self._camera_wanted = True
+        self._emit_camera_event("starting", "Opening camera...")
+        self.camera_manager.submit(self._start_camera_job, self.settings["camera_index"])
+        return {'success': True, 'message': 'Camera starting', 'state': 'starting'}
+
+    def _start_camera_job(self, camera_index):
+        """Open the device and start the scanning loop (camera worker thread)"""
         try:
-            self.cap = cv2.VideoCapture(self.settings["camera_index"])
-            if not self.cap.isOpened():
-                return {'success': False, 'message': 'Could not open camera'}
+            if self.camera_active and self.camera_thread and self.camera_thread.is_alive():
+                # Stop and start were both requested while this loop kept running
+                self._emit_camera_event("started", "Camera started")
+                return
+            
+            # A previous loop may still be finishing its last frame
+            if self.camera_thread and self.camera_thread.is_alive():
+                self.camera_thread.join(timeout=2.0)
+            # Stopped again before this job ran
+            if not self._camera_wanted or self._shutdown_event.is_set():
+                return
             
+            cap = self.camera_manager.acquire(camera_index)
+            if cap is None:
+                self._camera_wanted = False
+                self._emit_camera_event("error", "Could not open camera")
+                self._safe_js_call(f'updateCameraStatus(false)')
+                return
+            
+            self.cap = cap
             self.camera_active = True
             self.scanned_codes.clear()
             
             self.camera_thread = threading.Thread(target=self._camera_loop, daemon=True)
             self.camera_thread.start()
-            
-            time_module.sleep(0.1)
-            self._safe_js_call(f'updateCameraStatus(true)')
-            
-            return {'success': True, 'message': 'Camera started'}
+            self._emit_camera_event("started", "Camera started")
         except Exception as e:
             self.camera_active = False
-            return {'success': False, 'message': f'Camera error: {str(e)}'}
+            self._camera_wanted = False
+            self._emit_camera_event("error", f"Camera error: {str(e)}")
     
     def _camera_loop(self):
         """Main camera processing loop with improved error handling"""
         frame_count = 0
-        fps_delay = 1.0 / self.settings["camera_fps"]
+        compiled = self.settings_store.derived
+        pool = FramePool(self.settings["preview_width"], self.settings["camera_quality"])
+        self.frame_pool = pool
+        tracker = QRTracker() if self.settings["qr_tracking"] else None
+        assist = None
+        if self.settings["low_light_assist"]:
+            assist = LowLightDecoder(self.settings["low_light_budget_ms"], metrics=self.metrics)
+        self.low_light = assist
         
         # Only update status if window is still available
         if not self._window_closed:
@@ -435,56 +3097,95 @@ class QRScannerAPI:
             if self._window_closed or self._shutdown_event.is_set():
                 break
             try:
-                ret, frame = self.cap.read()
+                with self.metrics.timer('capture'):
+                    ret, frame = pool.read(self.cap)
                 if not ret:
                     break
+                self.metrics.incr('frames')
                 
-                barcodes = pyzbar.decode(frame)
+                gray = pool.grayscale()
+                detections = []
+                masked = skipped = False
+                full = True
+                if tracker:
+                    with self.metrics.timer('track'):
+                        detections = tracker.update(gray)
+                        full = tracker.needs_full_decode()
+                        if full:
+                            pass
+                        elif tracker.confirmed():
+                            # Every code in view is already followed; nothing to decode
+                            skipped = True
+                        else:
+                            tracker.mask(gray)
+                            masked = True
+                    self.metrics.incr('tracked_codes', len(detections))
+                
+                barcodes = []
+                if skipped:
+                    self.metrics.incr('decode_skipped')
+                else:
+                    with self.metrics.timer('decode'):
+                        barcodes = pyzbar.decode(gray)
+                if assist:
+                    if barcodes:
+                        assist.reset()
+                    elif not detections:
+                        # Only when nothing is in view or tracked; costs at most the budget
+                        with self.metrics.timer('assist'):
+                            barcodes = assist.decode(gray)
+                if barcodes:
+                    self.metrics.incr('decode_hits', len(barcodes))
                 
+                # Tracks, detections and scanned_codes are all keyed by the raw payload;
+                # it is resolved to a name only when recording and drawing
+                tracked = {qr_data for qr_data, _ in detections}
+                decoded = []
                 for barcode in barcodes:
                     if self._shutdown_event.is_set():
                         break
                         
-                    qr_data = barcode.data.decode('utf-8')
-                    
-                    (x, y, w, h) = barcode.rect
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (46, 204, 113), 3)
-                    
-                    text = f"Name: {qr_data}"
-                    (text_w, text_h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-                    cv2.rectangle(frame, (x, y - text_h - 10), (x + text_w + 10, y), (46, 204, 113), -1)
-                    cv2.putText(frame, text, (x + 5, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                    
-                    if qr_data not in self.scanned_codes:
-                        self.scanned_codes.add(qr_data)
-                        result = self.record_attendance(qr_data)
-                        
-                        if not self._shutdown_event.is_set():
-                            self._safe_js_call(f'handleQRDetection({json.dumps(result)})')
-                        
-                        def remove_code():
-                            if not self._shutdown_event.is_set():
-                                self.scanned_codes.discard(qr_data)
-                        
-                        timer = threading.Timer(self.settings["duplicate_scan_timeout"], remove_code)
-                        timer.daemon = True
-                        timer.start()
+                    try:
+                        qr_data = barcode.data.decode('utf-8')
+                    except UnicodeDecodeError:
+                        if barcode.data not in self.scanned_codes:
+                            self.scanned_codes.add(barcode.data)
+                            self._log_event("decode_error", binascii.hexlify(barcode.data[:64]).decode(),
+                                            detail=f"{barcode.type} payload is not UTF-8")
+                        continue
+                    decoded.append((qr_data, barcode.rect))
+                    if tracker and not (masked and qr_data in tracked):
+                        tracker.observe(gray, qr_data, barcode.rect)
+                    if qr_data not in tracked:
+                        detections.append((qr_data, barcode.rect))
+                
+                # A code held up through its whole track is never decoded again, so tracked
+                # codes re-enter the duplicate check here once duplicate_scan_timeout expires
+                for qr_data, _ in detections:
+                    if qr_data not in self.scanned_codes and not self._shutdown_event.is_set():
+                        self._report_code(qr_data, compiled.duplicate_scan_timeout)
+                
+                if tracker and full:
+                    tracker.verify(decoded)
                 
                 # Only update frame if window is still available
                 frame_count += 1
                 if frame_count % 2 == 0 and not self._window_closed:
                     try:
-                        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.settings["camera_quality"]])
-                        frame_base64 = base64.b64encode(buffer).decode('utf-8')
-                        success = self._safe_js_call(f'updateCameraFrame("data:image/jpeg;base64,{frame_base64}")')
-                        if not success and not self._window_closed:
-                            print("Failed to update camera frame - UI may be unavailable")
+                        with self.metrics.timer('encode'):
+                            preview = pool.preview()
+                            self._draw_detections(preview, detections, pool.scale)
+                            frame_base64 = pool.encode_preview()
+                        if frame_base64 is not None:
+                            success = self._safe_js_call('updateCameraFrame("data:image/jpeg;base64,' + frame_base64 + '")')
+                            if not success and not self._window_closed:
+                                print("Failed to update camera frame - UI may be unavailable")
                     except Exception as e:
                         if not self._window_closed:
                             print(f"Frame encoding error: {e}")
                         break
                 
-                time_module.sleep(fps_delay)
+                time_module.sleep(compiled.fps_delay)
                 
             except Exception as e:
                 if not self._shutdown_event.is_set() and not self._window_closed:
@@ -495,7 +3196,40 @@ class QRScannerAPI:
         if not self._window_closed:
             self._safe_js_call(f'updateCameraStatus(false)')
         
-        self._cleanup_camera()
+        # Loop ended on its own (read failure or error); the handle may be dead, so release it
+        if self.camera_active:
+            self.camera_active = False
+            self._camera_wanted = False
+            self.camera_manager.submit(self._stop_camera_job, True)
+
+    def _report_code(self, qr_data, duplicate_timeout):
+        """Record a payload not seen within the duplicate timeout and tell the frontend"""
+        self.scanned_codes.add(qr_data)
+        if self.roster and qr_data not in self.roster:
+            self._log_event("unknown_code", qr_data, detail="not in the registered roster")
+        result = self.record_attendance(self.roster.get(qr_data, qr_data), code=qr_data)
+        
+        if not self._shutdown_event.is_set():
+            self._safe_js_call(f'handleQRDetection({json.dumps(result)})')
+        
+        def remove_code():
+            if not self._shutdown_event.is_set():
+                self.scanned_codes.discard(qr_data)
+        
+        timer = threading.Timer(duplicate_timeout, remove_code)
+        timer.daemon = True
+        timer.start()
+
+    def _draw_detections(self, image, detections, scale):
+        """Draw QR boxes and labels onto the preview image in place"""
+        for qr_data, (x, y, w, h) in detections:
+            x, y, w, h = int(x * scale), int(y * scale), int(w * scale), int(h * scale)
+            cv2.rectangle(image, (x, y), (x + w, y + h), (46, 204, 113), 3)
+            
+            text = f"Name: {self.roster.get(qr_data, qr_data)}"
+            (text_w, text_h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+            cv2.rectangle(image, (x, y - text_h - 10), (x + text_w + 10, y), (46, 204, 113), -1)
+            cv2.putText(image, text, (x + 5, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
 
     def _safe_js_call(self, js_code):
         """Safely execute JavaScript with proper error handling"""
@@ -506,9 +3240,11 @@ class QRScannerAPI:
             if webview.windows and len(webview.windows) > 0:
                 window = webview.windows[0]
                 if hasattr(window, 'evaluate_js') and not self._window_closed:
-                    window.evaluate_js(js_code)
+                    with self.metrics.timer('js_dispatch'):
+                        window.evaluate_js(js_code)
                     return True
         except Exception as e:
+            self.metrics.incr('js_errors')
             error_msg = str(e).lower()
             # Check for WebView2 disposal or other shutdown-related errors
             if any(keyword in error_msg for keyword in [
@@ -532,24 +3268,8 @@ class QRScannerAPI:
         self._camera_cleanup_done = True
         
         try:
-            if self.cap:
-                if self.cap.isOpened():
-                    self.cap.release()
-                self.cap = None
-            
-            # Give time for cleanup
-            time_module.sleep(0.5)
-            
-            # Force cleanup of OpenCV windows
-            try:
-                cv2.destroyAllWindows()
-                cv2.waitKey(1)
-            except:
-                pass
-            
-            # Force garbage collection
-            gc.collect()
-            
+            self.cap = None
+            self.camera_manager.shutdown()
             print("Camera resources cleaned up")
         except Exception as e:
             print(f"Camera cleanup error: {e}")
@@ -565,6 +3285,7 @@ class QRScannerAPI:
         self._shutdown_event.set()
         
         # Stop camera first
+        self._camera_wanted = False
         self.camera_active = False
         
         # Wait for camera thread to finish
@@ -575,6 +3296,21 @@ class QRScannerAPI:
         if not hasattr(self, '_camera_cleanup_done'):
             self._cleanup_camera()
         
+        # Stop background services
+        if hasattr(self, 'scheduler'):
+            self.scheduler.stop()
+        if getattr(self, 'event_log', None):
+            self.event_log.close()
+        if hasattr(self, 'backup_service'):
+            self.backup_service.stop()
+        self.stop_sync()
+        
+        # Persist metrics and any running profile
+        if self.profiler and self.profiler.running:
+            self.set_profiler(False)
+        if self.metrics.counters:
+            self.dump_metrics()
+        
         # Close database connection
         try:
             if hasattr(self, 'conn') and self.conn:
@@ -586,282 +3322,62 @@ class QRScannerAPI:
         print("Cleanup completed")
 
     def stop_camera(self):
-        """Stop camera scanning"""
+        """Stop camera scanning; the device is parked in the background"""
+        self._camera_wanted = False
+        self.camera_active = False
+        self._emit_camera_event("stopping", "Stopping camera...")
+        self.camera_manager.submit(self._stop_camera_job)
+        return {'success': True, 'message': 'Camera stopping', 'state': 'stopping'}
+
+    def _stop_camera_job(self, failed=False):
+        """Wait for the loop to exit and park the device (camera worker thread)
+
+        After a failure the device is released instead: a disconnected capture
+        still reports isOpened() and acquire() would hand it back.
+        """
+        if failed:
+            self.camera_manager.release()
+        if self._camera_wanted:
+            # Restarted before this job ran
+            return
         self.camera_active = False
-        
-        # Wait for camera thread to finish
         if self.camera_thread and self.camera_thread.is_alive():
-            self.camera_thread.join(timeout=2.0)  # Increased timeout
-        
-        # Ensure camera is properly released
-        if self.cap:
-            if self.cap.isOpened():
-                self.cap.release()
-            self.cap = None
-        
-        # Force OpenCV cleanup
-        cv2.destroyAllWindows()
-        cv2.waitKey(1)
-        
-        # Force garbage collection
-        gc.collect()
-        
-        # Small delay to ensure cleanup
-        time_module.sleep(0.5)
-        
+            self.camera_thread.join(timeout=2.0)
+        self.cap = None
+        if not failed:
+            self.camera_manager.park()
         self._safe_js_call(f'updateCameraStatus(false)')
-        
-        return {'success': True, 'message': 'Camera stopped'}
+        self._emit_camera_event("stopped", "Camera stopped")
 
     def manual_entry(self, name):
         """Manual attendance entry"""
         if not name or not name.strip():
             return {'success': False, 'message': 'Name cannot be empty'}
-        return self.record_attendance(name.strip())
+        return self.record_attendance(name.strip(), source="manual")
     
     def toggle_camera(self):
         """Toggle camera on/off"""
-        if self.camera_active:
+        if self._camera_wanted:
             return self.stop_camera()
         else:
             return self.start_camera()
     
-    @contextmanager
-    def open_workbook(self, file_path):
-        """Context manager for safely opening Excel workbooks"""
-        wb = None
-        try:
-            if os.path.exists(file_path):
-                os.chmod(file_path, 0o666)
-            wb = load_workbook(file_path, data_only=False)
-            yield wb
-        except PermissionError as e:
-            raise Exception(f"File is locked or in use: {e}")
-        finally:
-            if wb:
-                try:
-                    wb.close()
-                except:
-                    pass
-                wb = None
-            gc.collect()
-            time_module.sleep(0.2)
-    
-    def update_sf2_automated(self):
+    def update_sf2_automated(self, source=None):
         """Update SF2 Automated.xlsx with attendance data"""
-        try:
-            sf2_file = "_internal/data/SF2 Automated.xlsx"
-            
-            if not os.path.exists(sf2_file):
-                return {'success': False, 'message': 'SF2 Automated.xlsx not found'}
-            
-            backup_file = f"{sf2_file}.backup"
-            shutil.copy2(sf2_file, backup_file)
-            
-            with self.open_workbook(sf2_file) as wb:
-                ws = wb.active
-                
-                dates = []
-                for col in range(4, 29):
-                    cell = ws.cell(row=11, column=col)
-                    if cell.value:
-                        try:
-                            if isinstance(cell.value, datetime):
-                                date_str = cell.value.strftime(self.settings["date_format"])
-                            else:
-                                date_str = datetime.strptime(str(cell.value), self.settings["date_format"]).strftime(self.settings["date_format"])
-                            dates.append((col, date_str))
-                        except ValueError:
-                            continue
-                
-                all_dates = [date_str for _, date_str in dates]
-                if not all_dates:
-                    return {'success': False, 'message': 'No valid dates found in SF2'}
-                
-                placeholders = ','.join(['?' for _ in all_dates])
-                self.cursor.execute(f"""
-                    SELECT date, name, time FROM attendance 
-                    WHERE date IN ({placeholders})
-                """, all_dates)
-                
-                attendance_lookup = {}
-                for date, name, time in self.cursor.fetchall():
-                    attendance_lookup[(date, name)] = time
-                
-                changes_made = 0
-                name_ranges = [(14, 43), (46, 75)]
-                
-                for start_row, end_row in name_ranges:
-                    for row in range(start_row, end_row + 1):
-                        name_cell = ws[f'B{row}']
-                        if not name_cell.value:
-                            continue
-                        
-                        name = str(name_cell.value).strip()
-                        
-                        for col, date_str in dates:
-                            cell = ws.cell(row=row, column=col)
-                            
-                            if cell.data_type == 'f':
-                                continue
-                            
-                            is_present = (date_str, name) in attendance_lookup
-                            new_value = 0 if is_present else "x"
-                            
-                            if cell.value != new_value:
-                                cell.value = new_value
-                                if new_value == "x":
-                                    cell.font = Font(color="000000")
-                                changes_made += 1
-                
-                if changes_made > 0:
-                    wb.save(sf2_file)
-                    return {'success': True, 'message': f'Updated {changes_made} cells in SF2'}
-                else:
-                    return {'success': True, 'message': 'SF2 already up-to-date'}
-                    
-        except Exception as e:
-            if os.path.exists(backup_file):
-                shutil.copy2(backup_file, sf2_file)
-            return {'success': False, 'message': f'Error updating SF2: {str(e)}'}
-        finally:
-            if os.path.exists(backup_file):
-                try:
-                    os.remove(backup_file)
-                except:
-                    pass
+        return self.sf2.update_automated(source or self.archive)
     
-    def update_sf2_late_arrivals(self):
+    def update_sf2_late_arrivals(self, source=None):
         """Update SF2 with black triangles for late arrivals"""
-        try:
-            sf2_file = "_internal/data/SF2 Automated.xlsx"
-            
-            if not os.path.exists(sf2_file):
-                return {'success': False, 'message': 'SF2 Automated.xlsx not found'}
-            
-            backup_file = f"{sf2_file}.backup"
-            shutil.copy2(sf2_file, backup_file)
-            
-            with self.open_workbook(sf2_file) as wb:
-                ws = wb.active
-                
-                name_ranges = [
-                    (14, 43),
-                    (46, 75)
-                ]
-                
-                dates = []
-                for col in range(4, 29):
-                    cell = ws.cell(row=11, column=col)
-                    if cell.value:
-                        try:
-                            if isinstance(cell.value, datetime):
-                                date_str = cell.value.strftime(self.settings["date_format"])
-                            else:
-                                date_str = datetime.strptime(str(cell.value), self.settings["date_format"]).strftime(self.settings["date_format"])
-                            dates.append((col, date_str))
-                        except ValueError:
-                            continue
-                
-                late_arrivals_count = 0
-                # Use the configurable late arrival time
-                cutoff_time = datetime.strptime(self.settings["late_arrival_time"], "%H:%M").time()
-                
-                for start_row, end_row in name_ranges:
-                    for row in range(start_row, end_row + 1):
-                        name_cell = ws[f'B{row}']
-                        if not name_cell.value:
-                            continue
-                        
-                        name = str(name_cell.value).strip()
-                        
-                        for col, date_str in dates:
-                            cell = ws.cell(row=row, column=col)
-                            
-                            if cell.data_type == 'f':
-                                continue
-                            
-                            self.cursor.execute(
-                                "SELECT time FROM attendance WHERE date=? AND name=?",
-                                (date_str, name)
-                            )
-                            result = self.cursor.fetchone()
-                            
-                            if result:
-                                try:
-                                    attendance_time_str = result[0]
-                                    attendance_time = datetime.strptime(attendance_time_str, self.settings["time_format"]).time()
-                                    
-                                    if attendance_time > cutoff_time:
-                                        cell.value = None
-                                        cell.number_format = 'General'
-                                        
-                                        self.add_late_marker_to_cell(ws, cell)
-                                        late_arrivals_count += 1
-                                        
-                                except (ValueError, TypeError) as e:
-                                    print(f"Error parsing time for {name} on {date_str}: {e}")
-                                    continue
-                
-                if late_arrivals_count > 0:
-                    wb.save(sf2_file)
-                    return {'success': True, 'message': f'Added {late_arrivals_count} late arrival markers'}
-                else:
-                    return {'success': True, 'message': 'No late arrivals found'}
-                    
-        except Exception as e:
-            if os.path.exists(backup_file):
-                shutil.copy2(backup_file, sf2_file)
-            return {'success': False, 'message': f'Error updating late arrivals: {str(e)}'}
-        finally:
-            if os.path.exists(backup_file):
-                try:
-                    os.remove(backup_file)
-                except:
-                    pass
-    
-    def add_late_marker_to_cell(self, worksheet, cell):
-        """Add a black triangle image in the upper left corner of the cell"""
-        try:
-            triangle_image_path = "_internal/data/late.png"
-            
-            if not os.path.exists(triangle_image_path):
-                print(f"Triangle image not found at {triangle_image_path}")
-                self.add_triangle_border_fallback(cell)
-                return
-            
-            img = Image(triangle_image_path)
-            cell_coord = cell.coordinate
-            img.anchor = cell_coord
-            worksheet.add_image(img)
-            
-        except Exception as img_error:
-            print(f"Error adding image: {img_error}")
-            self.add_triangle_border_fallback(cell)
-    
-    def add_triangle_border_fallback(self, cell):
-        """Fallback method to visually indicate late arrival with borders"""
-        try:
-            thin_border = Side(border_style="thin", color="000000")
-            cell.border = Border(top=thin_border, left=thin_border)
-            cell.comment = "Late arrival"
-            
-        except Exception as e:
-            print(f"Error adding fallback border: {e}")
+        return self.sf2.update_late_arrivals(source or self.archive)
     
     def open_sf2_file(self):
         """Open SF2 file after updating"""
         try:
-            # Update SF2 first
-            update_result = self.update_sf2_automated()
+            # Present/absent marks, then late arrivals, as one locked update
+            update_result = self.sf2.update(self.archive)
             if not update_result['success']:
                 return update_result
             
-            # Update late arrivals
-            late_result = self.update_sf2_late_arrivals()
-            if not late_result['success']:
-                return late_result
-            
             # Then open the file
             sf2_file = "_internal/data/SF2 Automated.xlsx"
             file_path = os.path.abspath(sf2_file)
@@ -886,7 +3402,365 @@ def on_window_close():
         on_window_close.api.set_window_closed()
 
 
+ID_CARD_PAYLOAD_PREFIX = "SAM1:"
+
+
+def read_roster(file_path, date_format="%m/%d/%y"):
+    """Read students from a CSV (name[, section][, lrn] columns) or the SF2 name column"""
+    students = []
+    if file_path.lower().endswith((".xlsx", ".xlsm")):
+        layout = SF2Layout.detect(file_path, date_format)
+        return [{'name': name, 'section': '', 'lrn': ''} for _, name in layout.name_rows]
+
+    with open(file_path, newline='', encoding='utf-8-sig') as f:
+        first_line = f.readline()
+        f.seek(0)
+        # A header row is recognised by its "name" column
+        if 'name' in [cell.strip().lower() for cell in next(csv.reader([first_line]), [])]:
+            for row in csv.DictReader(f):
+                row = {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+                if row.get('name'):
+                    students.append({'name': row['name'], 'section': row.get('section', ''),
+                                     'lrn': row.get('lrn', '')})
+        else:
+            for row in csv.reader(f):
+                if row and row[0].strip():
+                    padded = [cell.strip() for cell in row] + ['', '']
+                    students.append({'name': padded[0], 'section': padded[1], 'lrn': padded[2]})
+    return students
+
+
+def student_payload(student):
+    """Short, stable QR payload: the LRN when known, otherwise a hash of name and section"""
+    if student.get('lrn'):
+        return f"{ID_CARD_PAYLOAD_PREFIX}{student['lrn']}"
+    digest = hashlib.sha1(f"{student['name']}|{student.get('section', '')}".encode('utf-8')).hexdigest()
+    return f"{ID_CARD_PAYLOAD_PREFIX}{digest[:12].upper()}"
+
+
+def render_qr(payload, size):
+    """Render a QR code (error correction M, 4-module quiet zone) as a size x size grayscale array"""
+    params = cv2.QRCodeEncoder_Params()
+    params.correction_level = cv2.QRCodeEncoder_CORRECT_LEVEL_M
+    code = cv2.QRCodeEncoder.create(params).encode(payload)
+    code = cv2.copyMakeBorder(code, 4, 4, 4, 4, cv2.BORDER_CONSTANT, value=255)
+    # Whole pixels per module keep edges sharp for the decoder
+    module_px = max(1, size // code.shape[0])
+    return cv2.resize(code, (code.shape[1] * module_px, code.shape[0] * module_px),
+                      interpolation=cv2.INTER_NEAREST)
+
+
+def render_card_sheet(job):
+    """Render one A4 sheet of ID cards to PNG (runs in a worker process)"""
+    from PIL import Image as PILImage, ImageDraw, ImageFont
+
+    page_number, students, out_dir, school_name, dpi = job
+    mm = dpi / 25.4
+    page_w, page_h = int(210 * mm), int(297 * mm)
+    card_w, card_h = int(85.6 * mm), int(54 * mm)
+    columns, rows = 2, 5
+    margin_x = (page_w - columns * card_w) // 2
+    margin_y = (page_h - rows * card_h) // 2
+
+    def font(size):
+        for name in ["arialbd.ttf", "arial.ttf", "DejaVuSans-Bold.ttf", "DejaVuSans.ttf"]:
+            try:
+                return ImageFont.truetype(name, size)
+            except OSError:
+                continue
+        return ImageFont.load_default()
+
+    name_font, small_font = font(int(4.2 * mm)), font(int(3 * mm))
+    sheet = PILImage.new("L", (page_w, page_h), 255)
+    draw = ImageDraw.Draw(sheet)
+    qr_size = card_h - int(8 * mm)
+
+    for slot, student in enumerate(students):
+        column, row = slot % columns, slot // columns
+        x, y = margin_x + column * card_w, margin_y + row * card_h
+        draw.rectangle([x, y, x + card_w - 1, y + card_h - 1], outline=160, width=2)
+
+        qr = PILImage.fromarray(render_qr(student['payload'], qr_size))
+        sheet.paste(qr, (x + int(4 * mm), y + (card_h - qr.height) // 2))
+
+        text_x = x + int(8 * mm) + qr.width
+        text_y = y + int(8 * mm)
+        if school_name:
+            draw.text((text_x, text_y), school_name, font=small_font, fill=80)
+            text_y += int(7 * mm)
+        text_width = x + card_w - int(3 * mm) - text_x
+        fitted_font, size = name_font, int(4.2 * mm)
+        # Long names step down in size rather than running off the card
+        while draw.textlength(student['name'], font=fitted_font) > text_width and size > int(2.4 * mm):
+            size -= 2
+            fitted_font = font(size)
+        draw.text((text_x, text_y), student['name'], font=fitted_font, fill=0)
+        text_y += int(7 * mm)
+        for detail in [student.get('section'), f"LRN {student['lrn']}" if student.get('lrn') else None]:
+            if detail:
+                draw.text((text_x, text_y), detail, font=small_font, fill=60)
+                text_y += int(5 * mm)
+
+    file_path = os.path.join(out_dir, f"id_cards_{page_number:04d}.png")
+    sheet.save(file_path, dpi=(dpi, dpi), optimize=False, compress_level=1)
+    return file_path
+
+
+class IDCardGenerator:
+    """Renders printable QR ID card sheets in worker processes and registers the payloads"""
+    CARDS_PER_SHEET = 10
+    STUDENTS_TABLE = """
+        CREATE TABLE IF NOT EXISTS students (
+            payload TEXT PRIMARY KEY,
+            name TEXT,
+            section TEXT,
+            lrn TEXT
+        )
+    """
+
+    def __init__(self, db_path, out_dir, school_name="", dpi=200, workers=None):
+        self.db_path = db_path
+        self.out_dir = out_dir
+        self.school_name = school_name
+        self.dpi = dpi
+        self.workers = workers
+
+    def register(self, students):
+        """Store payload -> student rows so scans resolve to names without parsing"""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                # The CLI may run before the app has ever created the database
+                conn.execute(self.STUDENTS_TABLE)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO students (payload, name, section, lrn) VALUES (?, ?, ?, ?)",
+                    [(s['payload'], s['name'], s.get('section', ''), s.get('lrn', '')) for s in students]
+                )
+        finally:
+            conn.close()
+
+    def generate(self, students, formats=("png", "pdf")):
+        start = time_module.perf_counter()
+        os.makedirs(self.out_dir, exist_ok=True)
+        students = [dict(student, payload=student_payload(student)) for student in students]
+        self.register(students)
+
+        jobs = [
+            (number + 1, students[i:i + self.CARDS_PER_SHEET], self.out_dir, self.school_name, self.dpi)
+            for number, i in enumerate(range(0, len(students), self.CARDS_PER_SHEET))
+        ]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pages = list(pool.map(render_card_sheet, jobs, chunksize=4))
+
+        pdf_file = None
+        if "pdf" in formats and pages:
+            from PIL import Image as PILImage
+
+            pdf_file = os.path.join(self.out_dir, "id_cards.pdf")
+            first = PILImage.open(pages[0])
+            # A generator keeps only one page image in memory at a time
+            first.save(pdf_file, "PDF", resolution=self.dpi, save_all=True,
+                       append_images=(PILImage.open(page) for page in pages[1:]))
+        if "png" not in formats:
+            for page in pages:
+                os.remove(page)
+            pages = []
+
+        return {
+            'success': True,
+            'message': f'Generated {len(students)} ID cards',
+            'students': len(students),
+            'pages': pages,
+            'pdf': pdf_file,
+            'duration_s': round(time_module.perf_counter() - start, 2)
+        }
+
+
+def verify_id_cards(pages, expected):
+    """Decode every code on the generated sheets with pyzbar; returns payloads that were not found"""
+    found = set()
+    for page in pages:
+        for barcode in pyzbar.decode(cv2.imread(page, cv2.IMREAD_GRAYSCALE)):
+            found.add(barcode.data.decode('utf-8'))
+    return sorted(set(expected) - found)
+
+
+def run_idcards(args):
+    """Generate ID cards for a roster from the command line"""
+    students = read_roster(args.roster)
+    if not students:
+        print(f"No students found in {args.roster}")
+        return 1
+
+    generator = IDCardGenerator(args.db, args.out, school_name=args.school, dpi=args.dpi, workers=args.workers)
+    result = generator.generate(students, formats=args.formats.split(","))
+    print(f"{result['message']} on {len(result['pages']) or 'no'} PNG sheet(s) in {result['duration_s']} s")
+    if result['pdf']:
+        print(f"PDF: {result['pdf']}")
+
+    if args.verify and result['pages']:
+        missing = verify_id_cards(result['pages'], [student_payload(s) for s in students])
+        if missing:
+            print(f"{len(missing)} code(s) did not decode: {', '.join(missing[:10])}")
+            return 1
+        print("All codes decoded with pyzbar")
+    return 0
+
+
+def run_export(args):
+    """Export attendance history from the command line"""
+    date_format = args.date_format
+    if not date_format:
+        date_format = "%m/%d/%y"
+        settings_file = os.path.join(os.path.dirname(args.db), "settings.json")
+        if os.path.exists(settings_file):
+            with open(settings_file, 'r') as f:
+                date_format = json.load(f).get("date_format", date_format)
+
+    try:
+        start = datetime.strptime(args.start, "%Y-%m-%d").date() if args.start else None
+        end = datetime.strptime(args.end, "%Y-%m-%d").date() if args.end else None
+    except ValueError:
+        print("Dates must be in YYYY-MM-DD format")
+        return 1
+
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    archive = AttendanceArchive(args.db, args.archive_dir, date_format)
+    exporter = AttendanceExporter(archive, chunk_size=args.chunk_size)
+    result = exporter.export(args.output, fmt, start, end, args.section or None)
+    if result['success']:
+        print(f"{result['message']} in {result['duration_s']} s")
+        return 0
+    print(result['message'])
+    return 1
+
+
+def run_events(args):
+    """Query or replay a day's scan events from the command line"""
+    try:
+        day = datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else datetime.now().date()
+        since = datetime.strptime(args.since, "%H:%M").time() if args.since else None
+        until = datetime.strptime(args.until, "%H:%M").time() if args.until else None
+    except ValueError:
+        print("Use YYYY-MM-DD for --date and HH:MM for --since/--until")
+        return 1
+
+    log = EventLog(args.dir)
+    if not os.path.exists(log.path_for(day)):
+        print(f"No event log for {day.isoformat()} in {args.dir}")
+        return 1
+
+    start = time_module.perf_counter()
+    events = log.query(day, since, until, args.type, args.search)
+    read_time = time_module.perf_counter() - start
+
+    if args.summary:
+        counts = {}
+        for event in events:
+            counts[event['type']] = counts.get(event['type'], 0) + 1
+        for event_type, count in sorted(counts.items(), key=lambda item: -item[1]):
+            print(f"{event_type:<14}{count:>8}")
+    else:
+        previous = None
+        for event in events:
+            if args.replay and previous is not None:
+                # Replay with the original gaps, compressed by the speed factor
+                time_module.sleep(min(max(event['ts'] - previous, 0) / args.replay, 5.0))
+            previous = event['ts']
+            moment = datetime.fromtimestamp(event['ts']).strftime("%H:%M:%S.%f")[:-3]
+            who = event['name'] or event['code']
+            print(f"{moment}  {event['type']:<13} {event['source']:<7} {who}  {event['detail']}")
+    print(f"{len(events)} event(s) read in {read_time * 1000:.1f} ms")
+    return 0
+
+
+def run_aggregator(args):
+    """Run a headless aggregation node until interrupted"""
+    settings = SettingsStore(args.settings, DEFAULT_SETTINGS)
+    settings.load()
+    token = args.token if args.token is not None else settings.values["sync_token"]
+    if args.host not in ("127.0.0.1", "localhost", "::1") and not token:
+        print("Refusing to listen beyond this machine without a sync token (--token or sync_token in settings)")
+        return 2
+
+    data_dir = os.path.dirname(args.sf2)
+    sf2 = SF2Updater(args.sf2, settings, SF2LayoutCache(os.path.join(data_dir, "sf2_layout.json")),
+                     late_image=os.path.join(data_dir, "late.png"))
+    aggregator = SyncAggregator(args.db, settings, host=args.host, port=args.port, sf2=sf2, token=token)
+    aggregator.start()
+    print(f"SAM aggregator listening on http://{args.host}:{aggregator.port} (db: {args.db})")
+    try:
+        while True:
+            time_module.sleep(1)
+    except KeyboardInterrupt:
+        print("Interrupted by user")
+    finally:
+        aggregator.stop()
+
+
+def run_cli(argv):
+    """Command-line tools that run without the webview window"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="sam", description="SAM - School Attendance Management tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    aggregator_parser = commands.add_parser("aggregator", help="Run a headless multi-station aggregation node")
+    aggregator_parser.add_argument("--host", default="127.0.0.1", help="other hosts need a sync token")
+    aggregator_parser.add_argument("--port", type=int, default=8765)
+    aggregator_parser.add_argument("--db", default="_internal/data/aggregate.db")
+    aggregator_parser.add_argument("--token", help="shared sync token (default: sync_token from settings)")
+    aggregator_parser.add_argument("--settings", default="_internal/data/settings.json")
+    aggregator_parser.add_argument("--sf2", default="_internal/data/SF2 Automated.xlsx",
+                                   help="workbook updated by POST /sf2")
+    aggregator_parser.set_defaults(handler=run_aggregator)
+
+    idcards_parser = commands.add_parser("idcards", help="Generate printable QR ID cards from a roster")
+    idcards_parser.add_argument("roster", help="CSV with name[, section][, lrn] columns or an SF2 workbook")
+    idcards_parser.add_argument("--out", default="_internal/data/idcards")
+    idcards_parser.add_argument("--db", default="_internal/data/attendance.db")
+    idcards_parser.add_argument("--school", default="")
+    idcards_parser.add_argument("--formats", default="png,pdf", help="comma separated: png, pdf")
+    idcards_parser.add_argument("--dpi", type=int, default=200)
+    idcards_parser.add_argument("--workers", type=int, default=None)
+    idcards_parser.add_argument("--verify", action="store_true", help="decode every sheet with pyzbar afterwards")
+    idcards_parser.set_defaults(handler=run_idcards)
+
+    export_parser = commands.add_parser("export", help="Export attendance history to CSV, Parquet or Arrow")
+    export_parser.add_argument("output", help="output file; the extension picks the format unless --format is given")
+    export_parser.add_argument("--format", choices=sorted(AttendanceExporter.FORMATS))
+    export_parser.add_argument("--start", help="first date, YYYY-MM-DD")
+    export_parser.add_argument("--end", help="last date, YYYY-MM-DD")
+    export_parser.add_argument("--section", action="append", help="repeat to include several sections")
+    export_parser.add_argument("--db", default="_internal/data/attendance.db")
+    export_parser.add_argument("--archive-dir", default="_internal/data/archive")
+    export_parser.add_argument("--date-format", help="date format stored in the database (default: from settings)")
+    export_parser.add_argument("--chunk-size", type=int, default=5000)
+    export_parser.set_defaults(handler=run_export)
+
+    events_parser = commands.add_parser("events", help="Query or replay the scan event log")
+    events_parser.add_argument("--date", help="day to read, YYYY-MM-DD (default: today)")
+    events_parser.add_argument("--since", help="HH:MM")
+    events_parser.add_argument("--until", help="HH:MM")
+    events_parser.add_argument("--type", action="append", choices=EventLog.TYPES, help="repeat for several types")
+    events_parser.add_argument("--search", help="substring of the code or name")
+    events_parser.add_argument("--summary", action="store_true", help="print counts per event type")
+    events_parser.add_argument("--replay", type=float, metavar="SPEED",
+                               help="print with the original timing, SPEED times faster")
+    events_parser.add_argument("--dir", default="_internal/data/events")
+    events_parser.set_defaults(handler=run_events)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
 def main():
+    if len(sys.argv) > 1:
+        return run_cli(sys.argv[1:])
+
     api = QRScannerAPI()
     on_window_close.api = api  # Store reference for cleanup
     
@@ -918,5 +3792,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # ID card rendering uses worker processes, which re-run this script when frozen
+    multiprocessing.freeze_support()
     main()
 
@@ -0,0 +1,58 @@
+import importlib.util
+import json
+import os
+import sys
+import types
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HYMNAL_DIR = os.path.join(ROOT, "Python Hymnal")
+
+
+@pytest.fixture(scope="session")
+def sam():
+    """sam v2.4.py as a module; only the window needs pywebview, so it may be absent"""
+    try:
+        import webview  # noqa: F401
+    except ImportError:
+        sys.modules["webview"] = types.ModuleType("webview")
+    spec = importlib.util.spec_from_file_location("sam_app", os.path.join(ROOT, "sam v2.4.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["sam_app"] = module
+    try:
+        spec.loader.exec_module(module)
+    except ImportError as e:
+        # cv2, pyzbar's zbar library and openpyxl are real requirements of the app
+        pytest.skip(f"sam v2.4.py cannot be imported here: {e}")
+    return module
+
+
+@pytest.fixture
+def settings(sam, tmp_path):
+    store = sam.SettingsStore(str(tmp_path / "settings.json"), sam.DEFAULT_SETTINGS)
+    store.load()
+    return store
+
+
+@pytest.fixture
+def api(sam, tmp_path, monkeypatch):
+    """A QRScannerAPI working in tmp_path with the background services switched off"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "_internal" / "data").mkdir(parents=True)
+    (tmp_path / "_internal" / "data" / "settings.json").write_text(json.dumps({
+        "auto_backup": False, "sync_role": "off", "sampling_profiler": False,
+        "camera_fps": 60, "duplicate_scan_timeout": 1}))
+    api = sam.QRScannerAPI()
+    yield api
+    api.cleanup()
+
+
+@pytest.fixture(scope="session")
+def hymn_library():
+    """Python Hymnal/hymn_library.py, imported the way the Hymnal apps next to it do"""
+    if HYMNAL_DIR not in sys.path:
+        sys.path.insert(0, HYMNAL_DIR)
+    import hymn_library
+    return hymn_library
@@ -0,0 +1,56 @@
+import sqlite3
+
+
+def make_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE attendance (date TEXT, time TEXT, name TEXT, UNIQUE(date, name))")
+    conn.executemany("INSERT INTO attendance (date, time, name) VALUES (?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def rows(path, table="attendance"):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(conn.execute(f"SELECT date, time, name FROM {table}").fetchall())
+    finally:
+        conn.close()
+
+
+def test_archiving_is_off_by_default(sam):
+    assert sam.DEFAULT_SETTINGS["auto_archive"] is False
+
+
+def test_conflicting_rows_stay_in_the_live_table(sam, tmp_path):
+    db_path = make_db(tmp_path / "attendance.db", [
+        ("09/02/20", "07:01:00", "Abad, Carlo"),
+        ("09/02/20", "07:30:00", "Cruz, Mark"),
+        ("not a date", "07:00:00", "Dizon, Ana"),
+    ])
+    archive = sam.AttendanceArchive(db_path, str(tmp_path / "archive"), "%m/%d/%y")
+    # The archive already holds Cruz for that day, with another time
+    (tmp_path / "archive").mkdir()
+    make_db(archive.archive_path(2020), [("09/02/20", "07:45:00", "Cruz, Mark")])
+    backups = []
+
+    result = archive.archive_closed_years(backup=lambda: backups.append(1) or {'success': True})
+
+    assert result['success'] and backups == [1]
+    assert result['archived'] == {"2020-2021": 1}
+    assert result['conflicts'] == {"2020-2021": 1}
+    assert result['unparsed_dates'] == ["not a date"]
+    assert rows(db_path) == [("09/02/20", "07:30:00", "Cruz, Mark"), ("not a date", "07:00:00", "Dizon, Ana")]
+    assert rows(archive.archive_path(2020)) == [("09/02/20", "07:01:00", "Abad, Carlo"),
+                                                ("09/02/20", "07:45:00", "Cruz, Mark")]
+
+
+def test_failed_backup_leaves_the_live_table_alone(sam, tmp_path):
+    live = [("09/02/20", "07:01:00", "Abad, Carlo")]
+    db_path = make_db(tmp_path / "attendance.db", live)
+    archive = sam.AttendanceArchive(db_path, str(tmp_path / "archive"), "%m/%d/%y")
+
+    result = archive.archive_closed_years(backup=lambda: {'success': False, 'message': 'Backup failed: disk full'})
+
+    assert not result['success'] and "disk full" in result['message']
+    assert rows(db_path) == live
@@ -0,0 +1,37 @@
+import gzip
+import sqlite3
+import time
+
+
+def test_backup_after_an_unusable_folder_can_run_again(sam, tmp_path):
+    db_path = tmp_path / "attendance.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE attendance (date TEXT, time TEXT, name TEXT)")
+    conn.commit()
+    conn.close()
+    # A file where the backup folder should be makes os.makedirs fail
+    blocked = tmp_path / "backups"
+    blocked.write_text("")
+    service = sam.BackupService(str(db_path), str(blocked))
+
+    first = service.backup()
+    assert not first['success'] and "already in progress" not in first['message']
+
+    blocked.unlink()
+    second = service.backup()
+    assert second['success']
+    with gzip.open(second['file']) as f:
+        assert f.read(16) == b"SQLite format 3\x00"
+
+
+def test_backup_result_can_be_polled(api):
+    job = api.backup_now()['job']
+
+    deadline = time.monotonic() + 10
+    while api.get_job_result(job)['status'] == "running" and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    status = api.get_job_result(job)
+    assert status['status'] == "done" and status['kind'] == "backup"
+    assert status['result']['success']
+    assert not api.get_job_result("backup-0")['success']
@@ -0,0 +1,101 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+import pytest
+
+from test_qr_tracker import qr_image
+
+Barcode = namedtuple("Barcode", "data type rect")
+
+
+class HeldCodes:
+    """Capture that holds codes up for a fixed number of frames
+
+    Each code is shown from its start frame onwards, side by side.
+    """
+
+    def __init__(self, codes, frames):
+        cv2 = pytest.importorskip("cv2")
+        self.codes = [(x, start, cv2.cvtColor(qr_image(text), cv2.COLOR_GRAY2BGR))
+                      for x, (text, start) in zip((60, 360), codes)]
+        self.frames = frames
+        self.position = 0
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+    def read(self, image=None):
+        if self.position >= self.frames:
+            return False, None
+        frame = np.full((480, 640, 3), 200, np.uint8)
+        for x, start, code in self.codes:
+            if self.position >= start:
+                frame[150:270, x:x + 120] = code
+        self.position += 1
+        return True, frame
+
+
+def detect(image, *args, **kwargs):
+    cv2 = pytest.importorskip("cv2")
+    found, texts, points, _ = cv2.QRCodeDetector().detectAndDecodeMulti(image)
+    if not found:
+        return []
+    barcodes = []
+    for text, corners in zip(texts, points):
+        if text:
+            x, y, w, h = cv2.boundingRect(corners.astype(np.int32))
+            barcodes.append(Barcode(text.encode("utf-8"), "QRCODE", (x, y, w, h)))
+    return barcodes
+
+
+@pytest.fixture
+def scanner(sam, api, monkeypatch):
+    monkeypatch.setattr(sam.pyzbar, "decode", detect)
+    recorded = []
+    monkeypatch.setattr(api, "record_attendance",
+                        lambda name, code="": recorded.append((name, code)) or {'success': True})
+
+    def run(capture):
+        api.cap = capture
+        api.camera_active = True
+        api._camera_wanted = True
+        api._camera_loop()
+        return recorded
+
+    return api, run
+
+
+def test_codes_sharing_a_name_are_each_recorded(scanner):
+    api, run = scanner
+    api.roster = {"ID-1": "Ana Cruz", "ID-2": "Ana Cruz"}
+
+    recorded = run(HeldCodes([("ID-1", 0), ("ID-2", 10)], frames=40))
+
+    # ID-1 may be recorded again if the loop runs past the duplicate timeout
+    assert set(recorded) == {("Ana Cruz", "ID-1"), ("Ana Cruz", "ID-2")}
+
+
+def test_held_code_is_checked_again_after_the_duplicate_timeout(scanner):
+    api, run = scanner
+
+    # About two seconds of footage at 60 fps against a one second timeout
+    recorded = run(HeldCodes([("ID-1", 0)], frames=130))
+
+    assert len(recorded) >= 2
+    assert set(recorded) == {("ID-1", "ID-1")}
+
+
+def test_camera_progress_can_be_polled(scanner, monkeypatch):
+    api, _ = scanner
+    monkeypatch.setattr(api.camera_manager, "acquire", lambda index: None)
+
+    assert api.start_camera()['state'] == "starting"
+    deadline = time.monotonic() + 5
+    while api.get_camera_state()['state'] == "starting" and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert api.get_camera_state() == {'state': "error", 'message': "Could not open camera", 'wanted': False}
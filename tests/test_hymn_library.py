@@ -0,0 +1,310 @@
+import os
+import threading
+import time
+
+import pytest
+
+
+def touch(path, content=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    return str(path)
+
+
+def make_library(root, names):
+    for name in names:
+        touch(os.path.join(root, name))
+    return str(root)
+
+
+def on_disk(hymn_library, root):
+    return {os.path.join(folder, name) for folder, _, files in os.walk(root) for name in files
+            if name.lower().endswith(hymn_library.HYMN_EXTENSIONS)}
+
+
+def indexed(library):
+    return {hymn.path for hymn in library.hymns}
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+@pytest.mark.parametrize("backend", ["poll", "inotify"])
+def test_watcher_keeps_the_index_in_step_with_the_disk(hymn_library, tmp_path, backend):
+    if backend == "inotify" and hymn_library.HymnWatcher._pick_backend() != "inotify":
+        pytest.skip("inotify is not available here")
+    root = make_library(tmp_path / "library", [
+        f"{folder}/{number:03d} - Hymn {number}.pptx"
+        for folder in ("English", "Tagalog") for number in range(1, 41)
+    ])
+    library = hymn_library.HymnLibrary(root).build()
+    watcher = hymn_library.HymnWatcher(library, lambda added, removed: None,
+                                       poll_interval=0.1, backend=backend).start()
+
+    errors, stop = [], threading.Event()
+
+    def search_loop():
+        while not stop.is_set():
+            results = library.search("hymn")
+            scores = [score for score, _ in library.rank("hymn")]
+            if not results or scores != sorted(scores, reverse=True):
+                errors.append(len(results))
+
+    searcher = threading.Thread(target=search_loop, daemon=True)
+    searcher.start()
+    try:
+        english = os.path.join(root, "English")
+        touch(os.path.join(english, "500 - Added Hymn.pptx"))
+        os.remove(os.path.join(english, "001 - Hymn 1.pptx"))
+        os.rename(os.path.join(root, "Tagalog", "002 - Hymn 2.pptx"),
+                  os.path.join(root, "Tagalog", "602 - Renamed Hymn.ppsx"))
+        touch(os.path.join(english, "New Folder", "700 - Nested Hymn.pptx"))
+        time.sleep(0.2)
+        touch(os.path.join(english, "New Folder", "701 - Second Nested Hymn.pptx"))
+
+        assert wait_for(lambda: indexed(library) == on_disk(hymn_library, root))
+    finally:
+        stop.set()
+        searcher.join()
+        watcher.stop()
+    assert not errors
+    assert [hymn.title for hymn in library.search("nested")] == ["700 - Nested Hymn", "701 - Second Nested Hymn"]
+
+
+def test_apply_changes_rescans_a_new_folder_from_its_nearest_known_parent(hymn_library, tmp_path):
+    root = make_library(tmp_path / "library", ["English/001 - Old Hymn.pptx"])
+    library = hymn_library.HymnLibrary(root).build()
+    deep = os.path.join(root, "English", "New", "Deeper")
+    path = touch(os.path.join(deep, "002 - New Hymn.pptx"))
+
+    added, removed = library.apply_changes({deep})
+
+    assert [hymn.path for hymn in added] == [path] and removed == []
+    assert os.path.join(root, "English", "New") in library.folders()
+    assert indexed(library) == on_disk(hymn_library, root)
+
+
+def test_apply_changes_ignores_folders_outside_the_library(hymn_library, tmp_path):
+    root = make_library(tmp_path / "library", ["001 - Old Hymn.pptx"])
+    library = hymn_library.HymnLibrary(root).build()
+
+    assert library.apply_changes({str(tmp_path / "elsewhere")}) == ([], [])
+
+
+def test_build_indexes_only_hymn_files(hymn_library, tmp_path):
+    root = make_library(tmp_path / "library", [
+        "English/001 - Holy, Holy, Holy.pptx", "English/notes.txt", "Tagalog/Sub/010 - Amazing Grace.PPS",
+        "Amazing Grace.ppt", "cover.jpg"])
+
+    library = hymn_library.HymnLibrary(root).build()
+
+    assert indexed(library) == on_disk(hymn_library, root)
+    assert len(library) == 3
+    hymn = library.get(os.path.join(root, "Tagalog", "Sub", "010 - Amazing Grace.PPS"))
+    assert (hymn.title, hymn.number) == ("010 - Amazing Grace", 10)
+    assert library.get(os.path.join(root, "Amazing Grace.ppt")).number is None
+
+
+def test_add_files_indexes_copied_hymns_without_rescanning(hymn_library, tmp_path):
+    root = make_library(tmp_path / "library", ["001 - Holy, Holy, Holy.pptx"])
+    library = hymn_library.HymnLibrary(root).build()
+    copied = touch(os.path.join(root, "002 - Blessed Assurance.pptx"))
+    other = touch(os.path.join(root, "readme.txt"))
+
+    added = library.add_files([copied, other, copied])
+
+    assert [hymn.path for hymn in added] == [copied]
+    assert library.search("blessed")[0].path == copied
+
+
+def age_folders(root, seconds=60):
+    """Move folder mtimes out of RACY_WINDOW_NS so a cache may trust them"""
+    past = time.time() - seconds
+    for folder, _, _ in os.walk(root):
+        os.utime(folder, (past, past))
+
+
+def test_warm_start_reuses_unchanged_folders(hymn_library, tmp_path):
+    root = make_library(tmp_path / "library", [
+        f"{folder}/{number:03d} - Hymn {number}.pptx" for folder in ("A", "B", "C") for number in range(1, 6)])
+    age_folders(root)
+    cache_file = str(tmp_path / "cache" / "hymn_index.json")
+
+    first = hymn_library.HymnLibrary(root, cache_file=cache_file).build()
+    assert first.rescanned == 4
+
+    warm = hymn_library.HymnLibrary(root, cache_file=cache_file).build()
+    assert warm.rescanned == 0
+    assert warm.hymns == first.hymns
+
+    added = touch(os.path.join(root, "B", "099 - Late Addition.pptx"))
+    changed = hymn_library.HymnLibrary(root, cache_file=cache_file).build()
+    assert changed.rescanned == 1
+    assert indexed(changed) == indexed(first) | {added}
+
+
+def test_folder_changed_within_the_racy_window_is_rescanned(hymn_library, tmp_path):
+    root = make_library(tmp_path / "library", ["A/001 - Hymn 1.pptx", "B/002 - Hymn 2.pptx"])
+    age_folders(root)
+    # B was modified just before the scan, so its mtime could still change within the same tick
+    recent = time.time() - hymn_library.RACY_WINDOW_NS / 1e9 / 4
+    os.utime(os.path.join(root, "B"), (recent, recent))
+    cache_file = str(tmp_path / "hymn_index.json")
+    hymn_library.HymnLibrary(root, cache_file=cache_file).build()
+
+    warm = hymn_library.HymnLibrary(root, cache_file=cache_file).build()
+
+    assert warm.rescanned == 1
+
+
+def test_cache_for_another_root_is_ignored(hymn_library, tmp_path):
+    first_root = make_library(tmp_path / "one", ["001 - Hymn 1.pptx"])
+    second_root = make_library(tmp_path / "two", ["002 - Hymn 2.pptx"])
+    age_folders(tmp_path)
+    cache_file = str(tmp_path / "hymn_index.json")
+    hymn_library.HymnLibrary(first_root, cache_file=cache_file).build()
+
+    other = hymn_library.HymnLibrary(second_root, cache_file=cache_file).build()
+
+    assert other.rescanned == 1
+    assert [hymn.title for hymn in other.hymns] == ["002 - Hymn 2"]
+
+
+def test_labels_tell_duplicate_titles_apart(hymn_library, tmp_path):
+    root = make_library(tmp_path / "library", [
+        "English/001 - Amazing Grace.pptx", "English/001 - Amazing Grace.pps",
+        "Tagalog/001 - Amazing Grace.pptx", "English/002 - Blessed Assurance.pptx"])
+    library = hymn_library.HymnLibrary(root).build()
+
+    labels = {os.path.relpath(hymn.path, root): library.label(hymn) for hymn in library.hymns}
+
+    assert labels == {
+        os.path.join("English", "001 - Amazing Grace.pptx"): "001 - Amazing Grace (English, pptx)",
+        os.path.join("English", "001 - Amazing Grace.pps"): "001 - Amazing Grace (English, pps)",
+        os.path.join("Tagalog", "001 - Amazing Grace.pptx"): "001 - Amazing Grace (Tagalog)",
+        os.path.join("English", "002 - Blessed Assurance.pptx"): "002 - Blessed Assurance",
+    }
+    assert len(set(labels.values())) == len(labels)
+
+
+def test_labels_drop_the_folder_once_a_duplicate_is_gone(hymn_library, tmp_path):
+    root = make_library(tmp_path / "library", ["English/Amazing Grace.pptx", "Tagalog/Amazing Grace.pptx"])
+    library = hymn_library.HymnLibrary(root).build()
+    os.remove(os.path.join(root, "Tagalog", "Amazing Grace.pptx"))
+
+    library.apply_changes({os.path.join(root, "Tagalog")})
+
+    assert [library.label(hymn) for hymn in library.hymns] == ["Amazing Grace"]
+    assert library.get(os.path.join(root, "English", "Amazing Grace.pptx")) is library.hymns[0]
+    assert library.get(os.path.join(root, "Tagalog", "Amazing Grace.pptx")) is None
+
+
+TITLES = ["001 - Praise to the Lord", "010 - Holy, Holy, Holy", "100 - Great Is Thy Faithfulness",
+          "108 - Amazing Grace", "109 - Marvelous Grace", "462 - Blessed Assurance", "1000 - Morning Has Broken",
+          "Rock of Ages"]
+
+
+@pytest.fixture
+def index(hymn_library):
+    return hymn_library.HymnSearchIndex(hymn_library.make_hymn(f"/hymns/{title}.pptx") for title in TITLES)
+
+
+def titles(results):
+    return [hymn.title for _, hymn in results]
+
+
+def test_number_queries_go_straight_to_the_hymn(index):
+    for query in ["108", "#108", "hymn 108", "No. 108", "0108"]:
+        assert titles(index.rank(query)) == ["108 - Amazing Grace"], query
+
+
+def test_number_being_typed_lists_longer_numbers(hymn_library, tmp_path, index):
+    # Exact hymn first, then the numbers it starts, in numeric order
+    assert titles(index.rank("10")) == ["010 - Holy, Holy, Holy", "100 - Great Is Thy Faithfulness",
+                                        "108 - Amazing Grace", "109 - Marvelous Grace", "1000 - Morning Has Broken"]
+    assert titles(index.rank("10", limit=2)) == ["010 - Holy, Holy, Holy", "100 - Great Is Thy Faithfulness"]
+    assert titles(index.rank("46")) == ["462 - Blessed Assurance"]
+    assert index.rank("7") == []
+
+    root = make_library(tmp_path / "library", ["108 - Amazing Grace.pptx", "109 - Marvelous Grace.pptx"])
+    library = hymn_library.HymnLibrary(root).build()
+    assert [hymn.title for hymn in library.search("10")] == ["108 - Amazing Grace", "109 - Marvelous Grace"]
+    assert [hymn.title for hymn in library.search("1")] == ["108 - Amazing Grace", "109 - Marvelous Grace"]
+
+
+def test_words_prefixes_and_typos_rank_the_intended_hymn_first(index):
+    assert titles(index.rank("amazing grace"))[0] == "108 - Amazing Grace"
+    assert titles(index.rank("grace")) == ["108 - Amazing Grace", "109 - Marvelous Grace"]
+    assert titles(index.rank("bless"))[0] == "462 - Blessed Assurance"
+    assert titles(index.rank("amazng grace"))[0] == "108 - Amazing Grace"
+    assert titles(index.rank("faithfullness"))[0] == "100 - Great Is Thy Faithfulness"
+    assert titles(index.rank("rock of ages"))[0] == "Rock of Ages"
+    assert index.rank("zebra") == []
+
+
+def test_scores_are_ordered_and_exact_words_beat_prefixes(index):
+    results = index.rank("holy")
+    assert [score for score, _ in results] == sorted((score for score, _ in results), reverse=True)
+    exact = dict((hymn.title, score) for score, hymn in index.rank("grace"))
+    prefix = dict((hymn.title, score) for score, hymn in index.rank("gra"))
+    assert exact["108 - Amazing Grace"] > prefix["108 - Amazing Grace"]
+    assert titles(index.rank("")) == TITLES
+
+
+def test_search_worker_runs_only_the_newest_query(hymn_library):
+    ran, delivered, done = [], [], threading.Event()
+
+    def search(query):
+        ran.append(query)
+        return query.upper()
+
+    def on_results(generation, query, results):
+        delivered.append((generation, query, results))
+        done.set()
+
+    worker = hymn_library.SearchWorker(search, on_results, delay=0.05)
+    try:
+        for query in ["a", "am", "ama", "amaz"]:
+            generation = worker.submit(query)
+        assert done.wait(5)
+        time.sleep(0.1)
+    finally:
+        worker.stop()
+    assert ran == ["amaz"]
+    assert delivered == [(generation, "amaz", "AMAZ")]
+
+
+def test_search_worker_drops_results_that_went_stale(hymn_library):
+    started, release, delivered = threading.Event(), threading.Event(), []
+    finished = threading.Event()
+
+    def search(query):
+        if query == "slow":
+            started.set()
+            release.wait(5)
+            superseded.append(worker.superseded())
+        finished.set()
+        return [query]
+
+    superseded = []
+    worker = hymn_library.SearchWorker(search, lambda *result: delivered.append(result), delay=0)
+    try:
+        worker.submit("slow")
+        assert started.wait(5)
+        finished.clear()
+        newer = worker.submit("fast", delay=0.05)
+        release.set()
+        assert finished.wait(5)
+        assert wait_for(lambda: delivered)
+        time.sleep(0.05)
+    finally:
+        worker.stop()
+    assert superseded == [True]
+    assert delivered == [(newer, "fast", ["fast"])]
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def model_class(hymn_library):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    QtCore = pytest.importorskip("PySide6.QtCore")
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    import hymn_list_model
+    yield hymn_list_model.HymnListModel
+    del app
+
+
+def rows(hymn_library, count):
+    hymns = [hymn_library.make_hymn(f"/hymns/{number:04d} - Hymn {number}.pptx") for number in range(count)]
+    return [(hymn, hymn.title) for hymn in hymns]
+
+
+def labels(model):
+    return [model.data(model.index(row)) for row in range(model.rowCount())]
+
+
+def test_fetch_more_hands_rows_over_a_batch_at_a_time(hymn_library, model_class):
+    model = model_class()
+    inserted = []
+    model.rowsInserted.connect(lambda parent, first, last: inserted.append((first, last)))
+    model.set_rows(rows(hymn_library, 600))
+
+    assert model.rowCount() == model.BATCH == 256
+    assert model.canFetchMore()
+    model.fetchMore()
+    assert model.rowCount() == 512
+    model.fetchMore()
+    assert model.rowCount() == 600
+    assert not model.canFetchMore()
+    model.fetchMore()
+    assert inserted == [(256, 511), (512, 599)]
+    assert model.data(model.index(599), model.PathRole) == "/hymns/0599 - Hymn 599.pptx"
+    assert model.data(model.index(600)) is None
+
+
+def test_empty_results_show_the_placeholder_row(hymn_library, model_class):
+    model = model_class()
+    model.set_rows([], empty_text="No hymns found")
+
+    assert model.rowCount() == 1
+    assert labels(model) == ["No hymns found"]
+    assert model.data(model.index(0), model.PathRole) is None
+    assert not model.canFetchMore()
+
+
+def test_remove_paths_updates_loaded_and_unfetched_rows(hymn_library, model_class):
+    model = model_class()
+    model.set_rows(rows(hymn_library, 300), empty_text="No hymns found")
+    removed = []
+    model.rowsRemoved.connect(lambda parent, first, last: removed.append((first, last)))
+
+    # Row 5 is on screen, row 290 has not been fetched yet
+    model.remove_paths({"/hymns/0005 - Hymn 5.pptx", "/hymns/0290 - Hymn 290.pptx"})
+
+    assert removed == [(5, 5)]
+    assert model.rowCount() == 255
+    model.fetchMore()
+    assert model.rowCount() == 298
+    assert "0005 - Hymn 5" not in labels(model) and "0290 - Hymn 290" not in labels(model)
+
+    model.remove_paths({hymn.path for hymn, _ in rows(hymn_library, 300)})
+    assert labels(model) == ["No hymns found"]
+
+
+def test_insert_row_announces_only_rows_the_view_has_reached(hymn_library, model_class):
+    model = model_class()
+    model.set_rows(rows(hymn_library, 300))
+    extra = hymn_library.make_hymn("/hymns/9999 - New Hymn.pptx")
+
+    model.insert_row(1, extra, extra.title)
+    assert model.rowCount() == 257
+    assert labels(model)[1] == "9999 - New Hymn"
+
+    model.insert_row(290, extra, extra.title)
+    assert model.rowCount() == 257
+    model.fetchMore()
+    assert model.rowCount() == 302
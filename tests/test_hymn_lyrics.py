@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+
+def make_deck(path, slides):
+    pptx = pytest.importorskip("pptx")
+    from pptx.util import Inches
+
+    presentation = pptx.Presentation()
+    for text in slides:
+        slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+        slide.shapes.add_textbox(Inches(1), Inches(1), Inches(8), Inches(4)).text_frame.text = text
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    presentation.save(path)
+    return str(path)
+
+
+@pytest.fixture
+def decks(hymn_library, tmp_path):
+    root = tmp_path / "library"
+    make_deck(root / "108 - Amazing Grace.pptx", ["Amazing grace how sweet the sound", "That saved a wretch like me"])
+    make_deck(root / "200 - Scattered Words.pptx", ["Grace will lead me home", "Amazing love, how can it be"])
+    make_deck(root / "300 - Sweet Hour.pptx", ["Sweet hour of prayer", "That calls me from a world of care"])
+    (root / "400 - Old Format.ppt").write_bytes(b"not a zip")
+    return hymn_library.HymnLibrary(str(root)).build()
+
+
+@pytest.fixture
+def lyrics(hymn_library, tmp_path, decks):
+    index = hymn_library.LyricIndex(str(tmp_path / "cache" / "lyrics.sqlite3"), workers=1)
+    assert index.update(decks.hymns) == 3
+    return index
+
+
+def names(results):
+    return [os.path.basename(path) for path, _, _ in results]
+
+
+def test_phrase_matches_rank_above_scattered_words(lyrics):
+    results = lyrics.search("amazing grace")
+
+    assert names(results) == ["108 - Amazing Grace.pptx", "200 - Scattered Words.pptx"]
+    assert results[0][2] > results[1][2]
+    assert results[0][1].startswith("[Amazing grace] how sweet")
+
+
+def test_last_word_matches_as_a_prefix(lyrics):
+    assert set(names(lyrics.search("swe"))) == {"300 - Sweet Hour.pptx", "108 - Amazing Grace.pptx"}
+    assert names(lyrics.search("wretch li")) == ["108 - Amazing Grace.pptx"]
+    assert lyrics.search("wretchedness") == []
+    assert lyrics.search("  ") == []
+    assert lyrics.search('"unbalanced') == []
+
+
+def test_update_only_reextracts_changed_and_forgets_deleted_files(hymn_library, lyrics, decks):
+    assert lyrics.update(decks.hymns) == 0
+
+    root = decks.root
+    make_deck(os.path.join(root, "300 - Sweet Hour.pptx"), ["Blessed hour of prayer"])
+    os.remove(os.path.join(root, "200 - Scattered Words.pptx"))
+    decks.apply_changes([root])
+    assert lyrics.update(decks.hymns) == 1
+
+    assert lyrics.search("world of care") == []
+    assert names(lyrics.search("blessed hour")) == ["300 - Sweet Hour.pptx"]
+    assert names(lyrics.search("lead me home")) == []
@@ -0,0 +1,25 @@
+import sqlite3
+
+
+def test_register_creates_the_students_table(sam, tmp_path):
+    db_path = tmp_path / "data" / "attendance.db"
+    generator = sam.IDCardGenerator(str(db_path), str(tmp_path / "idcards"))
+    students = [{'name': "Dela Cruz, Juan", 'section': "7-A", 'lrn': "123456789012"}, {'name': "Santos, Ana"}]
+
+    generator.register([dict(student, payload=sam.student_payload(student)) for student in students])
+
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = dict(conn.execute("SELECT payload, name FROM students").fetchall())
+    finally:
+        conn.close()
+    assert rows == {sam.student_payload(student): student['name'] for student in students}
+
+
+def test_generate_on_a_fresh_database(sam, tmp_path):
+    generator = sam.IDCardGenerator(str(tmp_path / "attendance.db"), str(tmp_path / "idcards"), dpi=60, workers=1)
+
+    result = generator.generate([{'name': f"Student {i}"} for i in range(3)], formats=("png",))
+
+    assert result['success'] and result['students'] == 3
+    assert len(result['pages']) == 1
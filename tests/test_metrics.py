@@ -0,0 +1,42 @@
+import json
+from datetime import datetime, timedelta
+
+
+def snapshot_line(moment):
+    return json.dumps({'timestamp': moment.isoformat(timespec='seconds'), 'counters': {}}) + "\n"
+
+
+def test_dump_drops_snapshots_older_than_keep_days(sam, tmp_path):
+    path = tmp_path / "data" / "metrics.jsonl"
+    path.parent.mkdir()
+    now = datetime.now()
+    path.write_text(snapshot_line(now - timedelta(days=40)) + "not json\n"
+                    + snapshot_line(now - timedelta(days=5)))
+
+    sam.MetricsRegistry().dump(str(path), keep_days=30)
+
+    lines = path.read_text().splitlines()
+    assert [json.loads(line)['timestamp'][:10] for line in lines] == [
+        (now - timedelta(days=5)).date().isoformat(), now.date().isoformat()]
+
+
+def test_dump_leaves_the_file_alone_within_a_day_of_the_cutoff(sam, tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    kept = snapshot_line(datetime.now() - timedelta(days=30, hours=6))
+    path.write_text(kept)
+
+    sam.MetricsRegistry().dump(str(path), keep_days=30)
+
+    assert path.read_text().splitlines()[0] == kept.strip()
+
+
+def test_auto_save_interval_setting_becomes_metrics_interval(sam, tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text(json.dumps({"auto_save_interval": 120}))
+
+    store = sam.SettingsStore(str(path), sam.DEFAULT_SETTINGS)
+    store.load()
+
+    assert store.values["metrics_interval"] == 120
+    saved = json.loads(path.read_text())
+    assert "auto_save_interval" not in saved and saved["metrics_interval"] == 120
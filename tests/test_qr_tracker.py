@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+
+def qr_image(text, size=120):
+    qrcode = pytest.importorskip("qrcode")
+    cv2 = pytest.importorskip("cv2")
+    image = np.array(qrcode.make(text, border=1).convert("L"))
+    return cv2.resize(image, (size, size), interpolation=cv2.INTER_NEAREST)
+
+
+def frame_with(code, x=200, y=150):
+    frame = np.full((480, 640), 200, np.uint8)
+    if code is not None:
+        frame[y:y + code.shape[0], x:x + code.shape[1]] = code
+    return frame
+
+
+def test_confirmed_track_skips_decoding(sam):
+    code = qr_image("STUDENT-A")
+    tracker = sam.QRTracker()
+    frame = frame_with(code)
+    tracker.observe(frame, "A", (200, 150, 120, 120))
+
+    assert tracker.update(frame_with(code, x=206)) == [("A", (206, 150, 120, 120))]
+    assert not tracker.needs_full_decode()
+    assert tracker.confirmed()
+
+    tracker.update(frame_with(None))
+    assert not tracker.confirmed()
+
+
+def test_different_code_in_the_same_spot_replaces_the_track(sam):
+    tracker = sam.QRTracker()
+    tracker.observe(frame_with(qr_image("STUDENT-A")), "A", (200, 150, 120, 120))
+
+    # Student B holds their ID where A's was; the finder patterns still match A's template
+    swapped = frame_with(qr_image("STUDENT-B"))
+    visible = tracker.update(swapped)
+    assert [qr_data for qr_data, _ in visible] == ["A"]
+
+    tracker.observe(swapped, "B", (200, 150, 120, 120))
+    tracker.verify([("B", (200, 150, 120, 120))])
+    assert list(tracker.tracks) == ["B"]
+
+
+def test_track_unseen_by_full_decodes_is_dropped(sam):
+    code = qr_image("STUDENT-A")
+    tracker = sam.QRTracker()
+    tracker.observe(frame_with(code), "A", (200, 150, 120, 120))
+
+    tracker.verify([])
+    assert "A" in tracker.tracks
+    tracker.verify([("A", (200, 150, 120, 120))])
+    tracker.verify([])
+    assert "A" in tracker.tracks
+    tracker.verify([])
+    assert "A" not in tracker.tracks
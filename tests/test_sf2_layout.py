@@ -0,0 +1,79 @@
+import pytest
+
+
+DATES = ["10/01/26", "10/02/26", "10/05/26"]
+MALE = ["Abad, Carlo", "Bautista, Jose", "Cruz, Mark"]
+FEMALE = ["Dizon, Ana", "Estrada, Bea", "Flores, Clara"]
+
+
+def write_sheet(path, rows):
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row, values in rows.items():
+        for column, value in enumerate(values, start=2):
+            if value is not None:
+                ws.cell(row=row, column=column, value=value)
+    wb.save(path)
+    return str(path)
+
+
+def totals(label):
+    return [label, None] + [f"=COUNTIF(D14:D30,\"x\")"] * len(DATES)
+
+
+def test_detect_stops_at_the_combined_total(sam, tmp_path):
+    rows = {11: ["LEARNER'S NAME", None] + DATES}
+    rows.update({14 + i: [name] for i, name in enumerate(MALE)})
+    rows[19] = totals("<=== MALE | TOTAL Per Day ===>")
+    rows.update({20 + i: [name] for i, name in enumerate(FEMALE)})
+    rows[25] = totals("<=== FEMALE | TOTAL Per Day ===>")
+    rows[26] = totals("Combined TOTAL PER DAY")
+    rows[28] = ["GUIDELINES:"]
+    rows[29] = ["1. The attendance shall be accomplished daily."]
+    rows[31] = ["Prepared by:"]
+    rows[32] = ["Maria Santos"]
+    path = write_sheet(tmp_path / "sf2.xlsx", rows)
+
+    layout = sam.SF2Layout.detect(path, "%m/%d/%y")
+
+    assert [name for _, name in layout.name_rows] == MALE + FEMALE
+    assert layout.name_blocks() == [(14, 16), (20, 22)]
+
+
+def test_detect_stops_at_the_first_gap_after_both_blocks(sam, tmp_path):
+    # No totals rows: the blocks are separated by blank rows, as in a bare template
+    rows = {11: [None, None] + DATES}
+    rows.update({14 + i: [name] for i, name in enumerate(MALE)})
+    rows.update({19 + i: [name] for i, name in enumerate(FEMALE)})
+    rows[24] = ["Prepared by:"]
+    rows[25] = ["Maria Santos"]
+    path = write_sheet(tmp_path / "sf2.xlsx", rows)
+
+    layout = sam.SF2Layout.detect(path, "%m/%d/%y")
+
+    assert [name for _, name in layout.name_rows] == MALE + FEMALE
+
+
+def test_late_arrivals_reports_an_unreadable_layout(sam, settings, tmp_path):
+    path = write_sheet(tmp_path / "sf2.xlsx", {1: ["No dates here"]})
+    updater = sam.SF2Updater(path, settings, sam.SF2LayoutCache())
+
+    result = updater.update_late_arrivals(source=None)
+
+    assert not result['success']
+    assert "No date header row" in result['message']
+
+
+def test_detect_keeps_learners_whose_names_contain_total(sam, tmp_path):
+    female = ["Dizon, Ana", "Totalan, Maria", "Santotal, Bea"]
+    rows = {11: ["LEARNER'S NAME", None] + DATES}
+    rows.update({14 + i: [name] for i, name in enumerate(MALE)})
+    rows[17] = ["TOTAL"]
+    rows.update({19 + i: [name] for i, name in enumerate(female)})
+    rows[22] = totals("Daily Total")
+    path = write_sheet(tmp_path / "sf2.xlsx", rows)
+
+    layout = sam.SF2Layout.detect(path, "%m/%d/%y")
+
+    assert [name for _, name in layout.name_rows] == MALE + female
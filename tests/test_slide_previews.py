@@ -0,0 +1,66 @@
+import os
+import sqlite3
+
+import pytest
+
+
+def make_deck(path, text):
+    pptx = pytest.importorskip("pptx")
+    pytest.importorskip("PIL")
+    from pptx.util import Inches
+
+    presentation = pptx.Presentation()
+    slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+    slide.shapes.add_textbox(Inches(1), Inches(1), Inches(8), Inches(4)).text_frame.text = text
+    presentation.save(path)
+    return str(path)
+
+
+def stored(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {os.path.basename(path) for path, in conn.execute("SELECT path FROM previews")}
+    finally:
+        conn.close()
+
+
+def test_least_recently_shown_previews_are_evicted(hymn_library, tmp_path):
+    decks = {name: make_deck(tmp_path / f"{name}.pptx", f"{name} first verse") for name in "ABC"}
+    db_path = str(tmp_path / "cache" / "previews.sqlite3")
+    cache = hymn_library.SlidePreviewCache(db_path, max_entries=2)
+
+    first = cache.get(decks["A"])
+    cache.get(decks["B"])
+    assert cache.get(decks["A"]) == first  # a disk hit refreshes A
+    cache.get(decks["C"])
+
+    assert cache.rendered == 3
+    assert stored(db_path) == {"A.pptx", "C.pptx"}
+    assert first.text.startswith("A first verse") and first.image and first.error is None
+
+
+def test_previews_survive_a_restart_until_the_deck_changes(hymn_library, tmp_path):
+    deck = make_deck(tmp_path / "hymn.pptx", "Old words")
+    db_path = str(tmp_path / "previews.sqlite3")
+    hymn_library.SlidePreviewCache(db_path).get(deck)
+
+    restarted = hymn_library.SlidePreviewCache(db_path)
+    assert restarted.peek(deck) is None  # memory starts empty
+    assert restarted.get(deck).text.startswith("Old words")
+    assert restarted.rendered == 0
+    assert restarted.peek(deck).text.startswith("Old words")
+
+    make_deck(deck, "New words")
+    restarted.forget([deck])
+    assert restarted.peek(deck) is None
+    assert restarted.get(deck).text.startswith("New words")
+    assert restarted.rendered == 1
+
+
+def test_unreadable_decks_report_an_error(hymn_library, tmp_path):
+    broken = tmp_path / "broken.pptx"
+    broken.write_bytes(b"not a presentation")
+    cache = hymn_library.SlidePreviewCache(str(tmp_path / "previews.sqlite3"))
+
+    assert cache.get(str(broken)).error
+    assert cache.get(str(tmp_path / "missing.pptx")).error.startswith("FileNotFoundError")
@@ -0,0 +1,136 @@
+import json
+import sqlite3
+import urllib.error
+import urllib.request
+
+import pytest
+
+
+STATION_SCHEMA = """
+    CREATE TABLE attendance (date TEXT, time TEXT, name TEXT, UNIQUE(date, name));
+    CREATE TABLE changelog (seq INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, time TEXT, name TEXT);
+    CREATE TABLE sync_state (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def make_station(path, rows=(), logged=True):
+    """A station database as QRScannerAPI.init_db creates it; logged rows also go to the change log"""
+    conn = sqlite3.connect(path)
+    conn.executescript(STATION_SCHEMA)
+    for row in rows:
+        conn.execute("INSERT INTO attendance (date, time, name) VALUES (?, ?, ?)", row)
+        if logged:
+            conn.execute("INSERT INTO changelog (date, time, name) VALUES (?, ?, ?)", row)
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def merged(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {(date, name): (time, station) for date, time, name, station in
+                conn.execute("SELECT date, time, name, station FROM attendance")}
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def aggregator(sam, settings, tmp_path):
+    # A 12-hour clock, where comparing the strings would keep "01:05:00 PM" over "09:00:00 AM"
+    settings.update({"time_format": "%I:%M:%S %p", "sync_token": "s3cret"})
+    node = sam.SyncAggregator(str(tmp_path / "aggregate.db"), settings, port=0, token="s3cret")
+    node.start()
+    yield node
+    node.stop()
+
+
+def client(sam, node, db_path, station, token="s3cret"):
+    return sam.SyncClient(db_path, station, f"http://127.0.0.1:{node.port}", token=token)
+
+
+def test_two_stations_merge_keeping_the_earliest_time(sam, aggregator, tmp_path):
+    gate = make_station(tmp_path / "gate.db", [("05/06/24", "09:00:00 AM", "Ana"),
+                                               ("05/06/24", "07:40:00 AM", "Ben")])
+    annex = make_station(tmp_path / "annex.db", [("05/06/24", "01:05:00 PM", "Ana"),
+                                                 ("05/06/24", "07:55:00 AM", "Cy")])
+
+    assert client(sam, aggregator, gate, "gate").sync_once()['pushed'] == 2
+    assert client(sam, aggregator, annex, "annex").sync_once()['pushed'] == 2
+
+    rows = merged(aggregator.db_path)
+    assert rows[("05/06/24", "Ana")] == ("09:00:00 AM", "gate")
+    assert set(rows) == {("05/06/24", "Ana"), ("05/06/24", "Ben"), ("05/06/24", "Cy")}
+    stats = aggregator.get_stats("05/06/24")
+    assert [row['Name'] for row in stats['data']] == ["Ben", "Cy", "Ana"]
+    assert stats['per_station'] == {"gate": 2, "annex": 1}
+
+
+def test_rows_recorded_before_sync_are_backfilled(sam, aggregator, tmp_path):
+    station = make_station(tmp_path / "old.db", [("05/03/24", "07:30:00 AM", "Dee"),
+                                                 ("05/06/24", "07:31:00 AM", "Dee")], logged=False)
+    sync = client(sam, aggregator, station, "old")
+    assert sync.sync_once()['pushed'] == 2
+    assert sync.sync_once()['pushed'] == 0
+    assert set(merged(aggregator.db_path)) == {("05/03/24", "Dee"), ("05/06/24", "Dee")}
+
+
+def test_recreated_station_database_is_not_ignored(sam, aggregator, tmp_path):
+    first = make_station(tmp_path / "first.db", [("05/06/24", f"07:{m:02d}:00 AM", f"S{m}") for m in range(5)])
+    assert client(sam, aggregator, first, "gate").sync_once()['success']
+
+    # Same station id, fresh database: its change log starts again at seq 1
+    second = make_station(tmp_path / "second.db", [("05/07/24", "07:10:00 AM", "Eve")])
+    assert client(sam, aggregator, second, "gate").sync_once()['pushed'] == 1
+    assert ("05/07/24", "Eve") in merged(aggregator.db_path)
+
+
+def test_requests_need_the_token(sam, aggregator, tmp_path):
+    station = make_station(tmp_path / "gate.db", [("05/06/24", "07:00:00 AM", "Fay")])
+    result = client(sam, aggregator, station, "gate", token="wrong").sync_once()
+    assert not result['success'] and "401" in result['message']
+    assert merged(aggregator.db_path) == {}
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(f"http://127.0.0.1:{aggregator.port}/stats", timeout=5)
+    assert error.value.code == 401
+    with urllib.request.urlopen(f"http://127.0.0.1:{aggregator.port}/health", timeout=5) as response:
+        assert json.loads(response.read())['success']
+
+
+def test_headless_aggregator_refuses_open_host_without_token(sam, tmp_path):
+    args = ["aggregator", "--host", "0.0.0.0", "--port", "0", "--db", str(tmp_path / "aggregate.db"),
+            "--settings", str(tmp_path / "settings.json"), "--sf2", str(tmp_path / "SF2 Automated.xlsx")]
+    assert sam.run_cli(args) == 2
+
+
+def test_aggregator_without_window_updates_sf2(sam, settings, tmp_path):
+    from openpyxl import Workbook, load_workbook
+
+    sf2_file = str(tmp_path / "SF2 Automated.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.cell(row=1, column=1, value="LEARNER'S NAME")
+    for column, day in enumerate(["05/06/24", "05/07/24"], start=2):
+        ws.cell(row=1, column=column, value=day)
+    ws.cell(row=2, column=1, value="Ana")
+    ws.cell(row=3, column=1, value="Ben")
+    wb.save(sf2_file)
+
+    sf2 = sam.SF2Updater(sf2_file, settings, sam.SF2LayoutCache(), late_image=str(tmp_path / "late.png"))
+    node = sam.SyncAggregator(str(tmp_path / "aggregate.db"), settings, port=0, sf2=sf2)
+    node.start()
+    try:
+        station = make_station(tmp_path / "gate.db", [("05/06/24", "07:00:00", "Ana"), ("05/07/24", "09:00:00", "Ben")])
+        assert client(sam, node, station, "gate", token="").sync_once()['success']
+        request = urllib.request.Request(f"http://127.0.0.1:{node.port}/sf2", data=b"{}", method="POST")
+        with urllib.request.urlopen(request, timeout=30) as response:
+            result = json.loads(response.read())
+    finally:
+        node.stop()
+
+    assert result['success'], result
+    ws = load_workbook(sf2_file).active
+    assert [ws.cell(row=2, column=c).value for c in (2, 3)] == [0, "x"]
+    # Ben arrived after the 08:15 cutoff: the late pass clears the cell for its marker
+    assert [ws.cell(row=3, column=c).value for c in (2, 3)] == ["x", None]